@@ -0,0 +1,111 @@
+"""
+Production start-up of a WSGI worker.
+
+Django builds most of what a request needs on the first request of every
+process: the middleware chain, the compiled URL patterns, the templates,
+the cache, session and message backends and the database connections.
+``warm_up()`` builds all but the connections right away, when
+``PBEshop.wsgi`` is imported with ``PRODUCTION`` on, so that none of it
+lands on a customer. Nothing it
+leaves behind is bound to the process, so gunicorn may import the
+application once in the master and fork the workers from it
+(``preload_app``, see deploy_tools/gunicorn.conf.py).
+
+``connect()`` opens the connections of every database, in the worker
+itself: a connection inherited across a fork would be shared by every
+worker. Without ``preload_app`` the import already happens in the worker
+and ``PBEshop.wsgi`` connects at once.
+
+Both log how long they took to ``PBEshop.bootstrap``.
+"""
+import logging
+import os
+import time
+
+from importlib import import_module
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.urlresolvers import resolve, reverse
+from django.db import connections
+from django.template import engines
+from django.template.loader import get_template
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Resolved and reversed once, which compiles every pattern of the URLconf.
+WARM_URLS = (
+    ('shop:product_list', ()),
+    ('shop:product_list_by_category', ('warm-up',)),
+    ('shop:product_detail', (1, 'warm-up')),
+)
+
+WARM_TEMPLATES = (
+    'shop/product/list.html',
+    'shop/product/detail.html',
+    'cart/detail.html',
+)
+
+
+def warm_up(application):
+    """
+    Loads the middleware of ``application``, a ``WSGIHandler``, the URLconf
+    and the templates of the busiest pages, and returns the milliseconds
+    each took.
+    """
+    timings = []
+    started = time.time()
+    if application._request_middleware is None:
+        application.load_middleware()
+    timings.append(('middleware', time.time() - started))
+
+    started = time.time()
+    for name, args in WARM_URLS:
+        resolve(reverse(name, args=args))
+    timings.append(('urls', time.time() - started))
+
+    started = time.time()
+    for name in WARM_TEMPLATES:
+        get_template(name)
+    for engine in engines.all():
+        getattr(engine, 'engine', engine).template_context_processors
+    timings.append(('templates', time.time() - started))
+
+    started = time.time()
+    # Backends create no connection before their first use.
+    for alias in settings.CACHES:
+        caches[alias]
+    import_module(settings.SESSION_ENGINE)
+    import_string(settings.SESSION_SERIALIZER)
+    import_string(settings.MESSAGE_STORAGE)
+    for alias in connections:
+        connections[alias].ops.compiler('SQLCompiler')
+    timings.append(('backends', time.time() - started))
+
+    timings = [(name, seconds * 1000) for name, seconds in timings]
+    logger.info('Warmed up process %d in %.1fms (%s).', os.getpid(),
+                sum(ms for _, ms in timings),
+                ', '.join('%s %.1fms' % timing for timing in timings))
+    return timings
+
+
+def connect():
+    """
+    Opens a connection to every database and returns the milliseconds it
+    took.
+    """
+    started = time.time()
+    for alias in connections:
+        connections[alias].ensure_connection()
+    ms = (time.time() - started) * 1000
+    logger.info('Connected process %d to %s in %.1fms.', os.getpid(),
+                ', '.join(connections), ms)
+    return ms
+
+
+def disconnect():
+    """
+    Closes this thread's connections, to call before forking.
+    """
+    connections.close_all()
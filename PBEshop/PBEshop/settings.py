@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/1.9/ref/settings/
 
 import os
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -24,6 +26,12 @@ SECRET_KEY = 'p3_j_+bv!*vap08)#+3r=b1@a^w5i#4yy2qg_g^m3vw0-_x!__'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Production bootstrap, on whenever DEBUG is off: leaves out the development
+# and CI apps, caches compiled templates and keeps SQLite connections open,
+# and PBEshop.wsgi warms every worker up before it serves, see
+# PBEshop.bootstrap. PBESHOP_PRODUCTION=1 or 0 overrides it.
+PRODUCTION = os.environ.get('PBESHOP_PRODUCTION', '0' if DEBUG else '1') == '1'
+
 ALLOWED_HOSTS = []
 
 
@@ -38,10 +46,23 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'django_jenkins',
     'shop',
+    'cart',
+    'orders',
+]
+
+# Only needed to develop and test the shop.
+DEVELOPMENT_APPS = [
+    'django_jenkins',
 ]
 
+if PRODUCTION:
+    INSTALLED_APPS = [app for app in INSTALLED_APPS
+                      if app not in DEVELOPMENT_APPS]
+
 PROJECT_APPS = [
     'shop',
+    'cart',
+    'orders',
 ]
 
 JENKINS_TASKS = (
@@ -50,7 +71,13 @@ JENKINS_TASKS = (
     'django_jenkins.tasks.run_csslint',
 )
 
+# Sessions live in the cache and are written to the database behind the
+# requests, see shop.sessions
+SESSION_ENGINE = 'shop.sessions'
+
 MIDDLEWARE_CLASSES = [
+    'shop.metrics.QueryMetricsMiddleware',
+    'shop.routers.PrimaryPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -74,23 +101,128 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cart.context_processors.cart',
             ],
         },
     },
 ]
 
+if PRODUCTION:
+    # Templates are compiled once per process instead of once per render.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'PBEshop.wsgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+# PBESHOP_DATABASE picks the profile:
+#   sqlite      db.sqlite3, tuned by SHOP_SQLITE_PRAGMAS below (default)
+#   postgresql  PostgreSQL with persistent connections, configured by the
+#               PBESHOP_DB_* variables, needs psycopg2 installed.
+#               PBESHOP_DB_POOL=pgbouncer connects through the local
+#               pgbouncer of deploy_tools/pgbouncer.ini instead of straight
+#               to the server.
+DATABASE_PROFILE = os.environ.get('PBESHOP_DATABASE', 'sqlite')
+
+if DATABASE_PROFILE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PBESHOP_DB_NAME', 'pbeshop'),
+            'USER': os.environ.get('PBESHOP_DB_USER', 'pbeshop'),
+            'PASSWORD': os.environ.get('PBESHOP_DB_PASSWORD', ''),
+            'HOST': os.environ.get('PBESHOP_DB_HOST', 'localhost'),
+            'PORT': os.environ.get('PBESHOP_DB_PORT', '5432'),
+            # Seconds a worker keeps its connection between requests
+            'CONN_MAX_AGE': int(os.environ.get('PBESHOP_DB_CONN_MAX_AGE',
+                                               '600')),
+        }
     }
-}
+    if os.environ.get('PBESHOP_DB_POOL') == 'pgbouncer':
+        # pgbouncer holds the server connections, the workers' own ones
+        # are cheap. Transaction pooling is safe, Django 1.9 neither uses
+        # server side cursors nor prepared statements, once the server
+        # time zone is pinned to UTC as deploy_tools/pgbouncer.ini says.
+        DATABASES['default'].update({
+            'HOST': os.environ.get('PBESHOP_DB_POOL_HOST', '127.0.0.1'),
+            'PORT': os.environ.get('PBESHOP_DB_POOL_PORT', '6432'),
+        })
+elif DATABASE_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        }
+    }
+    if PRODUCTION:
+        # Opening is cheap but applies SHOP_SQLITE_PRAGMAS every time.
+        DATABASES['default']['CONN_MAX_AGE'] = None
+else:
+    raise ImproperlyConfigured(
+        'Unknown PBESHOP_DATABASE %r.' % DATABASE_PROFILE)
+
+# Read replicas catalogue reads are spread over, see shop.routers.
+# PBESHOP_DB_REPLICAS lists their hosts (postgresql) or database files
+# (sqlite), comma separated.
+SHOP_DATABASE_REPLICAS = []
+for number, replica in enumerate(
+        [r for r in os.environ.get('PBESHOP_DB_REPLICAS', '').split(',') if r],
+        1):
+    alias = 'replica%d' % number
+    DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    if DATABASE_PROFILE == 'postgresql':
+        DATABASES[alias].update(HOST=replica,
+                                PORT=os.environ.get('PBESHOP_DB_PORT', '5432'))
+    else:
+        DATABASES[alias]['NAME'] = replica
+    SHOP_DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['shop.routers.CatalogueRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.9/topics/cache/
+
+# Holds the sessions and, unless it is locmem, the catalogue pages of
+# SHOP_CACHE, which every worker process must share. PBESHOP_CACHE picks
+# the profile:
+#   locmem     this process only, for runserver (default with PRODUCTION off)
+#   file       files in PBESHOP_CACHE_LOCATION, shared by the workers of one
+#              host (default in production)
+#   memcached  the memcached servers listed in PBESHOP_CACHE_LOCATION,
+#              comma separated, needs python-memcached installed.
+CACHE_PROFILE = os.environ.get('PBESHOP_CACHE',
+                               'file' if PRODUCTION else 'locmem')
+
+if CACHE_PROFILE == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('PBESHOP_CACHE_LOCATION',
+                                       os.path.join(BASE_DIR, 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+elif CACHE_PROFILE == 'memcached':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': os.environ.get('PBESHOP_CACHE_LOCATION',
+                                       '127.0.0.1:11211').split(','),
+        }
+    }
+elif CACHE_PROFILE != 'locmem':
+    raise ImproperlyConfigured('Unknown PBESHOP_CACHE %r.' % CACHE_PROFILE)
+
+SESSION_CACHE_ALIAS = 'default'
 
 
 # Password validation
@@ -130,3 +262,158 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.9/howto/static-files/
 
 STATIC_URL = '/static/'
+STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Hashed names and precompressed variants, see shop.storage.
+STATICFILES_STORAGE = 'shop.storage.CompressedManifestStaticFilesStorage'
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+
+
+# Logging
+# https://docs.djangoproject.com/en/1.9/topics/logging/
+
+# Start-up timings of every worker go to its stderr, the gunicorn log.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'PBEshop.bootstrap': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
+# Shop
+
+# Listings are paged by a (name, id) cursor, see shop.pagination
+SHOP_PRODUCTS_PER_PAGE = 24
+
+# Admin changelists of tables with more rows show an estimated count, see
+# shop.pagination.EstimatedCountPaginator
+SHOP_ADMIN_ESTIMATED_COUNT_ABOVE = 100000
+
+# Rendered catalogue pages are cached per catalogue version, see shop.cache.
+# The LRU backend only lives in one process and only sees the changes made
+# by it, so every other cache profile keeps them in the shared cache.
+if CACHE_PROFILE == 'locmem':
+    SHOP_CACHE = {
+        'BACKEND': 'shop.cache.LRUCacheBackend',
+        'OPTIONS': {'max_entries': 1000},
+    }
+else:
+    SHOP_CACHE = {
+        'BACKEND': 'shop.cache.DjangoCacheBackend',
+        'OPTIONS': {'alias': 'default'},
+    }
+
+# Price range facets of the listings, (low, high) with low <= price < high
+# and None for no bound, see shop.facets
+SHOP_PRICE_RANGES = (
+    (None, '25'),
+    ('25', '50'),
+    ('50', '100'),
+    ('100', '250'),
+    ('250', None),
+)
+
+# Dotted path of the search backend, None picks FTS5 on SQLite and the
+# in-memory index elsewhere, see shop.search
+SHOP_SEARCH_BACKEND = None
+
+# Thumbnails of Product.image rendered in the background, see shop.thumbnails
+SHOP_THUMBNAILS = {
+    'SIZES': {
+        'small': (150, 150),
+        'medium': (300, 300),
+        'large': (600, 600),
+    },
+    'WEBP': True,
+    'QUALITY': 85,
+    'ASYNC': True,
+    'WORKERS': 2,
+}
+
+# Pre-rendered catalogue pages for the web server, see shop.bake. Pages
+# are only written by bake_catalogue and only discarded while it exists.
+SHOP_BAKE_ROOT = os.path.join(MEDIA_ROOT, 'baked')
+
+# Log a request running this many queries that only differ in their
+# parameters, see shop.metrics
+SHOP_METRICS_N_PLUS_ONE_THRESHOLD = 5
+
+# Count the SQL queries of every request, which logs each of them on the
+# connection while it runs. PBESHOP_QUERY_METRICS=1 or 0 overrides it.
+SHOP_QUERY_METRICS = os.environ.get('PBESHOP_QUERY_METRICS',
+                                    '0' if PRODUCTION else '1') == '1'
+
+# Addresses that may read /metrics without a staff login, e.g. the
+# Prometheus server. Behind a proxy every request comes from the proxy's
+# address, so only list addresses the proxy cannot forward for.
+SHOP_METRICS_ALLOWED_IPS = [
+    address for address in
+    os.environ.get('PBESHOP_METRICS_ALLOWED_IPS', '').split(',') if address
+]
+
+# Seconds a visitor reads from the primary after writing, and the largest
+# replica lag tolerated before reads fall back to the primary, checked at
+# most every SHOP_REPLICA_CHECK_INTERVAL seconds, see shop.routers
+SHOP_REPLICA_PIN_SECONDS = 5
+SHOP_REPLICA_MAX_LAG = 10
+SHOP_REPLICA_CHECK_INTERVAL = 5
+
+# Applied to every new SQLite connection, in order, see shop.db
+SHOP_SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('mmap_size', 256 * 1024 * 1024),
+    ('busy_timeout', 5000),
+)
+
+# Seconds a saved session may wait before it is written to the database,
+# together with every other session saved meanwhile, see shop.sessions
+SHOP_SESSION_WRITE_DELAY = 2
+
+# Seconds units reserved for a checkout are held before they return to
+# stock, see shop.stock
+SHOP_RESERVATION_TTL = 15 * 60
+
+# Seconds a consumer of the catalogue change log waits for a missing entry
+# id to be committed before reading past it, see shop.changelog
+SHOP_CHANGELOG_SETTLE = 10
+
+# Background jobs run by manage.py run_workers, see shop.jobs. Seconds a
+# claimed job is left to its worker, attempts before it is given up, the
+# delay before the first retry, doubling up to MAX_BACKOFF, and how often
+# and how many jobs an idle worker looks for.
+SHOP_JOBS = {
+    'VISIBILITY_TIMEOUT': 5 * 60,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF': 10,
+    'MAX_BACKOFF': 60 * 60,
+    'POLL_INTERVAL': 1,
+    'BATCH_SIZE': 10,
+}
+
+
+# Cart
+
+# Session key the cart is stored under, see cart.cart
+CART_SESSION_ID = 'cart'
+
+# Most units of one product a cart holds, however often it is added
+CART_MAX_QUANTITY = 20
+
+
+# Orders
+
+# Products ordered down to this many units are reported to ADMINS, see
+# orders.jobs
+ORDERS_STOCK_ALERT_THRESHOLD = 5
@@ -0,0 +1,120 @@
+"""
+Static files served by the WSGI application itself, for a single box with
+no web server in front of gunicorn. ``PBEshop.wsgi`` wraps the application
+in it when ``PBESHOP_SERVE_STATIC=1``.
+
+Requests under ``STATIC_URL`` are answered from ``STATIC_ROOT`` without
+reaching Django, with the ``.br`` or ``.gz`` variant collectstatic wrote
+(see ``shop.storage``) when the client accepts it. Hashed names are cached
+for a year, anything else only briefly.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+
+FOREVER = 'public, max-age=31536000, immutable'
+BRIEFLY = 'public, max-age=60'
+
+# Names ManifestStaticFilesStorage gives, base.5af66c1b1797.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+CHUNK_SIZE = 64 * 1024
+
+
+def accepted_encodings(header):
+    """
+    Returns the content codings ``header``, an Accept-Encoding value, allows.
+    """
+    accepted = set()
+    for coding in header.split(','):
+        coding, _, parameters = coding.strip().partition(';')
+        quality = re.search(r'q=([0-9.]+)', parameters)
+        if quality is not None and float(quality.group(1)) == 0:
+            continue
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFilesApplication(object):
+
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = os.path.abspath(root or settings.STATIC_ROOT)
+        self.prefix = prefix or settings.STATIC_URL
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if (environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or
+                not path.startswith(self.prefix)):
+            return self.application(environ, start_response)
+        filename = self.find(path[len(self.prefix):])
+        if filename is None:
+            return self.application(environ, start_response)
+        return self.serve(environ, start_response, filename)
+
+    def find(self, name):
+        parts = [part for part in name.split('/') if part]
+        if not parts or any(part in ('.', '..') or '\0' in part
+                            for part in parts):
+            return None
+        filename = os.path.join(self.root, *parts)
+        return filename if os.path.isfile(filename) else None
+
+    def serve(self, environ, start_response, filename):
+        content_type, encoding = mimetypes.guess_type(filename)
+        if encoding is not None:
+            # Asked for the .gz itself, it is sent as it is.
+            content_type = 'application/octet-stream'
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in (
+                'application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+
+        hashed = HASHED_NAME.search(os.path.basename(filename))
+        headers = [
+            ('Vary', 'Accept-Encoding'),
+            ('Cache-Control', FOREVER if hashed else BRIEFLY),
+        ]
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(filename + suffix):
+                filename += suffix
+                headers.append(('Content-Encoding', coding))
+                break
+        stat = os.stat(filename)
+        etag = '"%x-%x"' % (int(stat.st_mtime), stat.st_size)
+        headers.append(('ETag', etag))
+        if etag in environ.get('HTTP_IF_NONE_MATCH', ''):
+            start_response('304 Not Modified', headers)
+            return []
+        headers += [
+            ('Content-Type', content_type),
+            ('Content-Length', str(stat.st_size)),
+            ('Last-Modified', formatdate(stat.st_mtime, usegmt=True)),
+        ]
+        start_response('200 OK', headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        f = open(filename, 'rb')
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if file_wrapper is not None:
+            return file_wrapper(f, CHUNK_SIZE)
+        return _FileIterator(f)
+
+
+class _FileIterator(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def __iter__(self):
+        return iter(lambda: self.f.read(CHUNK_SIZE), b'')
+
+    def close(self):
+        self.f.close()
@@ -9,8 +9,27 @@ https://docs.djangoproject.com/en/1.9/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PBEshop.settings")
 
 application = get_wsgi_application()
+
+# Imported by the worker itself, unless gunicorn preloads it in its master
+# and every worker sets itself up after the fork, see PBEshop.bootstrap.
+in_worker = os.environ.get('PBESHOP_PRELOAD') != '1'
+
+if settings.PRODUCTION:
+    from . import bootstrap
+    bootstrap.warm_up(application)
+    if in_worker:
+        bootstrap.connect()
+
+if in_worker:
+    from shop import sessions
+    sessions.start_flusher()
+
+if os.environ.get('PBESHOP_SERVE_STATIC') == '1':
+    from .static_wsgi import StaticFilesApplication
+    application = StaticFilesApplication(application)
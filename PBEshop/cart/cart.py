@@ -0,0 +1,140 @@
+"""
+Shopping cart kept in the session.
+
+The session only holds ``{product id: [quantity, unit price]}``, the price
+as a string snapshot of ``Product.price`` when the product was first added.
+Products are loaded with one ``in_bulk()`` query the first time the cart is
+iterated, never one per line.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from shop.models import Product
+
+class Cart(object):
+
+    def __init__(self, request):
+        self.session = request.session
+        # An empty cart is not written to the session until something is
+        # added, so that merely looking at it does not start a session.
+        self.cart = self.session.get(settings.CART_SESSION_ID, {})
+        self._products = None
+
+    def save(self):
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self.session.modified = True
+        self._products = None
+
+    def add(self, product, quantity=1, update_quantity=False):
+        product_id = str(product.id)
+        line = self.cart.get(product_id)
+        if line is None:
+            line = self.cart[product_id] = [0, str(product.price)]
+        if update_quantity:
+            line[0] = quantity
+        else:
+            line[0] += quantity
+        line[0] = min(line[0], settings.CART_MAX_QUANTITY)
+        self.save()
+
+    def update(self, product_id, quantity):
+        """
+        Changes the quantity of a line already in the cart, by product id,
+        whether or not the product still exists.
+        """
+        product_id = str(product_id)
+        if product_id not in self.cart:
+            return
+        if quantity:
+            self.cart[product_id][0] = min(quantity,
+                                           settings.CART_MAX_QUANTITY)
+            self.save()
+        else:
+            self.remove(product_id)
+
+    def remove(self, product_id):
+        product_id = str(product_id)
+        if product_id in self.cart:
+            del self.cart[product_id]
+            self.save()
+
+    def clear(self):
+        self.cart = {}
+        if settings.CART_SESSION_ID in self.session:
+            del self.session[settings.CART_SESSION_ID]
+
+    def withdrawn(self):
+        """
+        Returns the ids of the products in the cart that were deleted or
+        withdrawn since they were added.
+        """
+        products = self.products()
+        return sorted(int(product_id) for product_id in self.cart
+                      if int(product_id) not in products)
+
+    def drop_withdrawn(self):
+        """
+        Drops the withdrawn products, keeping the price of every other one,
+        and returns their ids.
+        """
+        withdrawn = self.withdrawn()
+        if withdrawn:
+            products = self._products
+            for product_id in withdrawn:
+                del self.cart[str(product_id)]
+            self.save()
+            # The products left are the ones already loaded.
+            self._products = products
+        return withdrawn
+
+    def refresh(self):
+        """
+        Drops the withdrawn products and takes the current price of every
+        other one.
+        """
+        products = self.products()
+        for product_id, line in list(self.cart.items()):
+            product = products.get(int(product_id))
+            if product is None:
+                del self.cart[product_id]
+            else:
+                line[1] = str(product.price)
+        self.save()
+
+    def products(self):
+        """
+        Returns the available products in the cart by id, loaded with one
+        query.
+        """
+        if self._products is None:
+            self._products = Product.objects.filter(available=True) \
+                                            .in_bulk([int(product_id)
+                                                      for product_id
+                                                      in self.cart])
+        return self._products
+
+    def __iter__(self):
+        products = self.products()
+        for product_id, (quantity, price) in sorted(self.cart.items()):
+            product = products.get(int(product_id))
+            if product is None:
+                # Deleted or withdrawn since it was added.
+                continue
+            price = Decimal(price)
+            yield {
+                'product': product,
+                'quantity': quantity,
+                'price': price,
+                'total_price': price * quantity,
+                'price_changed': price != product.price,
+            }
+
+    def __len__(self):
+        """
+        Number of units in the cart, counted without touching the database.
+        """
+        return sum(quantity for quantity, _ in self.cart.values())
+
+    def get_total_price(self):
+        return sum((item['total_price'] for item in self), Decimal(0))
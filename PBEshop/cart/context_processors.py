@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cart import Cart
+
+def cart(request):
+    """
+    Exposes ``cart_item_count``. It never queries the database, and only
+    reads the session when a template uses it and the visitor has a session
+    cookie, so catalogue pages of visitors without one stay cacheable.
+    """
+    if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+        return {'cart_item_count': 0}
+    return {'cart_item_count': SimpleLazyObject(lambda: len(Cart(request)))}
@@ -0,0 +1,17 @@
+from django import forms
+from django.conf import settings
+
+PRODUCT_QUANTITY_CHOICES = [(i, str(i))
+                            for i in range(1, settings.CART_MAX_QUANTITY + 1)]
+
+class CartAddProductForm(forms.Form):
+    quantity = forms.TypedChoiceField(choices=PRODUCT_QUANTITY_CHOICES,
+                                      coerce=int)
+    update = forms.BooleanField(required=False,
+                                initial=False,
+                                widget=forms.HiddenInput)
+
+class CartUpdateProductForm(forms.Form):
+    # Zero takes the product out of the cart.
+    quantity = forms.IntegerField(min_value=0,
+                                  max_value=PRODUCT_QUANTITY_CHOICES[-1][0])
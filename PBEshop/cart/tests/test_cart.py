@@ -0,0 +1,145 @@
+from django.conf import settings
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from decimal import Decimal
+
+from shop.models import Category, Product
+from shop.tests.test_sessions import QueuedSessionsMixin
+from ..context_processors import cart
+
+class CartViewsTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='name', slug='slug')
+        self.first = Product.objects.create(category=category,
+                                            name='first',
+                                            slug='first',
+                                            price=Decimal('1.10'),
+                                            stock=10)
+        self.second = Product.objects.create(category=category,
+                                             name='second',
+                                             slug='second',
+                                             price=Decimal('2.25'),
+                                             stock=10)
+
+    def add(self, product, quantity, update=False):
+        data = {'quantity': quantity}
+        if update:
+            data['update'] = 'on'
+        return self.client.post(reverse('cart:cart_add', args=[product.id]),
+                                data)
+
+    def stored(self):
+        return self.client.session.get(settings.CART_SESSION_ID)
+
+    def test_stores_quantity_and_price_snapshot(self):
+        response = self.add(self.first, 2)
+        self.assertRedirects(response, reverse('cart:cart_detail'))
+        self.add(self.first, 1)
+        self.assertEqual(self.stored(), {str(self.first.id): [3, '1.10']})
+        self.add(self.first, 5, update=True)
+        self.assertEqual(self.stored(), {str(self.first.id): [5, '1.10']})
+
+    def test_quantity_is_capped(self):
+        for _ in range(3):
+            self.add(self.first, 15)
+        self.assertEqual(self.stored(),
+                         {str(self.first.id): [settings.CART_MAX_QUANTITY,
+                                               '1.10']})
+
+    def test_detail_resolves_products_with_one_query(self):
+        self.add(self.first, 2)
+        self.add(self.second, 3)
+        # Products only, the session comes from the cache.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual([item['product'] for item in response.context['items']],
+                         [self.first, self.second])
+        self.assertEqual(response.context['total_price'], Decimal('8.95'))
+        self.assertIsInstance(response.context['total_price'], Decimal)
+
+    def test_totals_use_the_price_at_add_time(self):
+        self.add(self.first, 2)
+        self.first.price = Decimal('9.99')
+        self.first.save()
+        response = self.client.get(reverse('cart:cart_detail'))
+        item, = response.context['items']
+        self.assertEqual(item['total_price'], Decimal('2.20'))
+        self.assertTrue(item['price_changed'])
+
+    def test_withdrawn_products_are_skipped(self):
+        self.add(self.first, 1)
+        self.add(self.second, 1)
+        self.second.available = False
+        self.second.save()
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['items']), 1)
+
+    def test_deleted_products_can_be_removed(self):
+        self.add(self.first, 2)
+        self.add(self.second, 3)
+        first_id, second_id = self.first.id, self.second.id
+        self.first.delete()
+        self.second.delete()
+        self.client.post(reverse('cart:cart_update', args=[second_id]),
+                         {'quantity': 1})
+        self.assertEqual(self.stored()[str(second_id)], [1, '2.25'])
+        response = self.client.post(reverse('cart:cart_remove',
+                                            args=[second_id]))
+        self.assertRedirects(response, reverse('cart:cart_detail'),
+                             fetch_redirect_response=False)
+        self.assertEqual(self.stored(), {str(first_id): [2, '1.10']})
+
+    def test_detail_drops_deleted_products(self):
+        self.add(self.first, 2)
+        self.add(self.second, 3)
+        self.second.delete()
+        response = self.client.get(reverse('cart:cart_detail'))
+        self.assertEqual(len(response.context['items']), 1)
+        self.assertEqual(str(response.context['cart_item_count']), '2')
+        self.assertEqual(self.stored(), {str(self.first.id): [2, '1.10']})
+
+    def test_update_and_remove(self):
+        self.add(self.first, 2)
+        self.add(self.second, 2)
+        self.client.post(reverse('cart:cart_update', args=[self.first.id]),
+                         {'quantity': 4})
+        self.client.post(reverse('cart:cart_update', args=[self.second.id]),
+                         {'quantity': 0})
+        self.assertEqual(self.stored(), {str(self.first.id): [4, '1.10']})
+        self.client.post(reverse('cart:cart_remove', args=[self.first.id]))
+        self.assertEqual(self.stored(), {})
+
+    def test_rejects_get_and_unavailable_products(self):
+        url = reverse('cart:cart_add', args=[self.first.id])
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.first.available = False
+        self.first.save()
+        self.assertEqual(self.add(self.first, 1).status_code, 404)
+
+    def test_item_count_in_context(self):
+        response = self.client.get(reverse('shop:product_list'))
+        self.assertEqual(response.context['cart_item_count'], 0)
+        self.assertFalse(response.wsgi_request.session.accessed)
+        self.add(self.first, 2)
+        self.add(self.second, 1)
+        request = self.client.get(reverse('cart:cart_detail')).wsgi_request
+        with self.assertNumQueries(0):
+            count = cart(request)['cart_item_count']
+            self.assertEqual(str(count), '3')
+
+    def test_visitors_with_a_cart_get_their_own_pages(self):
+        url = reverse('shop:product_list')
+        anonymous = self.client.get(url)
+        self.assertIsNotNone(anonymous.context)
+        self.assertIsNone(self.client.get(url).context)
+        etag = anonymous['ETag']
+        self.add(self.first, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(str(response.context['cart_item_count']), '2')
+        response = self.client.get(self.first.get_absolute_url())
+        self.assertFalse(response.has_header('ETag'))
+        self.assertEqual(str(response.context['cart_item_count']), '2')
@@ -0,0 +1,52 @@
+from decimal import Decimal
+
+from django.shortcuts import get_object_or_404, redirect
+from django.views.decorators.http import require_POST
+from shop.metrics import timed_render
+from shop.models import Product
+from .cart import Cart
+from .forms import CartAddProductForm, CartUpdateProductForm
+
+@require_POST
+def cart_add(request, product_id):
+    cart = Cart(request)
+    product = get_object_or_404(Product, id=product_id, available=True)
+    form = CartAddProductForm(request.POST)
+    if form.is_valid():
+        cd = form.cleaned_data
+        cart.add(product=product,
+                 quantity=cd['quantity'],
+                 update_quantity=cd['update'])
+    return redirect('cart:cart_detail')
+
+@require_POST
+def cart_update(request, product_id):
+    cart = Cart(request)
+    form = CartUpdateProductForm(request.POST)
+    if form.is_valid():
+        # A product deleted since it was added can still be changed.
+        cart.update(product_id, form.cleaned_data['quantity'])
+    return redirect('cart:cart_detail')
+
+@require_POST
+def cart_remove(request, product_id):
+    Cart(request).remove(product_id)
+    return redirect('cart:cart_detail')
+
+def cart_detail(request):
+    cart = Cart(request)
+    # Keeps the count in the header in line with the lines listed.
+    cart.drop_withdrawn()
+    items = list(cart)
+    for item in items:
+        item['update_quantity_form'] = CartUpdateProductForm(
+            initial={'quantity': item['quantity']})
+    context = {
+        'cart' : cart,
+        'items' : items,
+        'total_price' : sum((item['total_price'] for item in items),
+                            Decimal(0)),
+    }
+    return timed_render(request,
+                        'cart/detail.html',
+                        context)
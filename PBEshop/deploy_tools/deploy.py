@@ -1,11 +1,22 @@
+import hashlib
+import json
 import os
 import random
+import re
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from optparse import OptionParser
 
 REPO_URL = 'https://lgajownik@bitbucket.org/lgajownik/tdd.git'
 USER_NAME = 'lukasz-gajownik'
 PROJECT_NAME = 'PBEshop'
 PYTHON_VERSION='3.5'
+BRANCH = 'master'
+KEEP_RELEASES = 5
 
 def deploy(user=USER_NAME,repo=REPO_URL, project=PROJECT_NAME, python_version=PYTHON_VERSION):
     file_abspath = os.path.abspath(__file__)
@@ -87,6 +98,368 @@ def _update_database(site_folder, virtualenv_folder, python_version):
         site_folder, virtualenv_folder, python_version
     ))
 
+# Release mode.
+#
+# Every deploy is exported from a mirror of the repository into its own
+# directory and goes live by swapping the site_folder symlink to it, so the
+# web server sees either the old tree or the new one, never a mix:
+#
+#     <domain>/repository.git        mirror, only fetched
+#     <domain>/releases/<time>-<commit>/
+#     <domain>/releases/<time>-<commit>/venv -> virtualenvs/<requirements>
+#     <domain>/virtualenvs/<requirements>/
+#     <domain>/shared/               secret_key.py, public/static, public/media
+#     <domain>/database/             db.sqlite3
+#     <domain>/public_python -> releases/<time>-<commit>
+#
+# Every requirements.txt gets its own virtualenv, named after its hash, and
+# pip never touches one that a release already uses. The web server runs
+# public_python/venv/bin/..., so the swap switches code and packages
+# together. collectstatic and migrate are skipped while the hash of their
+# inputs matches the one recorded in shared/deploy_state.json after they
+# last succeeded; delete its "database" entry after replacing the database.
+# Steps run concurrently as soon as those they depend on finish.
+
+class Step(object):
+
+    def __init__(self, name, function, after=()):
+        self.name = name
+        self.function = function
+        self.after = set(after)
+
+
+def deploy_release(user=USER_NAME, repo=REPO_URL, project=PROJECT_NAME,
+                   python_version=PYTHON_VERSION, branch=BRANCH,
+                   keep=KEEP_RELEASES, domain_folder=None,
+                   virtualenvs_folder=None):
+    domain_folder = domain_folder or os.path.dirname(os.path.abspath(__file__))
+    domain_name = os.path.basename(domain_folder)
+    shared_folder = domain_folder + '/shared'
+    context = {
+        'repo': repo,
+        'branch': branch,
+        'project': project,
+        'python_version': python_version,
+        'domain_name': domain_name,
+        'site_folder': domain_folder + '/public_python',
+        'mirror_folder': domain_folder + '/repository.git',
+        'releases_folder': domain_folder + '/releases',
+        'shared_folder': shared_folder,
+        'database_folder': domain_folder + '/database',
+        'virtualenvs_folder': virtualenvs_folder or (
+            domain_folder + '/virtualenvs'),
+        'user': user,
+        'keep': keep,
+        'state': _DeployState(shared_folder + '/deploy_state.json'),
+    }
+    started = time.time()
+    _run_steps(context, [
+        Step('source', _fetch_source),
+        Step('release', _export_release, after=['source']),
+        Step('virtualenv', _update_release_virtualenv, after=['source']),
+        Step('settings', _update_release_settings, after=['release']),
+        Step('venv', _link_release_virtualenv,
+             after=['release', 'virtualenv']),
+        Step('static', _update_release_static_files,
+             after=['venv', 'settings']),
+        Step('database', _update_release_database,
+             after=['venv', 'settings']),
+        Step('switch', _switch_release, after=['static', 'database']),
+        Step('cleanup', _remove_old_releases, after=['switch']),
+    ])
+    print('Deployed %s in %.1fs' % (context['release'], time.time() - started))
+
+def _run_steps(context, steps):
+    """
+    Runs every step once those in its ``after`` finished, concurrently when
+    possible, and stops at the first failure.
+    """
+    pending = list(steps)
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+        while pending or running:
+            for step in [s for s in pending if s.after <= done]:
+                pending.remove(step)
+                running[pool.submit(_timed, step, context)] = step
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                if future.exception() is not None:
+                    # Let the steps already started finish before giving up.
+                    wait(running)
+                    raise future.exception()
+                done.add(step.name)
+
+def _timed(step, context):
+    started = time.time()
+    try:
+        note = step.function(context)
+    except Exception:
+        print('%-10s failed after %.2fs' % (step.name, time.time() - started))
+        raise
+    print('%-10s %6.2fs%s' % (step.name, time.time() - started,
+                             '  (%s)' % note if note else ''))
+
+def _fetch_source(context):
+    mirror = context['mirror_folder']
+    if not os.path.exists(mirror):
+        _run_command(['git', 'clone', '--mirror', context['repo'], mirror])
+    else:
+        _run_command(['git', 'remote', 'update', '--prune'], cwd=mirror)
+    context['commit'] = _run_command(
+        ['git', 'rev-parse', context['branch'] + '^{commit}'], cwd=mirror
+    ).strip()
+    return context['commit'][:8]
+
+def _export_release(context):
+    current = _current_release(context)
+    if current and current.endswith('-' + context['commit'][:8]):
+        context['release'] = current
+        context['release_folder'] = '%s/%s' % (context['releases_folder'],
+                                               current)
+        return 'unchanged, reusing %s' % current
+    name = '%s-%s' % (time.strftime('%Y%m%d%H%M%S'), context['commit'][:8])
+    folder = '%s/%s' % (context['releases_folder'], name)
+    partial = folder + '.partial'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    archive = subprocess.Popen(
+        ['git', 'archive', '--format=tar', context['commit']],
+        cwd=context['mirror_folder'], stdout=subprocess.PIPE)
+    with tarfile.open(fileobj=archive.stdout, mode='r|') as tar:
+        tar.extractall(partial)
+    if archive.wait():
+        raise RuntimeError('git archive failed')
+    os.rename(partial, folder)
+    context['release'] = name
+    context['release_folder'] = folder
+    context['new_release'] = True
+    return name
+
+def _current_release(context):
+    if os.path.islink(context['site_folder']):
+        return os.path.basename(os.readlink(context['site_folder']))
+    return None
+
+def _update_release_virtualenv(context):
+    requirements = _run_command(
+        ['git', 'show', context['commit'] + ':requirements.txt'],
+        cwd=context['mirror_folder'])
+    key = _hash_strings(context['python_version'], requirements)
+    folder = '%s/%s' % (context['virtualenvs_folder'], key)
+    context['requirements_hash'] = key
+    context['virtualenv_folder'] = folder
+    if os.path.exists(folder + '/.complete'):
+        return 'unchanged'
+    # A virtualenv cannot be moved once built, so it is built in place and
+    # one left without its marker by a failed deploy is started over.
+    shutil.rmtree(folder, ignore_errors=True)
+    _run_command(['virtualenv', folder,
+                  '-p', '/usr/local/bin/python%s' % context['python_version']])
+    with open(folder + '/requirements.txt', 'w') as f:
+        f.write(requirements)
+    _run_command(['%s/bin/pip%s' % (folder, context['python_version']),
+                  'install', '-r', folder + '/requirements.txt'])
+    open(folder + '/.complete', 'w').close()
+    return 'built %s' % key[:8]
+
+def _link_release_virtualenv(context):
+    link = context['release_folder'] + '/venv'
+    if os.path.islink(link):
+        if os.readlink(link) == context['virtualenv_folder']:
+            return 'unchanged'
+        os.remove(link)
+    os.symlink(context['virtualenv_folder'], link)
+
+def _update_release_settings(context):
+    shared = context['shared_folder']
+    release = context['release_folder']
+    project_folder = '%s/%s' % (release, context['project'])
+    if not os.path.exists(shared + '/public'):
+        _adopt_site_folder(context)
+    for subfolder in ('public/static', 'public/media'):
+        os.makedirs('%s/%s' % (shared, subfolder), exist_ok=True)
+    os.makedirs(context['database_folder'], exist_ok=True)
+    secret_key_file = shared + '/secret_key.py'
+    if not os.path.exists(secret_key_file):
+        chars = 'abcdefghijklmnopqrstuvwxyz0123456789!@#$%^&*(-_=+)'
+        key = "".join(random.SystemRandom().choice(chars) for _ in range(50))
+        _append_to_file(secret_key_file, "SECRET_KEY = '%s'\n" % (key,))
+    if not context.get('new_release'):
+        return 'unchanged'
+    _symlink(shared + '/public', release + '/public')
+    _symlink(shared + '/public/media', release + '/media')
+    _symlink(secret_key_file, project_folder + '/secret_key.py')
+
+    # The release is not live yet, editing it leaves the running site alone.
+    settings_path = project_folder + '/settings.py'
+    with open(settings_path) as f:
+        s = f.read()
+    s = re.sub(r'^DEBUG = True$', 'DEBUG = False', s, flags=re.M)
+    s = re.sub(r'^ALLOWED_HOSTS = .+$',
+               'ALLOWED_HOSTS = ["%s"]' % (context['domain_name'],), s,
+               flags=re.M)
+    s += '\n'.join([
+        '',
+        '',
+        '# Added by deploy_tools/deploy.py',
+        'from .secret_key import SECRET_KEY',
+        "STATIC_ROOT = os.path.join(BASE_DIR, 'public', 'static')",
+        "if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':",
+        "    DATABASES['default']['NAME'] = %r" % (
+            context['database_folder'] + '/db.sqlite3'),
+        '',
+    ])
+    with open(settings_path, 'w') as f:
+        f.write(s)
+
+def _adopt_site_folder(context):
+    """
+    Moves the database and media of a site deployed in place, by deploy(),
+    to where releases share them.
+    """
+    site = context['site_folder']
+    if not os.path.isdir(site) or os.path.islink(site):
+        return
+    database = context['database_folder'] + '/db.sqlite3'
+    if os.path.exists(site + '/db.sqlite3') and not os.path.exists(database):
+        os.makedirs(context['database_folder'], exist_ok=True)
+        shutil.copy2(site + '/db.sqlite3', database)
+    for subfolder in ('public/media', 'media'):
+        if os.path.isdir('%s/%s' % (site, subfolder)):
+            shutil.copytree('%s/%s' % (site, subfolder),
+                            context['shared_folder'] + '/public/media')
+            break
+
+def _update_release_static_files(context):
+    key = _hash_strings(context['requirements_hash'],
+                        _hash_files(context['release_folder'], _is_static))
+    if context['state'].get('static') == key:
+        return 'unchanged'
+    _run_manage(context, 'collectstatic', '--noinput')
+    context['state'].set('static', key)
+
+def _update_release_database(context):
+    # Whatever the database is, it was migrated with these migrations, so
+    # a shared one is not migrated again before the release goes live.
+    key = _hash_strings(context['requirements_hash'],
+                        _hash_files(context['release_folder'], _is_migration))
+    if context['state'].get('database') == key:
+        return 'unchanged'
+    _run_manage(context, 'migrate', '--noinput')
+    context['state'].set('database', key)
+
+def _is_static(path):
+    return '/static/' in path or path.endswith('/settings.py')
+
+def _is_migration(path):
+    return '/migrations/' in path and path.endswith('.py')
+
+def _switch_release(context):
+    site = context['site_folder']
+    if _current_release(context) == context['release']:
+        return 'unchanged'
+    if os.path.exists(site) and not os.path.islink(site):
+        # Happens once, when leaving deploy() for releases.
+        os.rename(site, '%s/%s-in-place' % (context['releases_folder'],
+                                           time.strftime('%Y%m%d%H%M%S')))
+    temporary = '%s.%s' % (site, context['release'])
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    os.symlink('releases/' + context['release'], temporary)
+    os.replace(temporary, site)
+    context['state'].set('release', context['release'])
+
+def _remove_old_releases(context):
+    folder = context['releases_folder']
+    current = _current_release(context)
+    releases = sorted(name for name in os.listdir(folder) if name != current)
+    old = releases[:max(len(releases) - context['keep'] + 1, 0)]
+    for name in old:
+        shutil.rmtree('%s/%s' % (folder, name))
+    used = set()
+    for name in os.listdir(folder):
+        link = '%s/%s/venv' % (folder, name)
+        if os.path.islink(link):
+            used.add(os.path.basename(os.readlink(link)))
+    unused = [name for name in os.listdir(context['virtualenvs_folder'])
+              if name not in used]
+    for name in unused:
+        shutil.rmtree('%s/%s' % (context['virtualenvs_folder'], name))
+    if not old and not unused:
+        return None
+    return 'removed %d releases, %d virtualenvs' % (len(old), len(unused))
+
+class _DeployState(object):
+    """
+    Input hashes of the shared resources, saved as soon as a step succeeds.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.values = json.load(f)
+        except (IOError, ValueError):
+            self.values = {}
+
+    def get(self, name):
+        with self.lock:
+            return self.values.get(name)
+
+    def set(self, name, value):
+        with self.lock:
+            self.values[name] = value
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.partial', 'w') as f:
+                json.dump(self.values, f, indent=2, sort_keys=True)
+            os.replace(self.path + '.partial', self.path)
+
+def _hash_strings(*strings):
+    digest = hashlib.sha1()
+    for string in strings:
+        digest.update(string.encode('utf-8') + b'\0')
+    return digest.hexdigest()
+
+def _hash_files(folder, predicate):
+    digest = hashlib.sha1()
+    for directory, subdirectories, files in os.walk(folder):
+        subdirectories.sort()
+        for name in sorted(files):
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, folder)
+            if predicate('/' + relative):
+                digest.update(relative.encode('utf-8') + b'\0')
+                with open(path, 'rb') as f:
+                    digest.update(hashlib.sha1(f.read()).digest())
+    return digest.hexdigest()
+
+def _symlink(target, name):
+    if not os.path.lexists(name):
+        os.symlink(target, name)
+
+def _run_manage(context, *arguments):
+    _run_command(['%s/venv/bin/python%s' % (context['release_folder'],
+                                            context['python_version']),
+                  'manage.py'] + list(arguments),
+                 cwd=context['release_folder'])
+
+def _run_command(command, cwd=None):
+    """
+    Runs ``command`` and returns its output, which is only printed when it
+    fails, so that concurrent steps do not mix theirs.
+    """
+    result = subprocess.run(command, cwd=cwd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    if result.returncode:
+        print('Failed: %s\n%s' % (' '.join(command), result.stdout))
+        raise subprocess.CalledProcessError(result.returncode, command,
+                                            result.stdout)
+    return result.stdout
+
 def _execude_command(command):
     print('Execute: %s' % (command))
     os.system(command)
@@ -113,12 +486,29 @@ if __name__ == "__main__":
                   action="store", dest="repo", type='string', default=REPO_URL,
                   help="Repository url (http://repo/file/path.git")
     parser.add_option("--project",
-                  action="store", dest="project", type='string', default=REPO_URL,
+                  action="store", dest="project", type='string', default=PROJECT_NAME,
                   help="Django project name")
     parser.add_option("--python_version",
                       action="store", dest="python_version", type='string', default='3.5',
                       help="Python version (default 3.5)")
+    parser.add_option("--mode",
+                      action="store", dest="mode", type='choice', default='in-place',
+                      choices=['in-place', 'release'],
+                      help="'in-place' updates public_python serially, 'release' "
+                           "deploys into releases/ and swaps the public_python "
+                           "symlink (default in-place)")
+    parser.add_option("--branch",
+                      action="store", dest="branch", type='string', default=BRANCH,
+                      help="Branch to release (default %s)" % BRANCH)
+    parser.add_option("--keep",
+                      action="store", dest="keep", type='int', default=KEEP_RELEASES,
+                      help="Releases to keep (default %d)" % KEEP_RELEASES)
 
     options, args = parser.parse_args()
 
-    deploy(user=options.user, repo=options.repo, project=options.project, python_version=options.python_version)
\ No newline at end of file
+    if options.mode == 'release':
+        deploy_release(user=options.user, repo=options.repo, project=options.project,
+                       python_version=options.python_version, branch=options.branch,
+                       keep=options.keep)
+    else:
+        deploy(user=options.user, repo=options.repo, project=options.project, python_version=options.python_version)
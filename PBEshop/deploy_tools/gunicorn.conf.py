@@ -0,0 +1,37 @@
+# gunicorn settings for production, from the project folder:
+#     gunicorn -c deploy_tools/gunicorn.conf.py PBEshop.wsgi
+# The application is imported and warmed up once in the master, every
+# worker forks from it ready to serve, see PBEshop.bootstrap.
+import multiprocessing
+import os
+
+# Tells PBEshop.wsgi to leave connecting to the workers.
+os.environ['PBESHOP_PRELOAD'] = '1'
+os.environ.setdefault('PBESHOP_PRODUCTION', '1')
+
+bind = os.environ.get('PBESHOP_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('PBESHOP_WORKERS',
+                             multiprocessing.cpu_count() * 2 + 1))
+preload_app = True
+
+
+def on_starting(server):
+    if server.num_workers > 1:
+        # Every worker must read the sessions the others saved and see the
+        # catalogue versions the others bumped, see PBESHOP_CACHE.
+        from shop import cache, sessions
+        sessions.check_shared_cache()
+        cache.check_shared_backend()
+
+
+def pre_fork(server, worker):
+    # Nothing the master opened may be shared with a worker.
+    from PBEshop import bootstrap
+    bootstrap.disconnect()
+
+
+def post_fork(server, worker):
+    from PBEshop import bootstrap
+    from shop import sessions
+    bootstrap.connect()
+    sessions.start_flusher()
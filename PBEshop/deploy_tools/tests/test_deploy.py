@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+
+from .. import deploy
+
+class DeployTestMixin(object):
+
+    def setUp(self):
+        self.domain = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.domain)
+        self.context = {
+            'site_folder': self.domain + '/public_python',
+            'releases_folder': self.domain + '/releases',
+            'virtualenvs_folder': self.domain + '/virtualenvs',
+            'keep': 2,
+            'state': deploy._DeployState(
+                self.domain + '/shared/deploy_state.json'),
+        }
+        os.makedirs(self.context['releases_folder'])
+        os.makedirs(self.context['virtualenvs_folder'])
+
+    def write(self, path, content=''):
+        path = os.path.join(self.domain, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+    def release(self, name, virtualenv='a'):
+        self.write('releases/%s/manage.py' % name)
+        self.write('virtualenvs/%s/.complete' % virtualenv)
+        os.symlink(self.domain + '/virtualenvs/' + virtualenv,
+                   '%s/releases/%s/venv' % (self.domain, name))
+
+    def switch(self, name):
+        self.context['release'] = name
+        return deploy._switch_release(self.context)
+
+class DatabaseStepTest(DeployTestMixin, SimpleTestCase):
+
+    def setUp(self):
+        super(DatabaseStepTest, self).setUp()
+        self.release('1-aaaa')
+        self.write('releases/1-aaaa/shop/migrations/0001_initial.py', 'a')
+        self.context.update(requirements_hash='requirements',
+                            release_folder=self.domain + '/releases/1-aaaa')
+        self.migrations = []
+        self.addCleanup(setattr, deploy, '_run_manage', deploy._run_manage)
+        deploy._run_manage = lambda context, *arguments: \
+            self.migrations.append(arguments)
+
+    def test_migrates_once_per_set_of_migrations(self):
+        deploy._update_release_database(self.context)
+        self.assertEqual(self.migrations, [('migrate', '--noinput')])
+        # Without a db.sqlite3 too, the database may be any server.
+        self.assertEqual(deploy._update_release_database(self.context),
+                         'unchanged')
+        self.write('releases/1-aaaa/shop/views.py', 'changed')
+        self.assertEqual(deploy._update_release_database(self.context),
+                         'unchanged')
+        self.write('releases/1-aaaa/shop/migrations/0002_more.py', 'b')
+        deploy._update_release_database(self.context)
+        self.assertEqual(len(self.migrations), 2)
+
+    def test_new_requirements_migrate_again(self):
+        deploy._update_release_database(self.context)
+        self.context['requirements_hash'] = 'other requirements'
+        deploy._update_release_database(self.context)
+        self.assertEqual(len(self.migrations), 2)
+
+    def test_state_survives_the_deploy(self):
+        deploy._update_release_database(self.context)
+        self.context['state'] = deploy._DeployState(
+            self.domain + '/shared/deploy_state.json')
+        self.assertEqual(deploy._update_release_database(self.context),
+                         'unchanged')
+
+class HashTest(SimpleTestCase):
+
+    def test_hash_files_covers_names_and_contents(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        os.makedirs(folder + '/shop/migrations')
+
+        def write(name, content):
+            with open(os.path.join(folder, name), 'w') as f:
+                f.write(content)
+            return deploy._hash_files(folder, deploy._is_migration)
+
+        first = write('shop/migrations/0001_initial.py', 'a')
+        self.assertEqual(write('shop/models.py', 'b'), first)
+        self.assertNotEqual(write('shop/migrations/0001_initial.py', 'c'),
+                            first)
+        self.assertEqual(write('shop/migrations/0001_initial.py', 'a'), first)
+        os.rename(folder + '/shop/migrations/0001_initial.py',
+                  folder + '/shop/migrations/0001_renamed.py')
+        self.assertNotEqual(deploy._hash_files(folder, deploy._is_migration),
+                            first)
+
+    def test_hash_strings_separates_its_arguments(self):
+        self.assertNotEqual(deploy._hash_strings('ab', 'c'),
+                            deploy._hash_strings('a', 'bc'))
+
+class SwitchReleaseTest(DeployTestMixin, SimpleTestCase):
+
+    def test_switch_and_roll_back(self):
+        self.release('1-aaaa')
+        self.release('2-bbbb')
+        site = self.context['site_folder']
+        self.switch('1-aaaa')
+        self.assertEqual(os.readlink(site), 'releases/1-aaaa')
+        self.switch('2-bbbb')
+        self.assertEqual(os.readlink(site), 'releases/2-bbbb')
+        self.assertEqual(self.switch('2-bbbb'), 'unchanged')
+        # Rolling back is switching to the release before.
+        self.switch('1-aaaa')
+        self.assertEqual(os.readlink(site), 'releases/1-aaaa')
+        self.assertTrue(os.path.exists(site + '/manage.py'))
+        self.assertEqual(self.context['state'].get('release'), '1-aaaa')
+        self.assertEqual(sorted(os.listdir(self.domain + '/releases')),
+                         ['1-aaaa', '2-bbbb'])
+
+    def test_site_deployed_in_place_is_kept_as_a_release(self):
+        self.release('2-bbbb')
+        self.write('public_python/manage.py', 'in place')
+        self.switch('2-bbbb')
+        kept = [name for name in os.listdir(self.domain + '/releases')
+                if name.endswith('-in-place')]
+        self.assertEqual(len(kept), 1)
+        with open('%s/releases/%s/manage.py'
+                  % (self.domain, kept[0])) as f:
+            self.assertEqual(f.read(), 'in place')
+        self.assertTrue(os.path.islink(self.context['site_folder']))
+
+    def test_failed_step_leaves_the_live_release(self):
+        self.release('1-aaaa')
+        self.switch('1-aaaa')
+        self.release('2-bbbb')
+        self.context['release'] = '2-bbbb'
+
+        def migrate(context):
+            raise RuntimeError('migrate failed')
+
+        with self.assertRaises(RuntimeError):
+            deploy._run_steps(self.context, [
+                deploy.Step('database', migrate),
+                deploy.Step('switch', deploy._switch_release,
+                            after=['database']),
+            ])
+        self.assertEqual(os.readlink(self.context['site_folder']),
+                         'releases/1-aaaa')
+
+    def test_cleanup_keeps_the_live_and_latest_releases(self):
+        self.release('1-aaaa', 'old')
+        self.release('2-bbbb', 'old')
+        self.release('3-cccc', 'new')
+        self.release('4-dddd', 'new')
+        self.switch('3-cccc')
+        deploy._remove_old_releases(self.context)
+        self.assertEqual(sorted(os.listdir(self.domain + '/releases')),
+                         ['3-cccc', '4-dddd'])
+        self.assertEqual(os.listdir(self.domain + '/virtualenvs'), ['new'])
@@ -0,0 +1,37 @@
+"""
+Turning a cart into an order.
+
+Everything the customer waits for happens in one transaction: the order
+and its lines are written, the stock is taken and the follow-up work is
+queued as jobs, see shop.jobs. The confirmation email, the low stock alert
+and the catalogue updates of products that sold out run after the
+response, in ``manage.py run_workers``.
+"""
+from django.db import transaction
+
+from shop import jobs, stock
+from .models import OrderItem
+
+def place_order(cart, form):
+    """
+    Saves ``form``, an ``OrderCreateForm``, as the order of the available
+    products in ``cart`` at their current prices and returns it. Raises
+    ``stock.InsufficientStock`` and saves nothing if a line cannot be
+    served.
+    """
+    items = list(cart)
+    with transaction.atomic():
+        order = form.save()
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=item['product'],
+                      price=item['product'].price,
+                      quantity=item['quantity'])
+            for item in items])
+        reference = 'order:%d' % order.pk
+        stock.reserve_many([(item['product'], item['quantity'])
+                            for item in items], reference, defer=True)
+        stock.confirm(reference)
+        product_ids = sorted(item['product'].pk for item in items)
+        jobs.enqueue('orders.send_confirmation', {'order_id': order.pk})
+        jobs.enqueue('orders.check_stock', {'product_ids': product_ids})
+    return order
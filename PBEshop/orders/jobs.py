@@ -0,0 +1,33 @@
+"""
+Jobs queued by a checkout, see orders.checkout.
+"""
+from django.conf import settings
+from django.core.mail import mail_admins, send_mail
+
+from shop.jobs import job
+from shop.models import Product
+from .models import Order
+
+@job('orders.send_confirmation')
+def send_confirmation(order_id):
+    order = Order.objects.filter(pk=order_id).first()
+    if order is None:
+        # Deleted meanwhile.
+        return
+    items = list(order.items.select_related('product'))
+    lines = ['%d x %s' % (item.quantity, item.product.name) for item in items]
+    send_mail('Order nr. %d' % order.id,
+              'Dear %s,\n\nYou have successfully placed an order:\n\n%s\n\n'
+              'Total: %s' % (order.first_name, '\n'.join(lines),
+                             sum(item.get_cost() for item in items)),
+              None, [order.email])
+
+@job('orders.check_stock')
+def check_stock(product_ids):
+    low = Product.objects.filter(
+        pk__in=product_ids,
+        stock__lte=settings.ORDERS_STOCK_ALERT_THRESHOLD,
+    ).values_list('name', 'stock')
+    if low:
+        mail_admins('Low stock',
+                    '\n'.join('%s: %d left' % row for row in low))
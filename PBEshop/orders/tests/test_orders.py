@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+from django.core import mail
+from django.core.urlresolvers import reverse
+from django.test import override_settings, TestCase
+
+from shop import jobs
+from shop.models import Category, Job, Product
+from shop.stock import InsufficientStock
+from shop.tests.test_sessions import QueuedSessionsMixin
+from ..models import Order
+from ..views import _stock_error
+
+ADDRESS = {
+    'first_name': 'Ada',
+    'last_name': 'Lovelace',
+    'email': 'ada@example.com',
+    'address': '12 St James Square',
+    'postal_code': 'SW1Y 4JH',
+    'city': 'London',
+}
+
+@override_settings(ADMINS=[('Admin', 'admin@example.com')],
+                   ORDERS_STOCK_ALERT_THRESHOLD=5)
+class OrderCreateTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        jobs.autodiscover()
+        self.category = Category.objects.create(name='shoes', slug='shoes')
+        self.first = Product.objects.create(category=self.category,
+                                            name='first', slug='first',
+                                            price=Decimal('1.10'), stock=10)
+        self.second = Product.objects.create(category=self.category,
+                                             name='second', slug='second',
+                                             price=Decimal('2.25'), stock=2)
+
+    def add(self, product, quantity):
+        self.client.post(reverse('cart:cart_add', args=[product.id]),
+                         {'quantity': quantity})
+
+    def order(self):
+        return self.client.post(reverse('orders:order_create'), ADDRESS)
+
+    def test_empty_cart_goes_back_to_the_cart(self):
+        response = self.client.get(reverse('orders:order_create'))
+        self.assertRedirects(response, reverse('cart:cart_detail'))
+
+    def test_places_order_and_queues_the_rest(self):
+        self.add(self.first, 3)
+        self.add(self.second, 2)
+        response = self.order()
+        self.assertTemplateUsed(response, 'orders/order/created.html')
+
+        order = Order.objects.get()
+        self.assertEqual(
+            sorted(order.items.values_list('product', 'quantity', 'price')),
+            [(self.first.pk, 3, Decimal('1.10')),
+             (self.second.pk, 2, Decimal('2.25'))])
+        self.assertEqual(order.get_total_cost(), Decimal('7.80'))
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual((self.first.stock, self.second.stock), (7, 0))
+        self.assertFalse(self.second.available)
+        self.assertEqual(self.client.session.get('cart'), None)
+        # Nothing sent or recounted while the customer waited.
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(sorted(Job.objects.values_list('name', flat=True)),
+                         ['orders.check_stock', 'orders.send_confirmation',
+                          'shop.products_changed'])
+
+        self.assertEqual(jobs.work(burst=True), 3)
+        confirmation, alert = sorted(mail.outbox, key=lambda m: m.subject)
+        self.assertEqual(alert.subject, '[Django] Low stock')
+        self.assertEqual(alert.body, 'second: 0 left')
+        self.assertEqual(confirmation.to, ['ada@example.com'])
+        self.assertIn('3 x first', confirmation.body)
+        self.assertIn('Total: 7.80', confirmation.body)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 1)
+
+    def test_insufficient_stock_places_nothing(self):
+        self.add(self.first, 1)
+        self.add(self.second, 3)
+        response = self.order()
+        self.assertEqual(response.context['form'].non_field_errors(),
+                         ['Only 2 of second are left.'])
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Job.objects.exists())
+        self.first.refresh_from_db()
+        self.assertEqual(self.first.stock, 10)
+        self.assertEqual(len(self.client.session['cart']), 2)
+
+    def test_stock_errors_name_what_happened(self):
+        def message(name, left):
+            return _stock_error(InsufficientStock(1, 3, name, left))
+        self.assertEqual(message('second', 2), 'Only 2 of second are left.')
+        self.assertEqual(message('second', 0), 'second is sold out.')
+        self.assertEqual(message('second', None),
+                         'second is no longer sold.')
+        self.assertEqual(message(None, None),
+                         'A product in your cart is no longer sold.')
+
+    def test_changed_price_is_confirmed_first(self):
+        self.add(self.first, 2)
+        Product.objects.filter(pk=self.first.pk).update(price=Decimal('1.50'))
+        response = self.order()
+        self.assertEqual(response.context['changes'],
+                         ['The price of first changed from 1.10 to 1.50.'])
+        self.assertFalse(Order.objects.exists())
+
+        response = self.order()
+        self.assertTemplateUsed(response, 'orders/order/created.html')
+        self.assertEqual(list(Order.objects.get().items.values_list('price')),
+                         [(Decimal('1.50'),)])
+
+    def test_withdrawn_products_are_reported(self):
+        self.add(self.first, 1)
+        self.add(self.second, 1)
+        Product.objects.filter(pk=self.second.pk).update(available=False)
+        response = self.client.get(reverse('orders:order_create'))
+        self.assertEqual(response.context['changes'],
+                         ['1 of the products in your cart are no longer '
+                          'available and were removed.'])
+        self.assertEqual(
+            [item['product'] for item in response.context['items']],
+            [self.first])
+
+        response = self.order()
+        self.assertTemplateUsed(response, 'orders/order/created.html')
+        self.assertEqual(
+            list(Order.objects.get().items.values_list('product')),
+            [(self.first.pk,)])
@@ -0,0 +1,59 @@
+from django.shortcuts import redirect
+from cart.cart import Cart
+from shop.metrics import timed_render
+from shop.stock import InsufficientStock
+from .checkout import place_order
+from .forms import OrderCreateForm
+
+def _cart_changes(cart, items):
+    """
+    Describes what changed in the shop since ``cart`` was filled.
+    """
+    changes = []
+    withdrawn = cart.withdrawn()
+    if withdrawn:
+        changes.append('%d of the products in your cart are no longer '
+                       'available and were removed.' % len(withdrawn))
+    for item in items:
+        if item['price_changed']:
+            changes.append('The price of %s changed from %s to %s.' % (
+                item['product'].name, item['price'], item['product'].price))
+    return changes
+
+def _stock_error(e):
+    if e.name is None:
+        return 'A product in your cart is no longer sold.'
+    if e.left is None:
+        return '%s is no longer sold.' % e.name
+    if not e.left:
+        return '%s is sold out.' % e.name
+    return 'Only %d of %s are left.' % (e.left, e.name)
+
+def order_create(request):
+    cart = Cart(request)
+    items = list(cart)
+    changes = _cart_changes(cart, items)
+    if not items and not changes:
+        return redirect('cart:cart_detail')
+    if changes:
+        # The customer confirms the cart as it is now before ordering it.
+        cart.refresh()
+        items = list(cart)
+    if request.method == 'POST':
+        form = OrderCreateForm(request.POST)
+        if form.is_valid() and items and not changes:
+            try:
+                order = place_order(cart, form)
+            except InsufficientStock as e:
+                form.add_error(None, _stock_error(e))
+            else:
+                cart.clear()
+                return timed_render(request,
+                                    'orders/order/created.html',
+                                    {'order': order})
+    else:
+        form = OrderCreateForm()
+    return timed_render(request,
+                        'orders/order/create.html',
+                        {'cart': cart, 'items': items, 'form': form,
+                         'changes': changes})
@@ -1,16 +1,180 @@
-from django.contrib import admin
-from .models import Category, Product
+import math
+from decimal import Decimal
+
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.models import CHANGE, LogEntry
+from django.contrib.admin.options import get_content_type_for_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Func, Q, Value, When
+from django.utils import timezone
+from django.utils.encoding import force_text
+
+from .bulk import bulk_update
+from .models import Category, Job, Product
+from .pagination import EstimatedCountPaginator
+from .signals import products_bulk_changed
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug']
+    list_display = ['name', 'slug', 'product_count']
     prepopulated_fields = {'slug' : ('name',)}
 
 admin.site.register(Category, CategoryAdmin)
 
+class ProductActionForm(ActionForm):
+    percentage = forms.DecimalField(required=False, min_value=-100,
+                                    max_digits=6, decimal_places=2,
+                                    help_text='For the adjust actions, '
+                                              'e.g. -10 or 25')
+
+class _BulkEdit(object):
+    """
+    The rows a list_editable save changed, written together at its end.
+    """
+
+    def __init__(self):
+        self.products = []
+        self.fields = set()
+        self.log_entries = []
+
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'price', 'stock',
+    list_display = ['name', 'slug', 'category', 'price', 'stock',
                     'available', 'created', 'updated']
-    list_filter = ['available', 'created', 'updated']
+    list_filter = ['available', 'category', 'created', 'updated']
     list_editable = ['price', 'stock', 'available']
+    list_select_related = ['category']
     prepopulated_fields = {'slug' : ('name',)}
+    # Counting big tables dominates the changelist, see
+    # shop.pagination.EstimatedCountPaginator.
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    action_form = ProductActionForm
+    actions = ['adjust_price', 'adjust_stock']
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'POST' or '_save' not in request.POST:
+            return super(ProductAdmin, self).changelist_view(request,
+                                                             extra_context)
+        # One bulk UPDATE for the whole page instead of a save() per row.
+        request._bulk_edit = bulk_edit = _BulkEdit()
+        with transaction.atomic():
+            response = super(ProductAdmin, self).changelist_view(
+                request, extra_context)
+            if bulk_edit.products:
+                now = timezone.now()
+                for product in bulk_edit.products:
+                    product.updated = now
+                bulk_update(bulk_edit.products,
+                            sorted(bulk_edit.fields) + ['updated'])
+                LogEntry.objects.bulk_create(bulk_edit.log_entries)
+                products_bulk_changed.send(
+                    sender=Product,
+                    product_ids=[p.pk for p in bulk_edit.products],
+                    category_ids=set(p.category_id
+                                     for p in bulk_edit.products))
+        return response
+
+    def save_model(self, request, obj, form, change):
+        bulk_edit = getattr(request, '_bulk_edit', None)
+        if bulk_edit is None:
+            return super(ProductAdmin, self).save_model(request, obj, form,
+                                                        change)
+        if 'available' in form.changed_data:
+            obj.sold_out = False
+            bulk_edit.fields.add('sold_out')
+        bulk_edit.products.append(obj)
+        bulk_edit.fields.update(form.changed_data)
+
+    def log_change(self, request, object, message):
+        bulk_edit = getattr(request, '_bulk_edit', None)
+        if bulk_edit is None:
+            return super(ProductAdmin, self).log_change(request, object,
+                                                        message)
+        bulk_edit.log_entries.append(LogEntry(
+            user_id=request.user.pk,
+            content_type_id=get_content_type_for_model(object).pk,
+            object_id=force_text(object.pk),
+            object_repr=force_text(object)[:200],
+            action_flag=CHANGE,
+            change_message=message,
+        ))
+
+    def _percentage(self, request):
+        field = self.action_form.base_fields['percentage']
+        try:
+            percentage = field.clean(request.POST.get('percentage'))
+        except ValidationError:
+            percentage = None
+        if percentage is None:
+            self.message_user(request, 'Enter the percentage to adjust by.',
+                              messages.ERROR)
+        return percentage
+
+    def _adjust(self, request, queryset, percentage, field, **values):
+        """
+        Runs a single UPDATE of ``queryset`` and announces the change.
+        """
+        with transaction.atomic():
+            rows = list(queryset.values_list('pk', 'category'))
+            queryset.update(updated=timezone.now(), **values)
+            products_bulk_changed.send(
+                sender=Product,
+                product_ids=[pk for pk, _ in rows],
+                category_ids=set(category_id for _, category_id in rows))
+        self.message_user(request, 'Changed the %s of %d products by %s%%.'
+                                   % (field, len(rows), percentage))
+
+    def adjust_price(self, request, queryset):
+        percentage = self._percentage(request)
+        if percentage is None:
+            return
+        factor = 1 + percentage / 100
+        price = Func(F('price') * Value(factor), Value(2), function='ROUND',
+                     output_field=DecimalField())
+        self._adjust(request, queryset, percentage, 'price', price=price)
+    adjust_price.short_description = 'Adjust the price of selected ' \
+                                     'products by a percentage'
+
+    def adjust_stock(self, request, queryset):
+        percentage = self._percentage(request)
+        if percentage is None:
+            return
+        factor = 1 + percentage / 100
+        stock = Func(F('stock') * Value(factor), Value(0), function='ROUND',
+                     output_field=DecimalField())
+        # Like shop.stock, a product that runs out becomes unavailable.
+        # ROUND(stock * factor) is 0 exactly when stock < 0.5 / factor.
+        if factor:
+            runs_out = Q(stock__gt=0,
+                         stock__lt=math.ceil(Decimal('0.5') / factor))
+        else:
+            runs_out = Q(stock__gt=0)
+        available = Case(When(runs_out, then=Value(False)),
+                         default=F('available'))
+        sold_out = Case(When(runs_out, then=Value(True)),
+                        default=F('sold_out'))
+        self._adjust(request, queryset, percentage, 'stock',
+                     stock=stock, available=available, sold_out=sold_out)
+    adjust_stock.short_description = 'Adjust the stock of selected ' \
+                                     'products by a percentage'
+
 admin.site.register(Product, ProductAdmin)
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'status', 'attempts', 'max_attempts',
+                    'run_at', 'created']
+    list_filter = ['status', 'name']
+    readonly_fields = ['name', 'payload', 'attempts', 'locked_by',
+                       'last_error', 'created']
+    actions = ['retry']
+
+    def retry(self, request, queryset):
+        count = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+            locked_by='')
+        self.message_user(request, 'Queued %d jobs again.' % count)
+    retry.short_description = 'Run selected jobs again'
+
+admin.site.register(Job, JobAdmin)
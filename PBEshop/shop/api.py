@@ -0,0 +1,177 @@
+"""
+Read-only JSON catalogue API.
+
+Rows are read with ``.values()`` restricted to the requested fields
+(``?fields=id,name,price``), so large columns such as ``description`` are
+never selected unless asked for and no model instances are built: URLs are
+reversed from the row values and images turned into storage URLs.
+"""
+from functools import wraps
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .models import Category, Product
+from .pagination import InvalidCursor, KeysetPaginator
+
+# Public field name -> column read with values()
+FIELDS = {
+    'id': 'id',
+    'name': 'name',
+    'slug': 'slug',
+    'category': 'category__slug',
+    'description': 'description',
+    'image': 'image',
+    'price': 'price',
+    'stock': 'stock',
+    'available': 'available',
+    'created': 'created',
+    'updated': 'updated',
+    'url': None,
+}
+
+DEFAULT_FIELDS = ['id', 'name', 'slug', 'category', 'description', 'image',
+                  'price', 'stock', 'available', 'created', 'updated', 'url']
+
+MAX_BATCH_SIZE = 100
+
+
+class BadRequest(Exception):
+    pass
+
+
+class NotFound(Exception):
+    pass
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, encoder=DjangoJSONEncoder)
+
+
+def _requested_fields(request):
+    value = request.GET.get('fields')
+    if not value:
+        return DEFAULT_FIELDS
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise BadRequest('Unknown fields: %s' % ', '.join(unknown))
+    return fields
+
+
+def _columns(fields, required=('id',)):
+    columns = list(required)
+    for field in fields:
+        if field == 'url':
+            columns += ['id', 'slug']
+        else:
+            columns.append(FIELDS[field])
+    return sorted(set(columns), key=columns.index)
+
+
+def _serialize(row, fields):
+    data = {}
+    for field in fields:
+        if field == 'url':
+            data['url'] = reverse('shop:product_detail',
+                                  args=[row['id'], row['slug']])
+        elif field == 'image':
+            data['image'] = (default_storage.url(row['image'])
+                             if row['image'] else '')
+        else:
+            data[field] = row[FIELDS[field]]
+    return data
+
+
+def _products():
+    return Product.objects.filter(available=True)
+
+
+def api_view(view):
+    @require_GET
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except BadRequest as e:
+            return _json({'error': str(e)}, status=400)
+        except NotFound as e:
+            return _json({'error': str(e)}, status=404)
+    return inner
+
+
+@api_view
+def product_list(request):
+    fields = _requested_fields(request)
+    products = _products()
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category_id = Category.objects.filter(slug=category_slug) \
+                                      .values_list('pk', flat=True).first()
+        if category_id is None:
+            raise NotFound('Unknown category: %s' % category_slug)
+        products = products.filter(category_id=category_id)
+    try:
+        limit = int(request.GET.get('limit', settings.SHOP_PRODUCTS_PER_PAGE))
+    except ValueError:
+        raise BadRequest('limit must be a number')
+    if limit < 1:
+        raise BadRequest('limit must be at least 1')
+    limit = min(limit, MAX_BATCH_SIZE)
+    paginator = KeysetPaginator(
+        products.values(*_columns(fields, required=('id', 'name'))),
+        limit, ordering=('name', 'id'))
+    try:
+        page = paginator.page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    except InvalidCursor as e:
+        raise BadRequest(str(e))
+    return _json({
+        'results': [_serialize(row, fields) for row in page],
+        'next': _page_url(request, 'after', page.next_cursor),
+        'previous': _page_url(request, 'before', page.previous_cursor),
+    })
+
+
+def _page_url(request, name, cursor):
+    if cursor is None:
+        return None
+    query = request.GET.copy()
+    query.pop('after', None)
+    query.pop('before', None)
+    query[name] = cursor
+    return '%s?%s' % (request.path, query.urlencode())
+
+
+@api_view
+def product_detail(request, id):
+    fields = _requested_fields(request)
+    row = _products().filter(pk=id).values(*_columns(fields)).first()
+    if row is None:
+        return _json({'error': 'Not found'}, status=404)
+    return _json(_serialize(row, fields))
+
+
+@api_view
+def product_batch(request):
+    fields = _requested_fields(request)
+    try:
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+    except ValueError:
+        raise BadRequest('ids must be a comma separated list of numbers')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise BadRequest('At most %d ids per request' % MAX_BATCH_SIZE)
+    rows = {}
+    if ids:
+        rows = dict((row['id'], row) for row in
+                    _products().filter(pk__in=ids)
+                               .order_by()
+                               .values(*_columns(fields)))
+    return _json({
+        'results': [_serialize(rows[pk], fields) for pk in ids if pk in rows],
+        'missing': [pk for pk in ids if pk not in rows],
+    })
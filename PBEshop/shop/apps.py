@@ -1,5 +1,19 @@
+import atexit
+
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
 
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self):
+        from . import signals  # noqa: connects the receivers
+        from .db import configure_sqlite
+        connection_created.connect(configure_sqlite,
+                                   dispatch_uid='shop.db.configure_sqlite')
+        from . import sessions
+        request_finished.connect(sessions.flush_due,
+                                 dispatch_uid='shop.sessions.flush_due')
+        atexit.register(sessions.flush_all)
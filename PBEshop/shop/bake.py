@@ -0,0 +1,218 @@
+"""
+Catalogue pages pre-rendered to static files.
+
+``bake_catalogue`` renders the first page of every listing and every product
+page, as an anonymous visitor sees them, to ``SHOP_BAKE_ROOT``::
+
+    baked/index.html                 /
+    baked/shoes/index.html           /shoes/
+    baked/12/red-shoe/index.html     /12/red-shoe/
+
+with ``.gz`` and, when the ``brotli`` package is installed, ``.br``
+variants, for the web server to answer without Django.
+
+A baked page is what its bare URL shows to a visitor without a session, so
+the web server may only answer requests that have neither a query string
+(later pages, facet filters) nor a session cookie (``SESSION_COOKIE_NAME``,
+whose cart the page header counts), for example::
+
+    location / {
+        root /srv/pbeshop/media/baked;
+        gzip_static on;
+        error_page 418 = @django;
+        if ($args) { return 418; }
+        if ($cookie_sessionid) { return 418; }
+        try_files $uri/index.html @django;
+    }
+
+A manifest keeps a fingerprint of what each page shows, so that a run only
+renders the pages whose products or categories changed. Between runs the
+signal receivers delete the files of every page a change touches, so the
+web server never serves a stale page and Django answers until it is baked
+again. They delete them once more when the change commits, as a run baking
+meanwhile may have written them back from the rows committed before. Pages
+that use the session or a CSRF token are never baked.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.urlresolvers import resolve, reverse
+from django.db import transaction
+from django.db.models import Count, Max
+from django.test import RequestFactory
+
+from .cache import _is_cacheable
+from .models import Category, Product, ProductListing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+INDEX = 'index.html'
+MANIFEST = 'manifest.json'
+
+
+def page_file(path, root=None):
+    root = root or settings.SHOP_BAKE_ROOT
+    return os.path.join(root, path.strip('/'), INDEX)
+
+
+def _digest(*parts):
+    return hashlib.sha1(
+        '\n'.join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+def page_fingerprints(chunk_size=2000):
+    """
+    Yields ``(path, fingerprint)`` for every page to bake. A fingerprint
+    changes whenever anything the page shows does.
+    """
+    categories = list(Category.objects.order_by('pk').values_list(
+        'pk', 'name', 'slug', 'product_count'))
+    # Every listing shows the categories and their counters.
+    sidebar = _digest(*categories)
+    states = dict(
+        (row['category'], (row['updated'], row['count']))
+        for row in ProductListing.objects.order_by().values('category')
+                                         .annotate(updated=Max('updated'),
+                                                   count=Count('id')))
+    newest = max((updated for updated, _ in states.values()), default=None)
+    yield (reverse('shop:product_list'),
+           _digest(sidebar, newest, sum(s[1] for s in states.values())))
+    names = {}
+    for pk, name, slug, _ in categories:
+        names[pk] = (name, slug)
+        yield (reverse('shop:product_list_by_category', args=[slug]),
+               _digest(sidebar, *states.get(pk, (None, 0))))
+
+    last_pk = 0
+    products = Product.objects.filter(available=True).order_by('pk') \
+                              .values_list('pk', 'slug', 'updated',
+                                           'category')
+    while True:
+        rows = list(products.filter(pk__gt=last_pk)[:chunk_size])
+        if not rows:
+            return
+        for pk, slug, updated, category_id in rows:
+            yield (reverse('shop:product_detail', args=[pk, slug]),
+                   _digest(updated.isoformat(), *names[category_id]))
+        last_pk = rows[-1][0]
+
+
+def render_page(path):
+    """
+    Renders ``path`` as an anonymous visitor's GET and returns the body, or
+    None when the page cannot be shared between visitors.
+    """
+    request = RequestFactory().get(path)
+    match = request.resolver_match = resolve(path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if not _is_cacheable(request, response):
+        return None
+    return response.content
+
+
+def _write(name, content):
+    partial = name + '.partial'
+    with open(partial, 'wb') as f:
+        f.write(content)
+    os.replace(partial, name)
+
+
+def write_page(path, content, root=None):
+    name = page_file(path, root)
+    os.makedirs(os.path.dirname(name), exist_ok=True)
+    _write(name + '.gz', gzip.compress(content, 9))
+    if brotli is not None:
+        _write(name + '.br', brotli.compress(content))
+    # The plain file goes last, the web server looks for it first.
+    _write(name, content)
+
+
+def bake_page(path, root=None):
+    content = render_page(path)
+    if content is None:
+        discard([path], root)
+        return False
+    write_page(path, content, root)
+    return True
+
+
+def enabled(root=None):
+    return os.path.isdir(root or settings.SHOP_BAKE_ROOT)
+
+
+def discard(paths, root=None):
+    """
+    Deletes the baked files of ``paths``, so that Django serves them again.
+    """
+    root = root or settings.SHOP_BAKE_ROOT
+    if not enabled(root):
+        return
+    for path in paths:
+        name = page_file(path, root)
+        for variant in (name, name + '.gz', name + '.br'):
+            try:
+                os.remove(variant)
+            except FileNotFoundError:
+                pass
+
+
+def discard_listings(root=None):
+    paths = [reverse('shop:product_list')]
+    paths += [reverse('shop:product_list_by_category', args=[slug])
+              for slug in Category.objects.values_list('slug', flat=True)]
+    discard(paths, root)
+
+
+def discard_on_commit(paths=(), listings=False):
+    """
+    Discards ``paths``, and every listing with ``listings``, now and once
+    more when the current transaction commits, which is at once outside of
+    one.
+    """
+    def run():
+        discard(paths)
+        if listings:
+            discard_listings()
+    run()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(run)
+
+
+def load_manifest(root):
+    try:
+        with open(os.path.join(root, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(root, manifest):
+    content = json.dumps(manifest, sort_keys=True).encode('utf-8')
+    _write(os.path.join(root, MANIFEST), content)
+
+
+def plan(root, force=False):
+    """
+    Returns the new manifest, the paths to render and the paths whose
+    pages no longer exist.
+    """
+    old = load_manifest(root)
+    manifest = dict(page_fingerprints())
+    changed = [path for path, fingerprint in sorted(manifest.items())
+               if force or old.get(path) != fingerprint or
+               not os.path.exists(page_file(path, root))]
+    removed = sorted(set(old) - set(manifest))
+    return manifest, changed, removed
+
+
+def remove_empty_directories(root):
+    for directory, subdirectories, files in os.walk(root, topdown=False):
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
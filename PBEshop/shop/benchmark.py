@@ -0,0 +1,265 @@
+"""
+Synthetic catalogues and repeatable timings of the catalogue views.
+
+``generate_catalogue`` fills the database with bulk inserts, ``run_benchmark``
+requests every scenario through the test client and reports latency
+percentiles and query counts, and ``compare_results`` lists the scenarios
+that got slower or run more queries than in a previous results file. The
+``generate_catalogue`` and ``benchmark_catalogue`` commands wrap them.
+"""
+import math
+import platform
+import random
+import subprocess
+import time
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from . import listings
+from .bulk import chunked
+from .cache import get_catalogue_cache
+from .counters import rebuild_category_counters
+from .models import Category, ChangeLogEntry, Product
+from .search import get_search_backend
+
+WORDS = ('alpine', 'amber', 'arctic', 'basic', 'bold', 'canvas', 'classic',
+         'cotton', 'denim', 'desert', 'linen', 'merino', 'nordic', 'ocean',
+         'pocket', 'polar', 'retro', 'rugged', 'silk', 'slim', 'summit',
+         'urban', 'velvet', 'vintage', 'wool')
+NOUNS = ('bag', 'belt', 'boot', 'cap', 'coat', 'dress', 'glove', 'hat',
+         'jacket', 'jeans', 'scarf', 'shirt', 'shoe', 'skirt', 'sock',
+         'sweater', 'trousers', 'vest')
+
+PRODUCT_COLUMNS = ('category', 'name', 'slug', 'image', 'description',
+                   'price', 'stock', 'available', 'sold_out', 'created',
+                   'updated')
+
+PERCENTILES = (50, 95, 99)
+
+# Nothing is kept, so every request renders its page.
+UNCACHED = {
+    'BACKEND': 'shop.cache.LRUCacheBackend',
+    'OPTIONS': {'max_entries': 0},
+}
+
+
+def generate_catalogue(categories, products, seed=0, batch_size=10000,
+                       unavailable_ratio=0.1):
+    """
+    Bulk inserts ``categories`` categories and ``products`` products spread
+    over them, one transaction per batch with their change log entries, then
+    rebuilds the counters, the listings and the search index once. The same
+    seed gives the same catalogue.
+    """
+    rng = random.Random(seed)
+    first = Category.objects.count()
+    with transaction.atomic():
+        Category.objects.bulk_create(
+            Category(name='%s %ss %d' % (rng.choice(WORDS).title(),
+                                         rng.choice(NOUNS), first + i),
+                     slug='generated-%d' % (first + i))
+            for i in range(categories))
+        category_ids = list(Category.objects.order_by('pk')
+                                            .values_list('pk', flat=True))
+        category_ids = category_ids[-categories:]
+        ChangeLogEntry.objects.record(Category, category_ids,
+                                      ChangeLogEntry.CREATE)
+
+    # Rows go straight to executemany(), compiling bulk_create() statements
+    # takes longer than SQLite needs to write them.
+    fields = [Product._meta.get_field(name) for name in PRODUCT_COLUMNS]
+    price_field = Product._meta.get_field('price')
+    now = Product._meta.get_field('created').get_db_prep_save(
+        timezone.now(), connection)
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        connection.ops.quote_name(Product._meta.db_table),
+        ', '.join(connection.ops.quote_name(f.column) for f in fields),
+        ', '.join(['%s'] * len(fields)))
+    last_pk = Product.objects.aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    for batch in chunked(range(products), batch_size):
+        rows = []
+        for i in batch:
+            name = '%s %s %s %d' % (rng.choice(WORDS).title(),
+                                    rng.choice(WORDS), rng.choice(NOUNS), i)
+            price = Decimal(rng.randint(100, 50000)) / 100
+            rows.append((
+                category_ids[i % len(category_ids)],
+                name,
+                name.lower().replace(' ', '-'),
+                '',
+                ' '.join(rng.choice(WORDS + NOUNS) for _ in range(20)),
+                price_field.get_db_prep_save(price, connection),
+                rng.randint(0, 100),
+                rng.random() >= unavailable_ratio,
+                False,
+                now,
+                now,
+            ))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
+            # The inserts bypass ChangeLoggedQuerySet, see shop.changelog.
+            created = Product.objects.filter(pk__gt=last_pk)
+            ChangeLogEntry.objects.record_rows(created, ChangeLogEntry.CREATE)
+            last_pk = created.aggregate(last_pk=Max('pk'))['last_pk']
+
+    rebuild_category_counters(category_ids)
+    listings.rebuild()
+    get_search_backend().rebuild()
+    get_catalogue_cache().bump('categories', 'products')
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not values:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+def scenarios():
+    """
+    Returns ``(name, paths, staff)`` for every timed page. Paths are spread
+    over the catalogue so that a run does not only time one warm row.
+    """
+    categories = list(Category.objects.filter(product_count__gt=0)
+                                      .order_by('pk')
+                                      .values_list('slug', flat=True))
+    step = max(len(categories) // 10, 1)
+    bounds = Product.objects.filter(available=True) \
+                            .aggregate(first=Min('pk'), last=Max('pk'))
+    products = []
+    if bounds['first'] is not None:
+        rng = random.Random(0)
+        sample = set(rng.randint(bounds['first'], bounds['last'])
+                     for _ in range(20))
+        sample.add(bounds['first'])
+        products = list(Product.objects.filter(available=True, pk__in=sample)
+                                       .order_by('pk')
+                                       .values_list('pk', 'slug'))
+    return [
+        ('product_list', [reverse('shop:product_list')], False),
+        ('product_list_by_category',
+         [reverse('shop:product_list_by_category', args=[slug])
+          for slug in categories[::step]], False),
+        ('product_detail',
+         [reverse('shop:product_detail', args=[pk, slug])
+          for pk, slug in products], False),
+        ('admin_product_changelist',
+         [reverse('admin:shop_product_changelist')], True),
+    ]
+
+
+def _staff_client():
+    user, created = User.objects.get_or_create(
+        username='benchmark', defaults={'is_staff': True,
+                                        'is_superuser': True})
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def _time_scenario(client, paths, iterations, warmup):
+    durations, queries = [], []
+    force_debug_cursor = connection.force_debug_cursor
+    connection.force_debug_cursor = True
+    try:
+        for i in range(warmup + iterations):
+            path = paths[i % len(paths)]
+            started = time.time()
+            response = client.get(path)
+            elapsed = time.time() - started
+            if response.status_code != 200:
+                raise AssertionError('GET %s returned %d' % (
+                    path, response.status_code))
+            if i >= warmup:
+                durations.append(elapsed)
+                # The query log is reset when each request starts.
+                queries.append(len(connection.queries_log))
+    finally:
+        connection.force_debug_cursor = force_debug_cursor
+    durations.sort()
+    result = {
+        'requests': len(durations),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 3),
+        'queries_min': min(queries),
+        'queries_max': max(queries),
+    }
+    for p in PERCENTILES:
+        result['p%d_ms' % p] = round(percentile(durations, p) * 1000, 3)
+    return result
+
+
+def run_benchmark(iterations=50, warmup=5, cached=False):
+    """
+    Times every scenario against the current database and returns a dict
+    of results per scenario name. Pages are rendered on every request
+    unless ``cached`` is set.
+    """
+    if not iterations:
+        raise ValueError('iterations must be positive')
+    results = {}
+    cache_settings = settings.SHOP_CACHE if cached else UNCACHED
+    with override_settings(SHOP_CACHE=cache_settings):
+        anonymous, staff = Client(), _staff_client()
+        for name, paths, needs_staff in scenarios():
+            if not paths:
+                continue
+            client = staff if needs_staff else anonymous
+            results[name] = _time_scenario(client, paths, iterations, warmup)
+    return results
+
+
+def environment():
+    try:
+        revision = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'revision': revision,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def compare_results(baseline, current, tolerance=1.2):
+    """
+    Returns a line for every scenario of ``current`` whose p95 grew past
+    ``tolerance`` times the baseline or that runs more queries, matching
+    runs by catalogue size.
+    """
+    regressions = []
+    baseline_runs = dict((run['products'], run) for run in baseline['runs'])
+    for run in current['runs']:
+        old_run = baseline_runs.get(run['products'])
+        if old_run is None:
+            continue
+        for name, result in sorted(run['scenarios'].items()):
+            old = old_run['scenarios'].get(name)
+            if old is None:
+                continue
+            if result['p95_ms'] > old['p95_ms'] * tolerance:
+                regressions.append(
+                    '%s at %d products: p95 %.1fms, was %.1fms' % (
+                        name, run['products'], result['p95_ms'],
+                        old['p95_ms']))
+            if result['queries_max'] > old['queries_max']:
+                regressions.append(
+                    '%s at %d products: %d queries, was %d' % (
+                        name, run['products'], result['queries_max'],
+                        old['queries_max']))
+    return regressions
@@ -0,0 +1,73 @@
+"""
+Batched writes for catalogue-wide changes.
+
+Django 1.9 has no ``QuerySet.bulk_update()``, so ``bulk_update()`` here
+issues one ``UPDATE ... SET field = CASE pk WHEN ... END`` per batch. The
+statement is written directly, building the equivalent ``Case``/``When``
+expressions costs more CPU than the database spends running it.
+Bulk writes skip model signals; callers announce them with
+``shop.signals.products_bulk_changed`` instead. The change log entries of
+``bulk_update()`` are written with it, see shop.changelog.
+"""
+from itertools import islice
+
+from django.db import connections, router, transaction
+
+from .models import ChangeLogEntry, ChangeLoggedMixin
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(objs, fields, batch_size=None):
+    """
+    Writes ``fields`` of every object in ``objs`` back to the database and
+    returns the number of rows matched.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    model = type(objs[0])
+    db = router.db_for_write(model)
+    connection = connections[db]
+    quote = connection.ops.quote_name
+    model_fields = [model._meta.get_field(name) for name in fields]
+    pk_field = model._meta.pk
+    # Every object binds its pk once per field plus each value.
+    max_batch_size = connection.ops.bulk_batch_size(
+        [None] * (1 + 2 * len(model_fields)), objs)
+    batch_size = min(batch_size or max_batch_size, max_batch_size)
+    rows = 0
+    with transaction.atomic(using=db), connection.cursor() as cursor:
+        for batch in chunked(objs, batch_size):
+            assignments, params = [], []
+            pks = [pk_field.get_db_prep_value(obj.pk, connection)
+                   for obj in batch]
+            for field in model_fields:
+                value = '%s'
+                if connection.vendor == 'postgresql':
+                    # Untyped parameters would otherwise be read as text.
+                    value = 'CAST(%%s AS %s)' % field.db_type(connection)
+                assignments.append('%s = CASE %s %s END' % (
+                    quote(field.column), quote(pk_field.column),
+                    ' '.join(['WHEN %%s THEN %s' % value] * len(batch))))
+                for pk, obj in zip(pks, batch):
+                    params += [pk, field.get_db_prep_save(
+                        getattr(obj, field.attname), connection)]
+            cursor.execute('UPDATE %s SET %s WHERE %s IN (%s)' % (
+                quote(model._meta.db_table), ', '.join(assignments),
+                quote(pk_field.column), ', '.join(['%s'] * len(batch))),
+                params + pks)
+            rows += cursor.rowcount
+        if issubclass(model, ChangeLoggedMixin):
+            ChangeLogEntry.objects.record(
+                model, [obj.pk for obj in objs], ChangeLogEntry.UPDATE,
+                [name for name in fields
+                 if name not in model.changelog_ignored_fields])
+    return rows
@@ -0,0 +1,272 @@
+"""
+Versioned cache for rendered catalogue pages.
+
+Every cached page is keyed on the current version token of the namespaces it
+depends on (``categories``, ``products``, ``category:<slug>``,
+``product:<id>``). Save and delete signals replace those tokens, so stale
+pages simply stop being looked up and no TTL is needed. They replace them
+again once the change commits: a request that read the first new token but
+the rows committed before would otherwise keep its page for good.
+
+A bump only reaches the processes that share the backend. ``LRUCacheBackend``
+lives in one process, which is right for ``runserver`` alone: the pages of
+every other process, and what management commands or ``run_workers`` change
+from theirs, stay as they were until it restarts. Anything else needs
+``DjangoCacheBackend`` on a cache every process shares.
+"""
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from .routers import replica_used
+
+
+class LRUCacheBackend(object):
+    """
+    In-process LRU store, suitable when a single worker serves the shop.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def set_many(self, data):
+        with self._lock:
+            for key, value in data.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value):
+        with self._lock:
+            if key in self._data:
+                return False
+        self.set_many({key: value})
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend(object):
+    """
+    Stores entries in one of the ``CACHES`` aliases (memcached, redis...) so
+    that versions and pages are shared by every gunicorn worker.
+    """
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_many(self, keys):
+        return self.cache.get_many(keys)
+
+    def set_many(self, data):
+        self.cache.set_many(data, timeout=self.timeout)
+
+    def add(self, key, value):
+        return self.cache.add(key, value, timeout=self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class CatalogueCache(object):
+
+    key_prefix = 'shop'
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _version_key(self, namespace):
+        return '%s:version:%s' % (self.key_prefix, namespace)
+
+    def versions(self, namespaces):
+        keys = [self._version_key(ns) for ns in namespaces]
+        found = self.backend.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            for key in missing:
+                self.backend.add(key, _new_token())
+            found.update(self.backend.get_many(missing))
+        return [found.get(key, '') for key in keys]
+
+    def bump(self, *namespaces):
+        self.backend.set_many(dict(
+            (self._version_key(ns), _new_token()) for ns in namespaces
+        ))
+
+    def make_key(self, name, namespaces, *parts):
+        digest = hashlib.md5(
+            '\n'.join(str(part) for part in parts).encode('utf-8')
+        ).hexdigest()
+        return '%s:%s:%s:%s' % (self.key_prefix, name,
+                                '.'.join(self.versions(namespaces)), digest)
+
+    def get(self, key):
+        value = self.backend.get_many([key]).get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.backend.set_many({key: value})
+
+    def changed_within(self, namespaces, seconds):
+        return any(_token_age(token) < seconds
+                   for token in self.versions(namespaces))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+def bump_on_commit(*namespaces):
+    """
+    Bumps ``namespaces`` now and once more when the current transaction
+    commits, which is at once outside of one.
+    """
+    cache = get_catalogue_cache()
+    cache.bump(*namespaces)
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: cache.bump(*namespaces))
+
+
+def category_namespace(slug):
+    return 'category:%s' % slug
+
+
+def product_namespace(product_id):
+    return 'product:%s' % product_id
+
+
+def _new_token():
+    # The hex timestamp prefix tells how long ago a namespace changed.
+    return '%08x%s' % (int(time.time()), uuid.uuid4().hex[:8])
+
+
+def _token_age(token):
+    try:
+        return time.time() - int(token[:8], 16)
+    except ValueError:
+        return float('inf')
+
+
+_catalogue_cache = None
+
+
+def check_shared_backend():
+    """
+    Raises ``ImproperlyConfigured`` when ``SHOP_CACHE`` only lives in this
+    process, to call before starting several that must see each other's
+    bumps.
+    """
+    backend = get_catalogue_cache().backend
+    if (isinstance(backend, LRUCacheBackend) or
+            (isinstance(backend, DjangoCacheBackend) and
+             isinstance(backend.cache, LocMemCache))):
+        raise ImproperlyConfigured(
+            'SHOP_CACHE is not shared between processes, the pages cached '
+            'by one would never see the changes made by another.')
+
+
+def get_catalogue_cache():
+    global _catalogue_cache
+    if _catalogue_cache is None:
+        config = settings.SHOP_CACHE
+        backend_class = import_string(config['BACKEND'])
+        backend = backend_class(**config.get('OPTIONS', {}))
+        _catalogue_cache = CatalogueCache(backend)
+    return _catalogue_cache
+
+
+@receiver(setting_changed)
+def _reset_catalogue_cache(sender, setting, **kwargs):
+    global _catalogue_cache
+    if setting == 'SHOP_CACHE':
+        _catalogue_cache = None
+
+
+def has_session(request):
+    # Such a visitor may have a cart, which every page counts, see
+    # cart.context_processors.
+    return settings.SESSION_COOKIE_NAME in request.COOKIES
+
+
+def _is_cacheable(request, response):
+    # Pages that touched the session or a CSRF token belong to one visitor.
+    session = getattr(request, 'session', None)
+    return (response.status_code == 200 and
+            not response.streaming and
+            not response.cookies and
+            not request.META.get('CSRF_COOKIE_USED') and
+            not (session is not None and session.accessed))
+
+
+def cache_catalogue_page(namespaces):
+    """
+    Serves the rendered body of a GET from the catalogue cache.
+
+    ``namespaces`` is called with the view's URL arguments and returns the
+    version namespaces the page depends on. Visitors with a session always
+    get a page of their own.
+    """
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or has_session(request):
+                return view(request, *args, **kwargs)
+            cache = get_catalogue_cache()
+            key = cache.make_key(view.__name__,
+                                 namespaces(*args, **kwargs),
+                                 request.get_full_path())
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+            response = view(request, *args, **kwargs)
+            # A replica may not have caught up with a recent change yet, and
+            # its page would stay cached until the next one.
+            stale = (replica_used() and
+                     cache.changed_within(namespaces(*args, **kwargs),
+                                          settings.SHOP_REPLICA_MAX_LAG))
+            if _is_cacheable(request, response) and not stale:
+                cache.set(key, (response.content, response['Content-Type']))
+            return response
+        return inner
+    return decorator
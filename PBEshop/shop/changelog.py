@@ -0,0 +1,144 @@
+"""
+Change data capture for the catalogue.
+
+Every write to ``Category`` and ``Product`` adds ``ChangeLogEntry`` rows in
+its own transaction: ``save()`` and ``delete()`` through the receivers in
+shop.signals, queryset ``update()`` through ``ChangeLoggedQuerySet`` and
+``shop.bulk.bulk_update()`` itself. ``bulk_create()`` cannot tell the new
+ids on every database, its callers record what they created. Entries say
+which row changed and, when known, which fields, never the values: a
+consumer reads the current row, or learns it is gone.
+
+A ``Consumer`` reads the entries after the position it last committed, in
+batches::
+
+    consumer = Consumer('search')
+    for entries in consumer.batches():
+        reindex(entries)
+        consumer.commit()
+
+and starts over from there if it dies before committing, so processing an
+entry twice must be harmless. ``prune()`` drops what every consumer has
+committed, so a new consumer does a full sync instead of reading the log
+from its beginning, after ``seek(latest())``.
+
+Ids are handed out when a transaction writes, not when it commits, so an id
+can show up after a higher one. A consumer stops in front of a gap in the
+ids until the entry after it is ``SHOP_CHANGELOG_SETTLE`` seconds old; a
+gap that lasts longer was left by a rollback.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import ChangeLogConsumer, ChangeLogEntry
+
+
+def changed_fields(instance):
+    """
+    Names of the fields a save of ``instance`` changed, empty when its
+    loaded values are unknown.
+    """
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return []
+    return [field.name for field in instance._meta.concrete_fields
+            if field.attname in loaded and
+            field.name not in instance.changelog_ignored_fields and
+            loaded[field.attname] != getattr(instance, field.attname)]
+
+
+def row_saved(instance, created):
+    if created:
+        ChangeLogEntry.objects.record(type(instance), [instance.pk],
+                                      ChangeLogEntry.CREATE)
+    else:
+        ChangeLogEntry.objects.record(type(instance), [instance.pk],
+                                      ChangeLogEntry.UPDATE,
+                                      changed_fields(instance))
+
+
+def row_deleted(instance):
+    ChangeLogEntry.objects.record(type(instance), [instance.pk],
+                                  ChangeLogEntry.DELETE)
+
+
+def latest():
+    """
+    The id of the newest entry, 0 for none.
+    """
+    return ChangeLogEntry.objects.aggregate(pk=Max('pk'))['pk'] or 0
+
+
+class Consumer(object):
+
+    def __init__(self, name, batch_size=500):
+        self.name = name
+        self.batch_size = batch_size
+        self.position = self.committed()
+
+    def committed(self):
+        """
+        The id of the last entry this consumer committed, 0 for none.
+        """
+        return ChangeLogConsumer.objects.filter(name=self.name) \
+                                        .values_list('position', flat=True) \
+                                        .first() or 0
+
+    def seek(self, position):
+        self.position = position
+
+    def read(self, limit=None):
+        """
+        Returns up to ``limit`` entries after ``position`` and moves past
+        them.
+        """
+        entries = list(ChangeLogEntry.objects.filter(pk__gt=self.position)
+                                             .order_by('pk')
+                                             [:limit or self.batch_size])
+        settled = timezone.now() - datetime.timedelta(
+            seconds=settings.SHOP_CHANGELOG_SETTLE)
+        expected = self.position + 1
+        for i, entry in enumerate(entries):
+            if entry.pk != expected and entry.created > settled:
+                # The missing ids may still be committed.
+                entries = entries[:i]
+                break
+            expected = entry.pk + 1
+        if entries:
+            self.position = entries[-1].pk
+        return entries
+
+    def batches(self):
+        while True:
+            entries = self.read()
+            if not entries:
+                return
+            yield entries
+
+    def commit(self):
+        """
+        Remembers ``position`` as processed, unless a later one already is.
+        """
+        with transaction.atomic():
+            consumer, created = ChangeLogConsumer.objects \
+                .select_for_update().get_or_create(
+                    name=self.name, defaults={'position': self.position})
+            if not created and consumer.position < self.position:
+                consumer.position = self.position
+                consumer.save(update_fields=['position', 'updated'])
+
+
+def prune():
+    """
+    Deletes the entries every consumer committed and returns how many.
+    """
+    position = ChangeLogConsumer.objects.aggregate(
+        position=Min('position'))['position']
+    if not position:
+        return 0
+    deleted, _ = ChangeLogEntry.objects.filter(pk__lte=position).delete()
+    return deleted
@@ -0,0 +1,80 @@
+"""
+ETag values for catalogue pages.
+
+The tag of a listing comes from one aggregate query over
+``ProductListing.updated``, that of a product page from ``Product.updated``,
+each memoised on the request. Pages of visitors with a session show their
+cart and get none.
+
+There is no Last-Modified: deleting a product or renaming a category
+changes a page without moving any ``updated`` forward, and
+If-Modified-Since alone would answer 304 for it. The tags also include the
+count of listings and the version of the categories, which catch those.
+"""
+import hashlib
+from functools import wraps
+
+from django.db.models import Count, Max
+
+from .cache import get_catalogue_cache, has_session
+from .models import Product, ProductListing
+
+
+def _memoise(request, name, compute):
+    attr = '_shop_%s' % name
+    if not hasattr(request, attr):
+        setattr(request, attr, compute())
+    return getattr(request, attr)
+
+
+def _anonymous(function):
+    @wraps(function)
+    def inner(request, *args, **kwargs):
+        if has_session(request):
+            return None
+        return function(request, *args, **kwargs)
+    return inner
+
+
+def _etag(*parts):
+    # Category renames do not touch Product.updated, so the catalogue
+    # version of the categories is part of every tag.
+    parts += tuple(get_catalogue_cache().versions(['categories']))
+    return hashlib.sha1(
+        '\n'.join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+
+
+def listing_state(request, category_slug=None):
+    def compute():
+        products = ProductListing.objects.all()
+        if category_slug:
+            products = products.filter(category_slug=category_slug)
+        return products.aggregate(updated=Max('updated'), count=Count('id'))
+    return _memoise(request, 'listing_state', compute)
+
+
+@_anonymous
+def listing_etag(request, category_slug=None):
+    state = listing_state(request, category_slug)
+    if state['updated'] is None:
+        return None
+    # The count catches deletions, which leave Max('updated') unchanged.
+    return _etag(state['updated'].isoformat(), state['count'],
+                 request.get_full_path())
+
+
+def detail_updated(request, id, slug):
+    return _memoise(request, 'detail_updated', lambda: (
+        Product.objects.filter(id=id, slug=slug, available=True)
+                       .values_list('updated', flat=True)
+                       .first()
+    ))
+
+
+@_anonymous
+def detail_etag(request, id, slug):
+    updated = detail_updated(request, id, slug)
+    if updated is None:
+        return None
+    return _etag(id, updated.isoformat())
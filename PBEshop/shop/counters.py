@@ -0,0 +1,67 @@
+"""
+Maintenance of ``Category.product_count``, the number of available products
+in each category.
+"""
+from django.db.models import Case, Count, F, IntegerField, Value, When
+
+from .bulk import chunked
+from .cache import bump_on_commit
+from .models import Category, Product
+
+
+def _adjust(deltas):
+    changed = False
+    for category_id, delta in deltas.items():
+        if category_id is not None and delta:
+            Category.objects.filter(pk=category_id).update(
+                product_count=F('product_count') + delta)
+            changed = True
+    if changed:
+        # Every listing shows the counters in its category sidebar.
+        bump_on_commit('categories')
+
+
+def product_saved(product, created):
+    if not created and not hasattr(product, '_loaded_values'):
+        rebuild_category_counters([product.category_id])
+        bump_on_commit('categories')
+        return
+    deltas = {}
+    if not created and product.get_loaded_value('available'):
+        old_category_id = product.get_loaded_value('category_id')
+        deltas[old_category_id] = deltas.get(old_category_id, 0) - 1
+    if product.available:
+        deltas[product.category_id] = deltas.get(product.category_id, 0) + 1
+    _adjust(deltas)
+
+
+def product_deleted(product):
+    if product.get_loaded_value('available', product.available):
+        _adjust({product.get_loaded_value('category_id',
+                                          product.category_id): -1})
+
+
+def rebuild_category_counters(category_ids=None, batch_size=500):
+    """
+    Recounts available products with one grouped query and writes the
+    counters back with one ``UPDATE ... CASE``, per batch of categories.
+    Returns the number of categories written.
+    """
+    if category_ids is None:
+        category_ids = Category.objects.order_by('pk') \
+                                       .values_list('pk', flat=True)
+    written = 0
+    for batch in chunked(category_ids, batch_size):
+        counts = dict(Product.objects.filter(available=True,
+                                             category__in=batch)
+                                     .order_by()
+                                     .values_list('category')
+                                     .annotate(count=Count('id')))
+        written += Category.objects.filter(pk__in=batch).update(
+            product_count=Case(
+                *[When(pk=pk, then=Value(counts.get(pk, 0)))
+                  for pk in batch],
+                default=Value(0),
+                output_field=IntegerField()
+            ))
+    return written
@@ -0,0 +1,29 @@
+"""
+Per-connection database setup.
+
+Out of the box SQLite keeps a rollback journal, so every write blocks every
+reader, and syncs to disk on each commit. ``configure_sqlite`` is
+connected to ``connection_created`` and applies ``SHOP_SQLITE_PRAGMAS`` to
+every new SQLite connection: WAL lets readers carry on during a write,
+``synchronous=NORMAL`` is durable enough in WAL mode, ``mmap_size`` serves
+reads from the page cache and ``busy_timeout`` makes a writer wait for the
+lock instead of failing at once.
+"""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    cursor = connection.connection.cursor()
+    try:
+        for name, value in settings.SHOP_SQLITE_PRAGMAS:
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+    finally:
+        cursor.close()
+
+
+def sqlite_pragma(connection, name):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA %s' % name)
+        return cursor.fetchone()[0]
@@ -0,0 +1,116 @@
+"""
+Streaming catalogue export.
+
+Rows are read in primary key order, ``chunk_size`` at a time, seeking past
+the last key of the previous chunk, and turned into text lines one by one,
+so memory use stays flat however large the catalogue is. The CSV and JSONL
+columns are the ones ``import_catalogue`` reads.
+
+Sitemaps may list at most 50,000 URLs each, so the catalogue is split into
+parts of ``SITEMAP_URLS`` consecutive primary keys that a sitemap index
+points to. A part never reads more than its own range of keys.
+"""
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.urlresolvers import reverse
+from django.db.models import Max
+from django.utils.html import escape
+
+from .models import Product
+
+EXPORT_FIELDS = (
+    ('id', 'id'),
+    ('category__slug', 'category_slug'),
+    ('category__name', 'category_name'),
+    ('name', 'name'),
+    ('slug', 'slug'),
+    ('description', 'description'),
+    ('price', 'price'),
+    ('stock', 'stock'),
+    ('available', 'available'),
+    ('updated', 'updated'),
+)
+
+COLUMNS = [column for _, column in EXPORT_FIELDS]
+
+# Primary keys, and so at most URLs, per sitemap part.
+SITEMAP_URLS = 50000
+
+
+def iter_products(queryset=None, chunk_size=1000):
+    if queryset is None:
+        queryset = Product.objects.filter(available=True)
+    queryset = queryset.values(*[field for field, _ in EXPORT_FIELDS]) \
+                       .order_by('pk')
+    last_pk = 0
+    while True:
+        rows = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        for row in rows:
+            yield dict((column, row[field]) for field, column in EXPORT_FIELDS)
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1]['id']
+
+
+class _Echo(object):
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([row[column] for column in COLUMNS])
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def sitemap_lines(rows, base_url):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for row in rows:
+        url = reverse('shop:product_detail', args=[row['id'], row['slug']])
+        yield ('<url><loc>%s%s</loc><lastmod>%s</lastmod></url>\n' % (
+            escape(base_url), escape(url), row['updated'].date().isoformat()))
+    yield '</urlset>\n'
+
+
+def sitemap_parts():
+    """
+    Returns how many sitemap parts the available products need.
+    """
+    last_pk = Product.objects.filter(available=True) \
+                             .aggregate(last_pk=Max('pk'))['last_pk'] or 0
+    return max(1, (last_pk + SITEMAP_URLS - 1) // SITEMAP_URLS)
+
+
+def sitemap_part_products(part, chunk_size=1000):
+    """
+    Reads the available products of sitemap part ``part``, counted from 1.
+    """
+    low = (part - 1) * SITEMAP_URLS
+    return iter_products(Product.objects.filter(available=True, pk__gt=low,
+                                                pk__lte=low + SITEMAP_URLS),
+                         chunk_size)
+
+
+def sitemap_index_lines(urls):
+    yield ('<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<sitemapindex '
+           'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+    for url in urls:
+        yield '<sitemap><loc>%s</loc></sitemap>\n' % escape(url)
+    yield '</sitemapindex>\n'
+
+
+FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'jsonl': ('application/x-ndjson', jsonl_lines),
+}
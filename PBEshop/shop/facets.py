@@ -0,0 +1,127 @@
+"""
+Faceted filtering of product listings.
+
+Listings can be narrowed to price ranges (``?price=50-100``, repeatable, the
+ranges come from ``SHOP_PRICE_RANGES``) and to products in stock
+(``?in_stock=1``), on top of the category of the URL. Each facet counts the
+products its values would show with every other facet's filter applied but
+its own, which is what a visitor gets after clicking the value.
+
+The price and stock counts come from one aggregate over the current
+category, with one conditional ``SUM`` per price range and stock state.
+The category counts need a second query, grouped by category, only while
+a facet filter is active, otherwise they are ``Category.product_count``.
+Listings are either ``ProductListing`` or ``Product`` querysets.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Case, Count, IntegerField, Q, Sum, Value, When
+
+from .models import Category, ProductListing
+
+
+class PriceRange(object):
+
+    def __init__(self, low, high):
+        self.low = Decimal(low) if low is not None else None
+        self.high = Decimal(high) if high is not None else None
+        self.key = '%s-%s' % (low or 0, high or '')
+
+    def q(self):
+        q = Q()
+        if self.low is not None:
+            q &= Q(price__gte=self.low)
+        if self.high is not None:
+            q &= Q(price__lt=self.high)
+        return q
+
+    def __repr__(self):
+        return '<PriceRange %s>' % self.key
+
+
+def price_ranges():
+    return [PriceRange(low, high) for low, high in settings.SHOP_PRICE_RANGES]
+
+
+def parse_filters(query):
+    """
+    Reads the facet filters from a ``QueryDict``, ignoring unknown values.
+    """
+    ranges = dict((r.key, r) for r in price_ranges())
+    return {
+        'price': [ranges[key] for key in query.getlist('price')
+                  if key in ranges],
+        'in_stock': query.get('in_stock') in ('1', 'true', 'on'),
+    }
+
+
+def _price_q(filters):
+    q = Q()
+    for price_range in filters['price']:
+        q |= price_range.q()
+    return q
+
+
+def _in_stock_q(model):
+    if model is ProductListing:
+        return Q(in_stock=True)
+    return Q(stock__gt=0)
+
+
+def _stock_q(filters, model):
+    return _in_stock_q(model) if filters['in_stock'] else Q()
+
+
+def filter_products(products, filters):
+    return products.filter(_price_q(filters),
+                           _stock_q(filters, products.model))
+
+
+def _count_if(q):
+    if not q:
+        return Count('id')
+    return Sum(Case(When(q, then=Value(1)), default=Value(0),
+                    output_field=IntegerField()))
+
+
+def facet_counts(products, filters, category=None):
+    """
+    Counts the facet values of ``products``, the available products before
+    any facet or category filter, and returns::
+
+        {'categories': {category id: count},
+         'price': [(price range, count, selected)],
+         'in_stock': count}
+
+    Price and stock values are counted within ``category``.
+    """
+    ranges = price_ranges()
+    selected = set(price_range.key for price_range in filters['price'])
+    price_q = _price_q(filters)
+    stock_q = _stock_q(filters, products.model)
+    if price_q or stock_q:
+        rows = products.order_by().values_list('category') \
+                       .annotate(count=_count_if(price_q & stock_q))
+        categories = dict((category_id, count or 0)
+                          for category_id, count in rows)
+    else:
+        # Without a facet filter the sidebar shows the plain counters.
+        categories = dict(Category.objects.values_list('pk',
+                                                       'product_count'))
+
+    if category is not None:
+        products = products.filter(category=category)
+    aggregates = {
+        'in_stock_count': _count_if(price_q & _in_stock_q(products.model)),
+    }
+    for i, price_range in enumerate(ranges):
+        aggregates['price_%d' % i] = _count_if(price_range.q() & stock_q)
+    totals = products.order_by().aggregate(**aggregates)
+    return {
+        'categories': categories,
+        'price': [(price_range, totals['price_%d' % i] or 0,
+                   price_range.key in selected)
+                  for i, price_range in enumerate(ranges)],
+        'in_stock': totals['in_stock_count'] or 0,
+    }
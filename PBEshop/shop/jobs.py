@@ -0,0 +1,182 @@
+"""
+Background jobs kept in the database, for work a request should not wait
+for.
+
+``enqueue('orders.send_confirmation', {'order_id': 1})`` adds a ``Job`` row
+in the caller's transaction, so a job exists exactly when the change it is
+about was committed. ``manage.py run_workers`` processes run it with the
+function registered for its name by ``@job``, the payload as keyword
+arguments. ``jobs`` modules of installed apps are imported to find them.
+
+A worker claims a job with a conditional ``UPDATE``, like ``shop.stock``
+takes units, so two workers never both get it, and it stays theirs for
+``SHOP_JOBS['VISIBILITY_TIMEOUT']`` seconds: the job of a worker that died
+is claimed again after that. A job that raises is retried after a growing
+delay and, once out of attempts, kept as failed for the admin to look at.
+A job that ran is deleted.
+
+Jobs must be safe to run more than once, one that runs longer than the
+visibility timeout is run again by another worker.
+"""
+import datetime
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import autodiscover_modules
+
+from .models import Job, Product
+from .signals import products_bulk_changed
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def job(name):
+    """
+    Registers the decorated function to run the jobs named ``name``.
+    """
+    def decorator(function):
+        _registry[name] = function
+        return function
+    return decorator
+
+
+def autodiscover():
+    autodiscover_modules('jobs')
+
+
+def worker_name():
+    return '%s:%d:%d' % (socket.gethostname(), os.getpid(),
+                         threading.get_ident())
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None):
+    """
+    Adds a job running ``name`` with ``payload``, a dict that can be stored
+    as JSON, in ``delay`` seconds.
+    """
+    return Job.objects.create(
+        name=name,
+        payload=json.dumps(payload or {}, cls=DjangoJSONEncoder),
+        run_at=timezone.now() + datetime.timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.SHOP_JOBS['MAX_ATTEMPTS'])
+
+
+def backoff(attempts):
+    """
+    Seconds to wait before trying a job again that failed ``attempts``
+    times, doubling every time, give or take a tenth so that jobs that
+    failed together do not come back together.
+    """
+    options = settings.SHOP_JOBS
+    delay = min(options['BACKOFF'] * 2 ** (attempts - 1),
+                options['MAX_BACKOFF'])
+    return delay * random.uniform(0.9, 1.1)
+
+
+def claim(worker, limit=None):
+    """
+    Takes up to ``limit`` due jobs for ``worker`` and returns them.
+    """
+    options = settings.SHOP_JOBS
+    now = timezone.now()
+    # Timed out on their last attempt.
+    Job.objects.filter(status=Job.RUNNING, run_at__lte=now,
+                       attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, locked_by='',
+        last_error='Not finished within %ds.' % options['VISIBILITY_TIMEOUT'])
+    due = Job.objects.filter(status__in=[Job.QUEUED, Job.RUNNING],
+                             run_at__lte=now) \
+                     .values_list('pk', 'attempts')
+    deadline = now + datetime.timedelta(
+        seconds=options['VISIBILITY_TIMEOUT'])
+    claimed = []
+    for pk, attempts in due[:limit or options['BATCH_SIZE']]:
+        # Unless another worker claimed it since it was read.
+        if Job.objects.filter(pk=pk, attempts=attempts, run_at__lte=now,
+                              status__in=[Job.QUEUED, Job.RUNNING]).update(
+                status=Job.RUNNING, attempts=attempts + 1, run_at=deadline,
+                locked_by=worker):
+            claimed.append(pk)
+    return list(Job.objects.filter(pk__in=claimed).order_by('pk'))
+
+
+def run(job, worker):
+    """
+    Runs a claimed job and returns whether it succeeded.
+    """
+    # Only while the job is still ours, it may have timed out meanwhile.
+    owned = Job.objects.filter(pk=job.pk, attempts=job.attempts,
+                               locked_by=worker)
+    try:
+        function = _registry.get(job.name)
+        if function is None:
+            raise LookupError('No job is registered as %r.' % job.name)
+        function(**json.loads(job.payload))
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            logger.error('Job %s failed for good.\n%s', job, error)
+            owned.update(status=Job.FAILED, locked_by='', last_error=error)
+        else:
+            logger.warning('Job %s failed, trying again later.\n%s',
+                           job, error)
+            owned.update(status=Job.QUEUED, locked_by='', last_error=error,
+                         run_at=timezone.now() + datetime.timedelta(
+                             seconds=backoff(job.attempts)))
+        return False
+    owned.delete()
+    return True
+
+
+def unclaim(jobs, worker):
+    """
+    Gives ``jobs`` back to the queue untried.
+    """
+    Job.objects.filter(pk__in=[job.pk for job in jobs],
+                       locked_by=worker).update(
+        status=Job.QUEUED, locked_by='', attempts=F('attempts') - 1,
+        run_at=timezone.now())
+
+
+def work(worker=None, burst=False, stopping=lambda: False):
+    """
+    Runs due jobs until ``stopping()`` returns true or, with ``burst``,
+    until none is due, and returns how many ran.
+    """
+    worker = worker or worker_name()
+    count = 0
+    while not stopping():
+        close_old_connections()
+        jobs = claim(worker)
+        if not jobs:
+            if burst:
+                break
+            time.sleep(settings.SHOP_JOBS['POLL_INTERVAL'])
+            continue
+        for i, claimed in enumerate(jobs):
+            if stopping():
+                unclaim(jobs[i:], worker)
+                break
+            run(claimed, worker)
+            count += 1
+    close_old_connections()
+    return count
+
+
+@job('shop.products_changed')
+def products_changed(product_ids, category_ids):
+    products_bulk_changed.send(sender=Product, product_ids=product_ids,
+                               category_ids=set(category_ids))
@@ -0,0 +1,139 @@
+"""
+Maintenance of ``ProductListing``, the read model of catalogue listings.
+
+A listing row holds everything a listing page shows of an available product,
+so ``product_list`` never joins ``Category``, reverses a URL or names a
+thumbnail per row. Rows are rewritten from ``Product`` whenever a product
+changes, through the receivers in shop.signals, and ``category_slug`` when
+a category's slug does. ``rebuild()`` rewrites the whole table.
+
+Until its thumbnail is rendered a listing shows the original image, and
+``show_thumbnails()`` switches it over once rendering is done.
+"""
+from django.core.urlresolvers import NoReverseMatch, reverse
+from django.db import router, transaction
+from django.utils import timezone
+
+from . import bake
+from .bulk import chunked
+from .cache import bump_on_commit, category_namespace
+from .models import Product, ProductListing
+from .thumbnails import rendered_name, rendered_thumbnails
+
+# The thumbnail size listings show.
+THUMBNAIL_SIZE = 'small'
+
+FIELDS = ('pk', 'category', 'category__slug', 'name', 'slug', 'price',
+          'stock', 'image', 'updated')
+
+
+def _url(pk, slug):
+    try:
+        return reverse('shop:product_detail', args=[pk, slug])
+    except NoReverseMatch:
+        # Not a valid slug, so the product has no page to link to.
+        return ''
+
+
+def _thumbnail(image, rendered):
+    if not image:
+        return ''
+    return rendered_name(image, THUMBNAIL_SIZE, rendered) or image
+
+
+def build(rows, model=ProductListing):
+    """
+    Makes the listings of ``rows``, ``FIELDS`` values of available
+    products.
+    """
+    rows = list(rows)
+    rendered = rendered_thumbnails(*{row[7] for row in rows if row[7]})
+    return [model(id=pk, category_id=category_id, category_slug=category_slug,
+                  name=name, price=price, in_stock=stock > 0,
+                  url=_url(pk, slug),
+                  thumbnail=_thumbnail(image, rendered),
+                  updated=updated)
+            for (pk, category_id, category_slug, name, slug, price, stock,
+                 image, updated) in rows]
+
+
+def refresh(product_ids, batch_size=500):
+    """
+    Rewrites the listings of ``product_ids`` from their products, dropping
+    those that are gone or unavailable.
+    """
+    db = router.db_for_write(ProductListing)
+    with transaction.atomic(using=db):
+        for chunk in chunked(product_ids, batch_size):
+            ProductListing.objects.filter(pk__in=chunk).delete()
+            ProductListing.objects.bulk_create(build(
+                Product.objects.using(db)
+                               .filter(pk__in=chunk, available=True)
+                               .values_list(*FIELDS)))
+
+
+def rename_category(category):
+    return ProductListing.objects.filter(category=category) \
+                                 .update(category_slug=category.slug)
+
+
+def show_thumbnails(image_names, batch_size=500):
+    """
+    Points the listings that show one of ``image_names`` at its thumbnail
+    once that is rendered, and returns how many changed.
+    """
+    db = router.db_for_write(ProductListing)
+    count, slugs = 0, set()
+    now = timezone.now()
+    with transaction.atomic(using=db):
+        for chunk in chunked(image_names, batch_size):
+            shown = {}
+            rows = ProductListing.objects.filter(thumbnail__in=chunk) \
+                                         .values_list('thumbnail',
+                                                      'category_slug')
+            for image, category_slug in rows.distinct():
+                shown.setdefault(image, set()).add(category_slug)
+            rendered = rendered_thumbnails(*shown)
+            for image, category_slugs in shown.items():
+                name = rendered_name(image, THUMBNAIL_SIZE, rendered)
+                if name is not None:
+                    # Moves the listing ETags of shop.conditional on.
+                    count += ProductListing.objects.filter(thumbnail=image) \
+                                                   .update(thumbnail=name,
+                                                           updated=now)
+                    slugs.update(category_slugs)
+        if count:
+            bump_on_commit('products',
+                           *[category_namespace(slug) for slug in slugs])
+    if count and bake.enabled():
+        bake.discard([reverse('shop:product_list')] + [
+            reverse('shop:product_list_by_category', args=[slug])
+            for slug in slugs])
+    return count
+
+
+def copy(products, model=ProductListing, batch_size=1000):
+    """
+    Writes the listings of the available ``products`` into ``model``, which
+    must be empty of them, and returns how many.
+    """
+    products = products.filter(available=True).order_by('pk') \
+                       .values_list(*FIELDS)
+    count, last_pk = 0, 0
+    while True:
+        rows = list(products.filter(pk__gt=last_pk)[:batch_size])
+        if not rows:
+            return count
+        model.objects.bulk_create(build(rows, model))
+        count += len(rows)
+        last_pk = rows[-1][0]
+
+
+def rebuild(batch_size=1000):
+    """
+    Rewrites every listing and returns how many there are.
+    """
+    db = router.db_for_write(ProductListing)
+    with transaction.atomic(using=db):
+        ProductListing.objects.all().delete()
+        return copy(Product.objects.using(db), batch_size=batch_size)
@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ... import bake
+
+
+def _bake(args):
+    path, root = args
+    try:
+        return path, bake.bake_page(path, root), None
+    except Exception as e:
+        return path, False, str(e)
+
+
+class Command(BaseCommand):
+    help = ('Renders the listings and product pages that changed since the '
+            'last run to static HTML for the web server, in parallel.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=None,
+                            help='Output directory (default: SHOP_BAKE_ROOT)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CPU count), '
+                                 '1 renders in this process')
+        parser.add_argument('--force', action='store_true',
+                            help='Render every page again, e.g. after a '
+                                 'template change')
+
+    def handle(self, *args, **options):
+        root = options['root'] or settings.SHOP_BAKE_ROOT
+        os.makedirs(root, exist_ok=True)
+        started = time.time()
+        manifest, changed, removed = bake.plan(root, options['force'])
+        bake.discard(removed, root)
+
+        jobs = [(path, root) for path in changed]
+        baked = failed = 0
+        for path, written, error in self.map(_bake, jobs, options['workers']):
+            if written:
+                baked += 1
+                continue
+            # Left to Django, and tried again next time.
+            del manifest[path]
+            if error:
+                failed += 1
+                self.stderr.write('%s: %s' % (path, error))
+        bake.save_manifest(root, manifest)
+        bake.remove_empty_directories(root)
+        self.stdout.write(
+            'Baked %d of %d pages in %.1fs, removed %d, %d failed.' % (
+                baked, len(manifest) + failed, time.time() - started,
+                len(removed), failed))
+
+    def map(self, function, jobs, workers):
+        if workers == 1:
+            for job in jobs:
+                yield function(job)
+            return
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(function, jobs, chunksize=32):
+                yield result
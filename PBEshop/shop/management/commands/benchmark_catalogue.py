@@ -0,0 +1,96 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from ... import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Times the catalogue views on generated catalogues of each '
+            'size, each in a fresh test database, and writes the latency '
+            'percentiles and query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000',
+                            help='Comma separated product counts, '
+                                 'e.g. 1000,100000,1000000')
+        parser.add_argument('--products-per-category', type=int,
+                            default=1000)
+        parser.add_argument('--iterations', type=int, default=50,
+                            help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Untimed requests per scenario')
+        parser.add_argument('--cached', action='store_true',
+                            help='Serve pages from the catalogue cache')
+        parser.add_argument('--output', help='JSON results file')
+        parser.add_argument('--compare',
+                            help='Results file of an earlier run; fails on '
+                                 'p95 or query count regressions')
+        parser.add_argument('--tolerance', type=float, default=1.2,
+                            help='p95 growth allowed by --compare')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be comma separated integers.')
+        if options['iterations'] < 1:
+            raise CommandError('--iterations must be at least 1.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        results = {'environment': benchmark.environment(),
+                   'cached': options['cached'],
+                   'runs': []}
+        setup_test_environment()
+        try:
+            for size in sizes:
+                results['runs'].append(self.run(size, options))
+        finally:
+            teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+        if baseline is not None:
+            regressions = benchmark.compare_results(baseline, results,
+                                                    options['tolerance'])
+            for line in regressions:
+                self.stderr.write(line)
+            if regressions:
+                raise CommandError('%d regressions against %s.' % (
+                    len(regressions), options['compare']))
+
+    def run(self, size, options):
+        categories = max(1, size // options['products_per_category'])
+        old_name = connection.creation.create_test_db(verbosity=0,
+                                                      autoclobber=True)
+        try:
+            started = time.time()
+            benchmark.generate_catalogue(categories, size)
+            generated = time.time() - started
+            scenarios = benchmark.run_benchmark(options['iterations'],
+                                                options['warmup'],
+                                                options['cached'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write('%d products in %d categories, generated in %.1fs'
+                          % (size, categories, generated))
+        for name, result in sorted(scenarios.items()):
+            self.stdout.write(
+                '  %-26s p50 %8.1fms  p95 %8.1fms  p99 %8.1fms  '
+                '%d-%d queries' % (name, result['p50_ms'], result['p95_ms'],
+                                   result['p99_ms'], result['queries_min'],
+                                   result['queries_max']))
+        return {'products': size,
+                'categories': categories,
+                'generate_seconds': round(generated, 3),
+                'scenarios': scenarios}
@@ -0,0 +1,183 @@
+import json
+import multiprocessing
+import random
+import time
+from urllib.error import URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.db import connection, connections, OperationalError, transaction
+from django.db.models import F
+from django.test import Client, override_settings
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from ... import benchmark, sessions
+from ...db import sqlite_pragma
+from ...models import Product
+
+# What SQLite does without shop.db, for comparison.
+DEFAULT_SQLITE_PRAGMAS = (
+    ('journal_mode', 'DELETE'),
+    ('synchronous', 'FULL'),
+    ('mmap_size', 0),
+    ('busy_timeout', 5000),
+)
+
+SESSION_ENGINES = {
+    'shop': 'shop.sessions',
+    'db': 'django.contrib.sessions.backends.db',
+}
+
+
+def _read(paths, deadline, url, results, cart_paths=(), cart_adds=0):
+    rng = random.Random()
+    client = Client()
+    requests = errors = 0
+    while time.time() < deadline:
+        try:
+            if cart_paths and rng.random() < cart_adds:
+                # Writes the visitor's session.
+                path = rng.choice(cart_paths)
+                if client.post(path, {'quantity': 1}).status_code != 302:
+                    raise AssertionError('POST %s failed' % path)
+            elif url:
+                urlopen(url + paths[requests % len(paths)]).read()
+            else:
+                path = paths[requests % len(paths)]
+                if client.get(path).status_code != 200:
+                    raise AssertionError('GET %s failed' % path)
+            requests += 1
+        except (OperationalError, URLError):
+            errors += 1
+    sessions.flush_all()
+    connection.close()
+    results.put(('read', requests, errors))
+
+
+def _write(product_ids, deadline, results):
+    rng = random.Random()
+    writes = errors = 0
+    while time.time() < deadline:
+        try:
+            # What a checkout does to the row, without changing it.
+            with transaction.atomic():
+                Product.objects.filter(pk=rng.choice(product_ids)) \
+                               .update(stock=F('stock'))
+            writes += 1
+        except OperationalError:
+            errors += 1
+    connection.close()
+    results.put(('write', writes, errors))
+
+
+class Command(BaseCommand):
+    help = ('Measures catalogue read throughput of concurrent worker '
+            'processes, optionally against concurrent writers, on the '
+            'configured database. Fill it with generate_catalogue first.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Reading processes, like gunicorn workers')
+        parser.add_argument('--writers', type=int, default=0,
+                            help='Processes updating product rows')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Seconds to run')
+        parser.add_argument('--sqlite-pragmas', default='tuned',
+                            choices=['tuned', 'default'],
+                            help="'default' runs SQLite without "
+                                 "SHOP_SQLITE_PRAGMAS for comparison")
+        parser.add_argument('--cart-adds', type=float, default=0.0,
+                            help='Share of the in-process requests that add '
+                                 'to the cart, writing the session')
+        parser.add_argument('--session-engine', default='shop',
+                            choices=sorted(SESSION_ENGINES),
+                            help="'db' stores sessions like Django does out "
+                                 "of the box, for comparison")
+        parser.add_argument('--url',
+                            help='Base URL of a running server, e.g. '
+                                 'http://127.0.0.1:8000, to request pages '
+                                 'from instead of the in-process client')
+        parser.add_argument('--output', help='Append the result as JSON')
+
+    def handle(self, *args, **options):
+        overrides = {
+            'SHOP_CACHE': benchmark.UNCACHED,
+            'SESSION_ENGINE': SESSION_ENGINES[options['session_engine']],
+        }
+        if options['sqlite_pragmas'] == 'default':
+            overrides['SHOP_SQLITE_PRAGMAS'] = DEFAULT_SQLITE_PRAGMAS
+        setup_test_environment()
+        try:
+            with override_settings(**overrides):
+                for conn in connections.all():
+                    conn.close()
+                result = self.run(options)
+        finally:
+            teardown_test_environment()
+            for conn in connections.all():
+                conn.close()
+
+        self.stdout.write(
+            '%(database)s (%(journal_mode)s), %(session_engine)s sessions, '
+            '%(workers)d workers, %(writers)d writers: '
+            '%(reads_per_second).1f reads/s, '
+            '%(writes_per_second).1f writes/s, %(read_errors)d read and '
+            '%(write_errors)d write errors' % result)
+        if options['output']:
+            with open(options['output'], 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, sort_keys=True) + '\n')
+
+    def run(self, options):
+        paths = []
+        for name, scenario_paths, staff in benchmark.scenarios():
+            if not staff:
+                paths += scenario_paths
+        product_ids = list(Product.objects.values_list('pk', flat=True)[:1000])
+        if not product_ids:
+            raise CommandError('No products, run generate_catalogue first.')
+        journal_mode = (sqlite_pragma(connection, 'journal_mode')
+                        if connection.vendor == 'sqlite' else None)
+        url = (options['url'] or '').rstrip('/')
+        cart_paths = []
+        if options['cart_adds'] and not url:
+            cart_paths = [reverse('cart:cart_add', args=[pk])
+                          for pk in Product.objects.filter(available=True)
+                                                   .values_list('pk', flat=True)
+                                                   [:100]]
+        connection.close()
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.time() + options['duration']
+        processes = [context.Process(target=_read,
+                                     args=(paths, deadline, url, results,
+                                           cart_paths, options['cart_adds']))
+                     for _ in range(options['workers'])]
+        processes += [context.Process(target=_write,
+                                      args=(product_ids, deadline, results))
+                      for _ in range(options['writers'])]
+        for process in processes:
+            process.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in processes:
+            kind, count, errors = results.get()
+            totals[kind][0] += count
+            totals[kind][1] += errors
+        for process in processes:
+            process.join()
+
+        return {
+            'database': connection.vendor,
+            'journal_mode': journal_mode,
+            'session_engine': options['session_engine'],
+            'cart_adds': options['cart_adds'],
+            'workers': options['workers'],
+            'writers': options['writers'],
+            'duration': options['duration'],
+            'reads_per_second': totals['read'][0] / options['duration'],
+            'writes_per_second': totals['write'][0] / options['duration'],
+            'read_errors': totals['read'][1],
+            'write_errors': totals['write'][1],
+        }
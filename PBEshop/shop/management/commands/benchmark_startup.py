@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+
+from ... import benchmark
+from ...models import Product
+
+# Runs in a fresh interpreter per sample: imports the WSGI application the
+# way a worker does, then requests every path twice.
+WORKER = '''
+import io, json, sys, time
+
+started = time.time()
+from PBEshop.wsgi import application
+result = {'startup': (time.time() - started) * 1000, 'paths': []}
+
+
+def get(path):
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+        'HTTP_HOST': 'localhost', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr, 'wsgi.multithread': False,
+        'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    statuses = []
+    started = time.time()
+    body = application(environ, lambda status, headers, exc_info=None:
+                       statuses.append(status))
+    b''.join(body)
+    if hasattr(body, 'close'):
+        body.close()
+    if not statuses[0].startswith('200'):
+        raise SystemExit('GET %s answered %s' % (path, statuses[0]))
+    return (time.time() - started) * 1000
+
+
+for path in sys.argv[1:]:
+    result['paths'].append([path, get(path), get(path)])
+print(json.dumps(result))
+'''
+
+MODES = (
+    ('lazy', '0'),
+    ('production', '1'),
+)
+
+
+def _median(values):
+    return benchmark.percentile(sorted(values), 50)
+
+
+class Command(BaseCommand):
+    help = ('Times how long a new WSGI worker takes to import the '
+            'application and to answer its first requests, with and '
+            'without the production bootstrap (see PBEshop.bootstrap).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5,
+                            help='Fresh worker processes per mode')
+        parser.add_argument('--output', help='JSON results file')
+
+    def handle(self, *args, **options):
+        if options['runs'] < 1:
+            raise CommandError('--runs must be at least 1.')
+        paths = [reverse('shop:product_list')]
+        product = Product.objects.filter(available=True) \
+                                 .select_related('category').first()
+        if product is not None:
+            paths += [product.category.get_absolute_url(),
+                      product.get_absolute_url()]
+
+        results = {'environment': benchmark.environment(), 'modes': {}}
+        for mode, production in MODES:
+            samples = [self.sample(paths, production)
+                       for _ in range(options['runs'])]
+            summary = results['modes'][mode] = {
+                'startup_ms': _median([s['startup'] for s in samples]),
+                'paths': [],
+            }
+            self.stdout.write('%s: worker ready in %.1fms' % (
+                mode, summary['startup_ms']))
+            for i, path in enumerate(paths):
+                first = _median([s['paths'][i][1] for s in samples])
+                again = _median([s['paths'][i][2] for s in samples])
+                summary['paths'].append({'path': path, 'first_ms': first,
+                                         'again_ms': again})
+                self.stdout.write('  GET %s first %.1fms, then %.1fms' % (
+                    path, first, again))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+
+    def sample(self, paths, production):
+        env = dict(os.environ, PBESHOP_PRODUCTION=production)
+        env.pop('PBESHOP_PRELOAD', None)
+        env['PYTHONPATH'] = os.pathsep.join(
+            [settings.BASE_DIR] + [p for p in [env.get('PYTHONPATH')] if p])
+        try:
+            output = subprocess.check_output(
+                [sys.executable, '-c', WORKER] + paths, env=env,
+                cwd=settings.BASE_DIR, universal_newlines=True)
+        except subprocess.CalledProcessError as e:
+            raise CommandError('The worker failed with %d.' % e.returncode)
+        return json.loads(output.strip().splitlines()[-1])
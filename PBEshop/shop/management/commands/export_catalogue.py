@@ -0,0 +1,71 @@
+import gzip
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import export
+
+
+def _part_name(output, part):
+    """
+    ``sitemap.xml.gz`` -> ``sitemap-2.xml.gz``
+    """
+    directory, name = os.path.split(output)
+    root, extension = name.split('.', 1) if '.' in name else (name, '')
+    return os.path.join(directory, '%s-%d%s' % (
+        root, part, '.' + extension if extension else ''))
+
+
+class Command(BaseCommand):
+    help = ('Writes the available products as CSV, JSONL or a sitemap, '
+            'gzipped when the output name ends with .gz. A sitemap is an '
+            'index written to the output and its parts written next to it.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write')
+        parser.add_argument('--format', default='csv',
+                            choices=['csv', 'jsonl', 'sitemap'])
+        parser.add_argument('--base-url', default='',
+                            help='Site URL the sitemap locations start with')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows read per query')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        started = time.time()
+        if options['format'] == 'sitemap':
+            base_url = options['base_url'].rstrip('/')
+            if not base_url:
+                raise CommandError('--base-url is required for sitemaps.')
+            urls = []
+            count = 0
+            for part in range(1, export.sitemap_parts() + 1):
+                name = _part_name(output, part)
+                rows = export.sitemap_part_products(part,
+                                                    options['chunk_size'])
+                count += self.write(name, export.sitemap_lines(rows,
+                                                               base_url))
+                urls.append('%s/%s' % (base_url, os.path.basename(name)))
+            count += self.write(output, export.sitemap_index_lines(urls))
+        else:
+            rows = export.iter_products(chunk_size=options['chunk_size'])
+            count = self.write(output,
+                               export.FORMATS[options['format']][1](rows))
+        self.stdout.write('Wrote %d lines to %s in %.1fs.' % (
+            count, output, time.time() - started))
+
+    def write(self, output, lines):
+        # Readers never see a half-written file.
+        partial = output + '.partial'
+        if output.endswith('.gz'):
+            f = gzip.open(partial, 'wt', encoding='utf-8', newline='')
+        else:
+            f = open(partial, 'w', encoding='utf-8', newline='')
+        count = 0
+        with f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        os.rename(partial, output)
+        return count
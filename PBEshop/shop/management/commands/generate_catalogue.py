@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmark import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = ('Adds a synthetic catalogue of generated categories and '
+            'products, for benchmarks and local load tests.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='The same seed generates the same catalogue')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Products inserted per transaction')
+
+    def handle(self, *args, **options):
+        if options['categories'] < 1:
+            raise CommandError('--categories must be at least 1.')
+        if options['products'] < 0:
+            raise CommandError('--products cannot be negative.')
+        started = time.time()
+        generate_catalogue(options['categories'], options['products'],
+                           seed=options['seed'],
+                           batch_size=options['batch_size'])
+        self.stdout.write('Generated %d categories and %d products in %.1fs.'
+                          % (options['categories'], options['products'],
+                             time.time() - started))
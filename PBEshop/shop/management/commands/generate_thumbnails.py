@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from ...listings import show_thumbnails
+from ...models import Product
+from ...thumbnails import forget_thumbnails, generate_thumbnails
+
+
+def _render(args):
+    image_name, force = args
+    try:
+        return image_name, len(generate_thumbnails(image_name, force)), None
+    except Exception as e:
+        return image_name, 0, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Renders missing thumbnails of every product image in parallel.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CPU count)')
+        parser.add_argument('--force', action='store_true',
+                            help='Render existing thumbnails again')
+
+    def handle(self, *args, **options):
+        names = list(Product.objects.exclude(image='')
+                                    .order_by()
+                                    .values_list('image', flat=True)
+                                    .distinct())
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        started = time.time()
+        written = failed = 0
+        rendered = []
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            jobs = [(name, options['force']) for name in names]
+            for name, count, error in pool.map(_render, jobs, chunksize=16):
+                if error:
+                    failed += 1
+                    self.stderr.write('%s: %s' % (name, error))
+                else:
+                    rendered.append(name)
+                written += count
+        # The workers recorded what they rendered in their own processes,
+        # which need not share this one's cache.
+        forget_thumbnails(rendered)
+        show_thumbnails(rendered)
+        self.stdout.write('Rendered %d thumbnails for %d images in %.1fs, '
+                          '%d failed.' % (written, len(names),
+                                          time.time() - started, failed))
@@ -0,0 +1,227 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from ...bulk import bulk_update, chunked
+from ...models import Category, ChangeLogEntry, Product
+from ...signals import products_bulk_changed
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+PRODUCT_FIELDS = ['name', 'description', 'price', 'stock', 'available']
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y')
+FALSE_VALUES = ('0', 'false', 'f', 'no', 'n')
+
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def read_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            row = e
+        yield number, row
+
+
+def parse_available(value):
+    if value is None or value == '':
+        return True
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise ValidationError({'available': ['Expected a boolean, got %r.' % value]})
+
+
+class Command(BaseCommand):
+    help = ('Upserts categories (by slug) and products (by category and '
+            'slug) from a CSV or JSONL file, in batched transactions.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Input format (default: from extension)')
+        # Lookups bind a parameter per category and slug of a batch, keep
+        # the default within SQLite's 999 variable limit.
+        parser.add_argument('--batch-size', type=int, default=400,
+                            help='Rows written per transaction')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['format'] or FORMATS.get(
+            os.path.splitext(path)[1].lower())
+        if input_format is None:
+            raise CommandError('Cannot tell the format of %s, '
+                               'use --format.' % path)
+        if path == '-':
+            f = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8')
+        else:
+            f = open(path, encoding='utf-8', newline='')
+        reader = read_csv if input_format == 'csv' else read_jsonl
+
+        self.created = self.updated = self.skipped = 0
+        started = time.time()
+        with f:
+            for batch in chunked(reader(f), options['batch_size']):
+                self.import_batch(batch)
+                self.report(started, options['verbosity'] > 1)
+        self.report(started, True)
+
+    def report(self, started, show):
+        if show:
+            rows = self.created + self.updated + self.skipped
+            elapsed = max(time.time() - started, 1e-6)
+            self.stdout.write(
+                '%d rows in %.1fs (%.0f rows/s): %d created, %d updated, '
+                '%d skipped' % (rows, elapsed, rows / elapsed, self.created,
+                                self.updated, self.skipped))
+
+    def skip(self, line, error):
+        self.skipped += 1
+        if isinstance(error, ValidationError):
+            error = '; '.join('%s: %s' % (field, ' '.join(messages))
+                              for field, messages in
+                              sorted(error.message_dict.items()))
+        self.stderr.write('line %d skipped: %s' % (line, error))
+
+    def clean(self, row):
+        """
+        Validates one input row with the model field validators, which do
+        not touch the database, and returns (category slug, category name,
+        unsaved product).
+        """
+        if not isinstance(row, dict):
+            raise ValidationError({'row': [str(row)]})
+        errors = {}
+        category_slug = row.get('category_slug') or ''
+        try:
+            category_slug = Category._meta.get_field('slug').clean(
+                category_slug, None)
+        except ValidationError as e:
+            errors['category_slug'] = e.messages
+        category_name = row.get('category_name') or ''
+        if category_name:
+            try:
+                category_name = Category._meta.get_field('name').clean(
+                    category_name, None)
+            except ValidationError as e:
+                errors['category_name'] = e.messages
+        try:
+            available = parse_available(row.get('available'))
+        except ValidationError as e:
+            errors.update(e.message_dict)
+            available = True
+        product = Product(name=row.get('name') or '',
+                          slug=row.get('slug') or '',
+                          description=row.get('description') or '',
+                          price=row.get('price'),
+                          stock=row.get('stock'),
+                          available=available)
+        try:
+            product.clean_fields(exclude=['category', 'image'] + list(errors))
+        except ValidationError as e:
+            errors.update(e.message_dict)
+        if errors:
+            raise ValidationError(errors)
+        return category_slug, category_name, product
+
+    def import_batch(self, batch):
+        rows = {}
+        for line, row in batch:
+            try:
+                category_slug, category_name, product = self.clean(row)
+            except ValidationError as e:
+                self.skip(line, e)
+                continue
+            # A later row for the same product wins.
+            rows[category_slug, product.slug] = (category_name, product)
+        if not rows:
+            return
+
+        names = {}
+        for (slug, _), (name, _) in rows.items():
+            names[slug] = name or names.get(slug, '')
+
+        with transaction.atomic():
+            categories = self.upsert_categories(names)
+            keys = dict(((categories[slug].pk, product_slug), product)
+                        for (slug, product_slug), (_, product)
+                        in rows.items())
+            existing = dict(
+                ((category_id, slug), pk) for pk, category_id, slug in
+                Product.objects.filter(
+                    category__in=set(pk for pk, _ in keys),
+                    slug__in=set(slug for _, slug in keys)
+                ).values_list('pk', 'category', 'slug'))
+
+            to_create, to_update = [], []
+            now = timezone.now()
+            for (category_id, slug), product in keys.items():
+                product.category_id = category_id
+                product.pk = existing.get((category_id, slug))
+                if product.pk is None:
+                    to_create.append(product)
+                else:
+                    product.updated = now
+                    to_update.append(product)
+            Product.objects.bulk_create(to_create)
+            bulk_update(to_update, PRODUCT_FIELDS + ['updated'])
+
+            product_ids = [p.pk for p in to_update]
+            if to_create:
+                created = list(Product.objects.filter(
+                    category__in=set(p.category_id for p in to_create),
+                    slug__in=set(p.slug for p in to_create),
+                    created__gte=now,
+                ).values_list('pk', flat=True))
+                ChangeLogEntry.objects.record(Product, created,
+                                              ChangeLogEntry.CREATE)
+                product_ids += created
+            products_bulk_changed.send(
+                sender=Product,
+                product_ids=product_ids,
+                category_ids=[c.pk for c in categories.values()])
+        self.created += len(to_create)
+        self.updated += len(to_update)
+
+    def upsert_categories(self, names):
+        categories = dict((c.slug, c) for c in
+                          Category.objects.filter(slug__in=list(names)))
+        missing = [Category(slug=slug, name=names[slug] or slug)
+                   for slug in names if slug not in categories]
+        for slug, category in categories.items():
+            if names[slug] and names[slug] != category.name:
+                # Renames are rare, a plain save() fires the usual signals.
+                category.name = names[slug]
+                category.save()
+        if missing:
+            Category.objects.bulk_create(missing)
+            created = list(Category.objects.filter(
+                slug__in=[c.slug for c in missing]))
+            ChangeLogEntry.objects.record(Category, [c.pk for c in created],
+                                          ChangeLogEntry.CREATE)
+            categories.update((c.slug, c) for c in created)
+        return categories
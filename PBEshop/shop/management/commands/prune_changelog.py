@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...changelog import prune
+
+
+class Command(BaseCommand):
+    help = ('Deletes the catalogue change log entries every consumer has '
+            'committed. Run it daily or so from cron.')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Deleted %d change log entries.' % prune())
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...cache import get_catalogue_cache
+from ...counters import rebuild_category_counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts the available products of every category.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Categories written per UPDATE')
+
+    def handle(self, *args, **options):
+        count = rebuild_category_counters(batch_size=options['batch_size'])
+        get_catalogue_cache().bump('categories')
+        self.stdout.write('Rebuilt counters of %d categories.' % count)
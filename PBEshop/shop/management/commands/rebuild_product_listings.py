@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from ...cache import get_catalogue_cache
+from ...listings import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rewrites the listing of every available product.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Listings written per INSERT')
+
+    def handle(self, *args, **options):
+        count = rebuild(batch_size=options['batch_size'])
+        get_catalogue_cache().bump('products')
+        self.stdout.write('Rebuilt the listings of %d products.' % count)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...stock import release_expired
+
+
+class Command(BaseCommand):
+    help = ('Puts the units of expired stock reservations back into stock. '
+            'Run it every minute or so from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Holds released per transaction')
+
+    def handle(self, *args, **options):
+        count = release_expired(batch_size=options['batch_size'])
+        self.stdout.write('Released %d expired reservations.' % count)
@@ -0,0 +1,94 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from ... import jobs
+from ...cache import check_shared_backend
+
+
+class _Stop(object):
+
+    def __init__(self):
+        self.requested = False
+
+    def __call__(self, *args):
+        self.requested = True
+
+
+def _work(burst, results):
+    stop = _Stop()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    results.put(jobs.work(burst=burst, stopping=lambda: stop.requested))
+
+
+class Command(BaseCommand):
+    help = ('Runs the background jobs queued in the database (see '
+            'shop.jobs) in worker processes until stopped. SIGTERM lets '
+            'every worker finish the job it is running first. Needs a '
+            'SHOP_CACHE shared with the web workers.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: CPU count), '
+                                 '1 runs jobs in this process')
+        parser.add_argument('--burst', action='store_true',
+                            help='Stop once no job is due instead of '
+                                 'waiting for more')
+
+    def handle(self, *args, **options):
+        try:
+            # Jobs change the catalogue the web workers cache.
+            check_shared_backend()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        jobs.autodiscover()
+        workers = options['workers'] or multiprocessing.cpu_count()
+        burst = options['burst']
+        stop = _Stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        if workers == 1:
+            count = jobs.work(burst=burst, stopping=lambda: stop.requested)
+        else:
+            count = self.supervise(workers, burst, stop)
+        self.stdout.write('Ran %d jobs.' % count)
+
+    def supervise(self, workers, burst, stop):
+        # Forked workers must not share the parent's database connection.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+
+        def start():
+            process = context.Process(target=_work, args=(burst, results))
+            process.start()
+            return process
+
+        processes = [start() for _ in range(workers)]
+        count = 0
+        while processes:
+            if stop.requested:
+                for process in processes:
+                    if process.is_alive():
+                        process.terminate()
+            for process in list(processes):
+                if process.is_alive():
+                    continue
+                process.join()
+                processes.remove(process)
+                if process.exitcode and not stop.requested:
+                    self.stderr.write('Worker %d exited with %d, starting '
+                                      'another.' % (process.pid,
+                                                    process.exitcode))
+                    processes.append(start())
+            while not results.empty():
+                count += results.get()
+            time.sleep(0.2)
+        while not results.empty():
+            count += results.get()
+        return count
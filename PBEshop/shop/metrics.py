@@ -0,0 +1,219 @@
+"""
+Per-view request metrics.
+
+``QueryMetricsMiddleware`` records, for every resolved view, the time spent
+rendering templates (through ``timed_render``) and the total latency. With
+``SHOP_QUERY_METRICS`` on it also records the number of SQL queries and the
+time spent in the database, and logs repeated identical queries that only
+differ in their parameters, the usual sign of an N+1 loop. It adds a
+``Server-Timing`` header.
+
+Counting queries logs every one of them on the connection, which costs
+memory and time, so production leaves it off. Streaming responses are
+measured when the view returns, before their body runs its queries, so
+their numbers fall short.
+
+Histograms live in the memory of each worker process; ``render_prometheus``
+writes them out in the Prometheus text format.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connections
+from django.shortcuts import render
+
+from .cache import get_catalogue_cache
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+HISTOGRAMS = (
+    ('shop_request_duration_seconds', 'Total request latency.',
+     SECONDS_BUCKETS),
+    ('shop_request_db_seconds', 'Time spent running SQL queries.',
+     SECONDS_BUCKETS),
+    ('shop_request_template_seconds', 'Time spent rendering templates.',
+     SECONDS_BUCKETS),
+    ('shop_request_queries', 'SQL queries run per request.', QUERY_BUCKETS),
+)
+
+_literal_re = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_list_re = re.compile(r'IN \(\?(?:, \?)*\)')
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+class Registry(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, name, view, value):
+        buckets = dict((h[0], h[2]) for h in HISTOGRAMS)[name]
+        with self._lock:
+            histogram = self._histograms.get((name, view))
+            if histogram is None:
+                histogram = self._histograms[name, view] = Histogram(buckets)
+            histogram.observe(value)
+
+    def get(self, name, view):
+        return self._histograms.get((name, view))
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, description, _ in HISTOGRAMS:
+                lines.append('# HELP %s %s' % (name, description))
+                lines.append('# TYPE %s histogram' % name)
+                views = sorted(view for metric, view in self._histograms
+                               if metric == name)
+                for view in views:
+                    histogram = self._histograms[name, view]
+                    label = 'view="%s"' % view.replace('"', '\\"')
+                    for bound, count in histogram.cumulative():
+                        lines.append('%s_bucket{%s,le="%s"} %d' % (
+                            name, label, bound, count))
+                    lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+                        name, label, histogram.count))
+                    lines.append('%s_sum{%s} %s' % (name, label,
+                                                    histogram.sum))
+                    lines.append('%s_count{%s} %d' % (name, label,
+                                                      histogram.count))
+        stats = get_catalogue_cache().stats()
+        for result in ('hits', 'misses'):
+            name = 'shop_catalogue_cache_%s_total' % result
+            lines.append('# HELP %s Catalogue page cache %s.' % (name, result))
+            lines.append('# TYPE %s counter' % name)
+            lines.append('%s %d' % (name, stats[result]))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def timed_render(request, template_name, context=None):
+    """
+    ``django.shortcuts.render`` that adds its duration to the request's
+    template time.
+    """
+    started = time.time()
+    response = render(request, template_name, context)
+    request.template_time = (getattr(request, 'template_time', 0.0) +
+                             time.time() - started)
+    return response
+
+
+def normalize_sql(sql):
+    return _in_list_re.sub('IN (...)', _literal_re.sub('?', sql))
+
+
+def _logged_after(queries_log, last):
+    """
+    The entries of ``queries_log`` after ``last``, all of them once ``last``
+    was pushed out.
+    """
+    queries = []
+    for query in reversed(queries_log):
+        if query is last:
+            break
+        queries.append(query)
+    queries.reverse()
+    return queries
+
+
+class QueryMetricsMiddleware(object):
+    """
+    With ``SHOP_QUERY_METRICS``, turns on query logging of every database
+    connection for the duration of a request. Django clears the log when a
+    request starts.
+    """
+
+    def process_request(self, request):
+        request.metrics_started = time.time()
+        request.metrics_debug_cursors = None
+        if not settings.SHOP_QUERY_METRICS:
+            return
+        # Entries already logged belong to someone else, for example an
+        # enclosing CaptureQueriesContext that stops the reset. The log is a
+        # bounded deque, so the last of them is remembered, not its index.
+        request.metrics_debug_cursors = [
+            (connection, connection.force_debug_cursor,
+             connection.queries_log[-1] if connection.queries_log else None)
+            for connection in connections.all()
+        ]
+        for connection, _, _ in request.metrics_debug_cursors:
+            connection.force_debug_cursor = True
+
+    def process_response(self, request, response):
+        if not hasattr(request, 'metrics_started'):
+            return response
+        queries = None
+        if request.metrics_debug_cursors is not None:
+            queries = []
+            for connection, force_debug_cursor, last in \
+                    request.metrics_debug_cursors:
+                queries += _logged_after(connection.queries_log, last)
+                connection.force_debug_cursor = force_debug_cursor
+        total = time.time() - request.metrics_started
+        template_time = getattr(request, 'template_time', 0.0)
+
+        timing = 'tpl;dur=%.1f, total;dur=%.1f' % (template_time * 1000,
+                                                   total * 1000)
+        if queries is not None:
+            db_time = sum(float(query['time']) for query in queries)
+            timing = 'db;dur=%.1f;desc="%d queries", %s' % (
+                db_time * 1000, len(queries), timing)
+        response['Server-Timing'] = timing
+
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.view_name == 'shop:metrics':
+            return response
+        view = match.view_name
+        registry.observe('shop_request_duration_seconds', view, total)
+        registry.observe('shop_request_template_seconds', view, template_time)
+        if queries is not None:
+            registry.observe('shop_request_db_seconds', view, db_time)
+            registry.observe('shop_request_queries', view, len(queries))
+            self.log_repeated_queries(view, queries)
+        return response
+
+    def log_repeated_queries(self, view, queries):
+        threshold = settings.SHOP_METRICS_N_PLUS_ONE_THRESHOLD
+        repeated = Counter(normalize_sql(query['sql']) for query in queries)
+        for sql, count in repeated.items():
+            if count >= threshold:
+                logger.warning('%s ran %d similar queries: %s',
+                               view, count, sql)
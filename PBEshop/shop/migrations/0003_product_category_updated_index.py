@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.6 on 2026-10-18 08:54
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0002_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='product',
+            index_together=set([('name', 'id'), ('category', 'name', 'id'), ('category', 'updated'), ('id', 'slug')]),
+        ),
+    ]
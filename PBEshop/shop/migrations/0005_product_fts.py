@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, OperationalError
+
+
+def create_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE shop_product_fts USING fts5('
+                'name, description, category, category_id UNINDEXED)')
+        except OperationalError:
+            # SQLite built without FTS5, shop.search falls back to the
+            # in-memory index.
+            return
+        cursor.execute(
+            'INSERT INTO shop_product_fts '
+            '(rowid, name, description, category_id, category) '
+            'SELECT p.id, p.name, p.description, p.category_id, c.name '
+            'FROM shop_product p JOIN shop_category c ON c.id = p.category_id '
+            'WHERE p.available')
+
+
+def drop_fts_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TABLE IF EXISTS shop_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_category_product_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
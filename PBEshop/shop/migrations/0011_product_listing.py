@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.6 on 2026-10-18 10:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def list_products(apps, schema_editor):
+    from shop.listings import copy
+    Product = apps.get_model('shop', 'Product')
+    ProductListing = apps.get_model('shop', 'ProductListing')
+    copy(Product.objects.all(), ProductListing)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductListing',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('category_slug', models.SlugField(max_length=200)),
+                ('name', models.CharField(max_length=200)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('in_stock', models.BooleanField(default=True)),
+                ('url', models.CharField(max_length=255)),
+                ('thumbnail', models.CharField(blank=True, max_length=255)),
+                ('updated', models.DateTimeField(db_index=True)),
+                ('category', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='shop.Category')),
+            ],
+            options={
+                'ordering': ('name', 'id'),
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='productlisting',
+            index_together=set([('name', 'id'), ('category', 'name', 'id'), ('category_slug', 'updated'), ('category', 'in_stock', 'price')]),
+        ),
+        migrations.RunPython(list_products, migrations.RunPython.noop),
+    ]
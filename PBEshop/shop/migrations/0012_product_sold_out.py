@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.6 on 2026-10-18 10:32
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def mark_sold_out(apps, schema_editor):
+    # Products reservations are still holding the last units of. Others
+    # that are unavailable at zero stock may have been hidden by an admin.
+    Product = apps.get_model('shop', 'Product')
+    StockReservation = apps.get_model('shop', 'StockReservation')
+    held = StockReservation.objects.values('product')
+    Product.objects.filter(available=False, stock=0, pk__in=held) \
+                   .update(sold_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_product_listing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='sold_out',
+            field=models.BooleanField(default=False, help_text='Unavailable until reserved units return to stock.'),
+        ),
+        migrations.RunPython(mark_sold_out, migrations.RunPython.noop),
+    ]
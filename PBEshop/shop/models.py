@@ -1,20 +1,96 @@
 from decimal import Decimal
 from django.core.validators import MinValueValidator
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.utils import timezone
 
-class Category(models.Model):
+class LoadedValuesMixin(object):
+    """
+    Remembers the field values a row was loaded with, so that signal
+    receivers can tell what a save changed.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(LoadedValuesMixin, cls).from_db(db, field_names,
+                                                         values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_loaded_value(self, attname, default=None):
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+
+    def save(self, *args, **kwargs):
+        super(LoadedValuesMixin, self).save(*args, **kwargs)
+        self._loaded_values = dict(
+            (field.attname, self.__dict__[field.attname])
+            for field in self._meta.concrete_fields
+            if field.attname in self.__dict__
+        )
+
+class ChangeLoggedQuerySet(models.QuerySet):
+    """
+    Records the rows ``update()`` changes in the change log, in the same
+    transaction, see shop.changelog.
+    """
+
+    def update(self, **kwargs):
+        # As QuerySet.update() does, so that self.db is the database written
+        # to and not the one the router reads from.
+        self._for_write = True
+        fields = [name for name in kwargs
+                  if name not in self.model.changelog_ignored_fields]
+        if not fields:
+            return super(ChangeLoggedQuerySet, self).update(**kwargs)
+        with transaction.atomic(using=self.db):
+            # Written before the update, a SELECT first would leave
+            # concurrent SQLite writers failing to upgrade their read locks.
+            ChangeLogEntry.objects.record_rows(self, ChangeLogEntry.UPDATE,
+                                               fields)
+            return super(ChangeLoggedQuerySet, self).update(**kwargs)
+    update.alters_data = True
+
+class ChangeLoggedMixin(object):
+    """
+    Runs a save and its post_save receivers, which record it in the change
+    log, in one transaction. Deletes already do.
+    """
+    # Derived fields whose changes are not worth an entry.
+    changelog_ignored_fields = ()
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self),
+                                                          instance=self)
+        with transaction.atomic(using=using):
+            super(ChangeLoggedMixin, self).save(*args, **kwargs)
+
+class Category(ChangeLoggedMixin, LoadedValuesMixin, models.Model):
     name = models.CharField(max_length=200,
                             db_index=True)
     slug = models.SlugField(max_length=200,
                             db_index=True,
                             unique=True)
+    # Available products, maintained by shop.counters
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ChangeLoggedQuerySet.as_manager()
+    changelog_ignored_fields = ('product_count',)
 
     class Meta:
         ordering = ('name',)
         verbose_name = 'category'
         verbose_name_plural = 'categories'
 
+    def save(self, *args, **kwargs):
+        # Never write back a product_count that may have gone stale since
+        # this row was loaded.
+        if not self._state.adding and not kwargs.get('update_fields'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'product_count'
+            ]
+        super(Category, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('shop:product_list_by_category',
                        args=[self.slug])
@@ -22,7 +98,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(ChangeLoggedMixin, LoadedValuesMixin, models.Model):
     category = models.ForeignKey(Category,
                                  related_name='products')
     name = models.CharField(max_length=200, db_index=True)
@@ -34,16 +110,207 @@ class Product(models.Model):
                                 validators= [MinValueValidator(Decimal(0))])
     stock = models.PositiveIntegerField(validators= [MinValueValidator(0)]) #validator for compatibility with SQLite
     available = models.BooleanField(default=True)
-    created = models.DateTimeField(auto_now_add=True)
-    updated = models.DateTimeField(auto_now=True)
+    # Set while the product is unavailable because reservations took its
+    # last units, so that returned units make it available again.
+    sold_out = models.BooleanField(default=False,
+                                   help_text='Unavailable until reserved '
+                                             'units return to stock.')
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = ChangeLoggedQuerySet.as_manager()
 
     class Meta:
         ordering = ('name',)
-        index_together = (('id', 'slug'),)
+        index_together = (('id', 'slug'),
+                          ('name', 'id'),
+                          ('category', 'name', 'id'),
+                          ('category', 'updated'),
+                          ('category', 'available', 'price'))
+
+    def save(self, *args, **kwargs):
+        # Whoever sets the availability by hand takes it over from
+        # shop.stock.
+        if self.available != self.get_loaded_value('available',
+                                                   self.available):
+            self.sold_out = False
+        super(Product, self).save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('shop:product_detail',
                        args=[self.id, self.slug])
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+class ProductListing(models.Model):
+    """
+    An available product as catalogue listings show it, denormalised from
+    Product and Category, see shop.listings.
+    """
+    # The product's own id, no foreign key so that no join is ever needed.
+    id = models.IntegerField(primary_key=True)
+    category = models.ForeignKey(Category, on_delete=models.DO_NOTHING,
+                                 db_constraint=False, db_index=False,
+                                 related_name='+')
+    category_slug = models.SlugField(max_length=200)
+    name = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    in_stock = models.BooleanField(default=True)
+    url = models.CharField(max_length=255)
+    # Storage name of the listing thumbnail, or of the image until that is
+    # rendered, empty without an image.
+    thumbnail = models.CharField(max_length=255, blank=True)
+    updated = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ('name', 'id')
+        index_together = (('name', 'id'),
+                          ('category', 'name', 'id'),
+                          ('category', 'in_stock', 'price'),
+                          ('category_slug', 'updated'))
+
+    def get_absolute_url(self):
+        return self.url
+
+    def __str__(self):
+        return self.name
+
+class StockReservation(models.Model):
+    """
+    Units of a product taken out of ``Product.stock`` for a cart or an
+    order until ``expires``, see shop.stock.
+    """
+    product = models.ForeignKey(Product,
+                                related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    reference = models.CharField(max_length=64, db_index=True)
+    created = models.DateTimeField(auto_now_add=True)
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        ordering = ('expires',)
+
+    def __str__(self):
+        return '%d x %s for %s' % (self.quantity, self.product_id,
+                                   self.reference)
+
+class Job(models.Model):
+    """
+    Work for the run_workers processes, see shop.jobs.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'queued'),
+        (RUNNING, 'running'),
+        (FAILED, 'failed'),
+    )
+
+    name = models.CharField(max_length=100)
+    payload = models.TextField(default='{}')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    # When a queued job is due, or when a running one is given up on.
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('run_at',)
+        index_together = (('status', 'run_at'),)
+
+    def __str__(self):
+        return '%s #%s' % (self.name, self.pk)
+
+class ChangeLogManager(models.Manager):
+
+    def record(self, model, pks, action, fields=()):
+        """
+        Adds an entry for every row of ``model`` in ``pks``, on the database
+        the rows are written to.
+        """
+        fields = ','.join(sorted(fields))[:255]
+        label = model._meta.label_lower
+        self.db_manager(router.db_for_write(model)).bulk_create([
+            self.model(model=label, object_id=pk, action=action,
+                       fields=fields)
+            for pk in pks])
+
+    def record_rows(self, queryset, action, fields=()):
+        """
+        Adds an entry for every row ``queryset`` matches, with a single
+        ``INSERT ... SELECT``.
+        """
+        connection = connections[queryset.db]
+        quote = connection.ops.quote_name
+        values = [('model', queryset.model._meta.label_lower),
+                  ('action', action),
+                  ('fields', ','.join(sorted(fields))[:255]),
+                  ('created', timezone.now())]
+        columns, placeholders, params = [], [], []
+        for name, value in values:
+            field = self.model._meta.get_field(name)
+            columns.append(quote(field.column))
+            placeholder = '%s'
+            if connection.vendor == 'postgresql':
+                placeholder = 'CAST(%%s AS %s)' % field.db_type(connection)
+            placeholders.append(placeholder)
+            params.append(field.get_db_prep_save(value, connection))
+        pks = queryset.order_by().values_list('pk')
+        sql, pk_params = pks.query.get_compiler(queryset.db).as_sql()
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO %s (%s, %s) SELECT %s, %s FROM (%s) %s'
+                           % (quote(self.model._meta.db_table),
+                              ', '.join(columns),
+                              quote(self.model._meta.get_field('object_id')
+                                              .column),
+                              ', '.join(placeholders),
+                              quote(queryset.model._meta.pk.column),
+                              sql, quote('changed')),
+                           params + list(pk_params))
+
+class ChangeLogEntry(models.Model):
+    """
+    A Category or Product row that was created, changed or deleted, in the
+    order of ``id``, see shop.changelog.
+    """
+    CREATE = 'create'
+    UPDATE = 'update'
+    DELETE = 'delete'
+    ACTION_CHOICES = (
+        (CREATE, 'create'),
+        (UPDATE, 'update'),
+        (DELETE, 'delete'),
+    )
+
+    model = models.CharField(max_length=50)
+    object_id = models.PositiveIntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    # The fields that changed, comma separated, empty when unknown.
+    fields = models.CharField(max_length=255, blank=True)
+    created = models.DateTimeField(default=timezone.now)
+
+    objects = ChangeLogManager()
+
+    class Meta:
+        ordering = ('id',)
+        verbose_name_plural = 'change log entries'
+
+    def __str__(self):
+        return '%s %s %s' % (self.action, self.model, self.object_id)
+
+class ChangeLogConsumer(models.Model):
+    """
+    The last change log entry a consumer committed to having processed.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    position = models.PositiveIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.name
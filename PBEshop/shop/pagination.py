@@ -0,0 +1,164 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+def encode_cursor(values):
+    data = json.dumps(list(values), cls=DjangoJSONEncoder,
+                      separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor, length):
+    try:
+        data = base64.urlsafe_b64decode(cursor.encode('ascii'))
+        values = json.loads(data.decode('utf-8'))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise InvalidCursor('Cursor is not valid')
+    if (not isinstance(values, list) or len(values) != length or
+            not all(isinstance(value, (str, int, float)) for value in values)):
+        raise InvalidCursor('Cursor is not valid')
+    return values
+
+
+class KeysetPage(object):
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator(object):
+    """
+    Pages a queryset by seeking past the last row of the previous page
+    instead of using OFFSET, so every page costs the same index range scan.
+
+    ``ordering`` must be a unique, ascending sort key, e.g. ``('name', 'id')``.
+    Rows may be model instances or ``.values()`` dicts.
+    """
+
+    def __init__(self, queryset, per_page, ordering=('name', 'id')):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    def page(self, after=None, before=None):
+        queryset = self.queryset
+        if before:
+            queryset = self._seek_past(queryset, before, 'lt')
+            queryset = queryset.order_by(*['-%s' % f for f in self.ordering])
+            rows = list(queryset[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            if after:
+                queryset = self._seek_past(queryset, after, 'gt')
+            queryset = queryset.order_by(*self.ordering)
+            rows = list(queryset[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(self._key(rows[-1]))
+        if rows and has_previous:
+            previous_cursor = encode_cursor(self._key(rows[0]))
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def _key(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.ordering]
+        return [getattr(row, field) for field in self.ordering]
+
+    def _seek_past(self, queryset, cursor, lookup):
+        values = decode_cursor(cursor, len(self.ordering))
+        try:
+            return queryset.filter(self._seek(values, lookup))
+        except (TypeError, ValueError, ValidationError):
+            # Values the ordering fields cannot be compared with.
+            raise InvalidCursor('Cursor is not valid')
+
+    def _seek(self, values, lookup):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            term = Q(**{'%s__%s' % (field, lookup): values[i]})
+            for j in range(i):
+                term &= Q(**{self.ordering[j]: values[j]})
+            condition |= term
+        return condition
+
+
+def estimate_count(model, using):
+    """
+    Returns a cheap estimate of the rows of ``model``'s table: the planner
+    statistics on PostgreSQL, the largest primary key on SQLite, which only
+    overcounts by the rows deleted. None when there is no estimate.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class '
+                           'WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(table)])
+        elif connection.vendor == 'sqlite':
+            cursor.execute('SELECT MAX(%s) FROM %s' % (
+                connection.ops.quote_name(model._meta.pk.column),
+                connection.ops.quote_name(table)))
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for admin changelists of big tables, where ``COUNT(*)`` scans
+    the whole table on every page load.
+
+    Below ``SHOP_ADMIN_ESTIMATED_COUNT_ABOVE`` rows it counts exactly. Above,
+    an unfiltered list reports the table estimate and a filtered one counts
+    at most that many rows, so later pages are only reached by narrowing
+    the filters.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        limit = settings.SHOP_ADMIN_ESTIMATED_COUNT_ABOVE
+        estimate = estimate_count(queryset.model, queryset.db)
+        if estimate is None or estimate < limit:
+            return queryset.count()
+        if not queryset.query.where:
+            return estimate
+        return queryset[:limit].count()
@@ -0,0 +1,156 @@
+"""
+Read replicas for the catalogue.
+
+``CatalogueRouter`` sends reads of ``Category``, ``Product`` and
+``ProductListing`` to one of ``SHOP_DATABASE_REPLICAS`` and every write to
+the primary. Reads go to the primary instead:
+
+* for the rest of a request that wrote, and for ``SHOP_REPLICA_PIN_SECONDS``
+  after it for the same visitor, through the cookie ``PrimaryPinMiddleware``
+  sets, so that an admin sees their own change;
+* inside a transaction on the primary, whose reads must see its writes;
+* inside ``use_primary()``;
+* while no replica is both reachable and within ``SHOP_REPLICA_MAX_LAG``
+  seconds of the primary. The lag is the difference of the newest
+  ``Product.updated`` on both sides, checked at most every
+  ``SHOP_REPLICA_CHECK_INTERVAL`` seconds per process.
+
+Without replicas the router leaves every decision to Django.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, DatabaseError, DEFAULT_DB_ALIAS
+from django.db.models import Max
+
+from .models import Product
+
+CATALOGUE_MODELS = ('category', 'product', 'productlisting')
+
+PIN_COOKIE = 'shop_primary'
+
+_local = threading.local()
+
+
+@contextmanager
+def use_primary():
+    previous = getattr(_local, 'pinned', False)
+    _local.pinned = True
+    try:
+        yield
+    finally:
+        _local.pinned = previous
+
+
+def replica_used():
+    """
+    Tells whether the current request read from a replica.
+    """
+    return getattr(_local, 'replica_used', False)
+
+
+def replica_lag(alias):
+    """
+    Seconds the newest product change on replica ``alias`` is behind the
+    primary.
+    """
+    def newest(db):
+        return Product.objects.using(db).aggregate(
+            updated=Max('updated'))['updated']
+    # The replica goes first, so that one that is down always raises.
+    replica = newest(alias)
+    primary = newest(DEFAULT_DB_ALIAS)
+    if primary is None:
+        return 0.0
+    if replica is None:
+        return float('inf')
+    return max((primary - replica).total_seconds(), 0.0)
+
+
+class ReplicaHealth(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked = {}
+
+    def check(self, alias):
+        try:
+            return replica_lag(alias) <= settings.SHOP_REPLICA_MAX_LAG
+        except DatabaseError:
+            return False
+
+    def is_healthy(self, alias):
+        now = time.time()
+        with self._lock:
+            checked = self._checked.get(alias)
+        if (checked is None or
+                now - checked[0] >= settings.SHOP_REPLICA_CHECK_INTERVAL):
+            checked = (now, self.check(alias))
+            with self._lock:
+                self._checked[alias] = checked
+        return checked[1]
+
+    def reset(self):
+        with self._lock:
+            self._checked.clear()
+
+
+health = ReplicaHealth()
+
+
+class CatalogueRouter(object):
+
+    def _is_catalogue(self, model):
+        return (model._meta.app_label == 'shop' and
+                model._meta.model_name in CATALOGUE_MODELS)
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.SHOP_DATABASE_REPLICAS
+        if not replicas or not self._is_catalogue(model):
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        if (getattr(_local, 'pinned', False) or
+                getattr(_local, 'wrote', False) or
+                connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        healthy = [alias for alias in replicas if health.is_healthy(alias)]
+        if not healthy:
+            return DEFAULT_DB_ALIAS
+        _local.replica_used = True
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        # Session writes say nothing about the catalogue a visitor sees.
+        if model._meta.app_label != 'sessions':
+            _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = set([DEFAULT_DB_ALIAS] + settings.SHOP_DATABASE_REPLICAS)
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class PrimaryPinMiddleware(object):
+    """
+    Keeps a visitor who wrote on the primary for SHOP_REPLICA_PIN_SECONDS.
+    """
+
+    def process_request(self, request):
+        _local.pinned = PIN_COOKIE in request.COOKIES
+        _local.wrote = False
+        _local.replica_used = False
+
+    def process_response(self, request, response):
+        if getattr(_local, 'wrote', False) and settings.SHOP_DATABASE_REPLICAS:
+            response.set_cookie(PIN_COOKIE, '1',
+                                max_age=settings.SHOP_REPLICA_PIN_SECONDS,
+                                httponly=True)
+        _local.pinned = _local.wrote = _local.replica_used = False
+        return response
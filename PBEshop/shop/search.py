@@ -0,0 +1,264 @@
+"""
+Product search over name, description and category name.
+
+Two backends share one interface:
+
+* ``Fts5SearchBackend`` keeps an FTS5 virtual table (``shop_product_fts``,
+  created by migration 0005) next to the product table on SQLite.
+* ``InMemorySearchBackend`` keeps a pure-Python inverted index, built from
+  the database on first use and then kept current by the save and delete
+  signals of this process.
+
+Only available products are indexed. Every query is an AND over its terms
+and the last term of at least ``MIN_PREFIX_LENGTH`` characters also
+matches as a prefix, for autocomplete.
+"""
+import bisect
+import heapq
+import math
+import re
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection, OperationalError
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Product
+
+FTS_TABLE = 'shop_product_fts'
+
+# Relative weight of a term found in each field, in FTS column order.
+FIELD_WEIGHTS = (('name', 10.0), ('description', 1.0), ('category', 2.0))
+
+# Shorter last terms only match whole words, a one letter prefix would
+# touch most of the index.
+MIN_PREFIX_LENGTH = 2
+MAX_PREFIX_EXPANSIONS = 64
+
+# Products read per query while indexing, which also bounds the parameters
+# of each pk__in filter.
+INDEX_BATCH_SIZE = 500
+
+_token_re = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    return _token_re.findall(text.lower())
+
+
+def _document_rows(products):
+    return products.filter(available=True).values_list(
+        'id', 'name', 'description', 'category_id', 'category__name')
+
+
+def _pk_batches(products):
+    """
+    Yields the pks of ``products`` in ascending lists of at most
+    ``INDEX_BATCH_SIZE``, each read with its own query.
+    """
+    pks = products.order_by('pk').values_list('pk', flat=True)
+    batch = list(pks[:INDEX_BATCH_SIZE])
+    while batch:
+        yield batch
+        batch = list(pks.filter(pk__gt=batch[-1])[:INDEX_BATCH_SIZE])
+
+
+class Fts5SearchBackend(object):
+
+    def index(self, products):
+        for pks in _pk_batches(products):
+            self.remove(pks)
+            self._insert(pks)
+
+    def _insert(self, pks):
+        rows = list(_document_rows(Product.objects.filter(pk__in=pks)))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'INSERT INTO %s (rowid, name, description, category_id, '
+                'category) VALUES (%%s, %%s, %%s, %%s, %%s)' % FTS_TABLE,
+                rows)
+
+    def remove(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                'DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE,
+                [(pk,) for pk in product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % FTS_TABLE)
+        for pks in _pk_batches(Product.objects.filter(available=True)):
+            self._insert(pks)
+
+    def search(self, query, category_id=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = ' '.join('"%s"' % term for term in terms)
+        if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+            match += '*'
+        # The trailing 0.0 weighs the unindexed category_id column.
+        sql = ('SELECT rowid, bm25(%s, %s, 0.0) FROM %s WHERE %s MATCH %%s' % (
+            FTS_TABLE, ', '.join(str(w) for _, w in FIELD_WEIGHTS),
+            FTS_TABLE, FTS_TABLE))
+        params = [match]
+        if category_id is not None:
+            sql += ' AND category_id = %s'
+            params.append(category_id)
+        # bm25() is lower for better matches.
+        sql += ' ORDER BY 2 LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(pk, -score) for pk, score in cursor.fetchall()]
+
+
+class InMemorySearchBackend(object):
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = {}
+        self._vocabulary = []
+        self._documents = {}
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def _add(self, pk, name, description, category_id, category_name):
+        self._remove(pk)
+        weights = {}
+        for (_, weight), text in zip(FIELD_WEIGHTS,
+                                     (name, description, category_name)):
+            for term in tokenize(text or ''):
+                weights[term] = weights.get(term, 0.0) + weight
+        length = sum(weights.values()) or 1.0
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[pk] = weight / length
+        self._documents[pk] = (category_id, tuple(weights))
+
+    def _remove(self, pk):
+        document = self._documents.pop(pk, None)
+        if document is None:
+            return
+        for term in document[1]:
+            postings = self._postings[term]
+            del postings[pk]
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary,
+                                                        term)]
+
+    def index(self, products):
+        with self._lock:
+            if not self._built:
+                return
+            for pks in _pk_batches(products):
+                for pk in pks:
+                    self._remove(pk)
+                for row in _document_rows(Product.objects.filter(pk__in=pks)):
+                    self._add(*row)
+
+    def remove(self, product_ids):
+        with self._lock:
+            for pk in product_ids:
+                self._remove(pk)
+
+    def rebuild(self):
+        with self._lock:
+            self._postings = {}
+            self._vocabulary = []
+            self._documents = {}
+            self._built = True
+            for row in _document_rows(Product.objects.all()).iterator():
+                self._add(*row)
+
+    def _prefix_postings(self, prefix):
+        merged = {}
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            for pk, weight in self._postings[term].items():
+                merged[pk] = max(weight, merged.get(pk, 0.0))
+        return merged
+
+    def search(self, query, category_id=None, limit=20):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        with self._lock:
+            self._ensure_built()
+            lists = [self._postings.get(term, {}) for term in terms[:-1]]
+            if len(terms[-1]) >= MIN_PREFIX_LENGTH:
+                lists.append(self._prefix_postings(terms[-1]))
+            else:
+                lists.append(self._postings.get(terms[-1], {}))
+            lists.sort(key=len)
+            total = len(self._documents) or 1
+            scores = {}
+            for pk, weight in lists[0].items():
+                score = 0.0
+                for postings in lists:
+                    term_weight = postings.get(pk)
+                    if term_weight is None:
+                        break
+                    idf = math.log(1.0 + total / float(len(postings)))
+                    score += term_weight * idf
+                else:
+                    if (category_id is None or
+                            self._documents[pk][0] == category_id):
+                        scores[pk] = score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def fts5_available():
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute('SELECT 1 FROM %s LIMIT 1' % FTS_TABLE)
+        except OperationalError:
+            return False
+    return True
+
+
+_backend = None
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        path = settings.SHOP_SEARCH_BACKEND
+        if path:
+            _backend = import_string(path)()
+        elif fts5_available():
+            _backend = Fts5SearchBackend()
+        else:
+            _backend = InMemorySearchBackend()
+    return _backend
+
+
+@receiver(setting_changed)
+def _reset_search_backend(sender, setting, **kwargs):
+    global _backend
+    if setting == 'SHOP_SEARCH_BACKEND':
+        _backend = None
+
+
+def search_products(query, category=None, limit=20):
+    """
+    Returns ``(product, score)`` pairs, best match first.
+    """
+    category_id = category.pk if category is not None else None
+    ranked = get_search_backend().search(query, category_id, limit)
+    products = Product.objects.filter(available=True) \
+                              .in_bulk([pk for pk, _ in ranked])
+    return [(products[pk], score) for pk, score in ranked if pk in products]
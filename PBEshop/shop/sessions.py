@@ -0,0 +1,254 @@
+"""
+Session engine keeping sessions in a cache and writing them to the
+database behind the requests.
+
+``SESSION_ENGINE = 'shop.sessions'`` reads sessions from the
+``SESSION_CACHE_ALIAS`` cache and only falls back to ``django_session`` when
+they are not there. A save goes to the cache at once and is queued for the
+database; ``flush_due`` runs on ``request_finished``, after the response
+went out, and writes everything queued for ``SHOP_SESSION_WRITE_DELAY``
+seconds in one transaction, the last version of each session only. A serving
+process also runs it on a timer, from the thread ``start_flusher()`` starts,
+so that an idle worker does not sit on queued sessions. What is still queued
+is written when the process exits.
+
+A save that would store the data the session was loaded with does nothing,
+so a request that merely reads its session never writes. Deleting a
+session, on logout, goes to the database at once, so that it cannot be
+read back from there, and leaves a tombstone in the cache that keeps a
+flush in another process from writing it back.
+
+The cache is the primary copy for up to ``SHOP_SESSION_WRITE_DELAY``
+seconds: with several worker processes ``SESSION_CACHE_ALIAS`` must name a
+cache they share, which ``check_shared_cache()`` enforces.
+"""
+import copy
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import (
+    SessionStore as CachedDBStore)
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import (DatabaseError, close_old_connections, router,
+                       transaction)
+
+from .bulk import bulk_update, chunked
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_PREFIX = 'shop.sessions.deleted:'
+
+
+def _cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def check_shared_cache():
+    """
+    Raises ``ImproperlyConfigured`` when ``SESSION_CACHE_ALIAS`` is not a
+    cache other processes can read, to call before starting several.
+    """
+    if isinstance(_cache(), (LocMemCache, DummyCache)):
+        raise ImproperlyConfigured(
+            'SESSION_CACHE_ALIAS %r is not shared between processes, '
+            'sessions saved by one worker would be lost to the others.'
+            % settings.SESSION_CACHE_ALIAS)
+
+
+class SessionWriter(object):
+    """
+    Sessions saved since the last flush, by key.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Keeps a flush from writing back a session deleted meanwhile.
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._since = None
+
+    def enqueue(self, session):
+        with self._lock:
+            if not self._pending:
+                self._since = time.time()
+            self._pending[session.session_key] = session
+
+    def get(self, session_key):
+        with self._lock:
+            return self._pending.get(session_key)
+
+    def discard(self, session_key):
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(session_key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def clear(self):
+        """
+        Forgets the queued sessions without writing them.
+        """
+        with self._write_lock:
+            with self._lock:
+                self._pending, self._since = {}, None
+
+    def is_due(self):
+        delay = settings.SHOP_SESSION_WRITE_DELAY
+        with self._lock:
+            return (bool(self._pending) and
+                    time.time() - self._since >= delay)
+
+    def flush(self):
+        """
+        Writes the queued sessions and returns how many.
+        """
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending, self._since = self._pending, {}, None
+            deleted = _cache().get_many([TOMBSTONE_PREFIX + key
+                                         for key in batch])
+            for key in list(batch):
+                if TOMBSTONE_PREFIX + key in deleted:
+                    del batch[key]
+            if not batch:
+                return 0
+            try:
+                _write(list(batch.values()))
+            except DatabaseError:
+                logger.exception('Could not write %d sessions, retrying '
+                                 'with the next flush.', len(batch))
+                with self._lock:
+                    for key, session in batch.items():
+                        self._pending.setdefault(key, session)
+                    if self._since is None:
+                        self._since = time.time()
+                return 0
+        return len(batch)
+
+
+def _write(sessions):
+    model = type(sessions[0])
+    using = router.db_for_write(model)
+    with transaction.atomic(using=using):
+        for chunk in chunked(sessions, 500):
+            existing = set(model.objects.using(using)
+                                .filter(pk__in=[s.pk for s in chunk])
+                                .values_list('pk', flat=True))
+            model.objects.using(using).bulk_create(
+                [s for s in chunk if s.pk not in existing])
+            bulk_update([s for s in chunk if s.pk in existing],
+                        ['session_data', 'expire_date'])
+
+
+writer = SessionWriter()
+
+
+def flush_due(**kwargs):
+    if writer.is_due():
+        writer.flush()
+
+
+def flush_all():
+    if len(writer):
+        writer.flush()
+
+
+class Flusher(threading.Thread):
+    """
+    Writes the due sessions of this process every half
+    ``SHOP_SESSION_WRITE_DELAY``, until stopped.
+    """
+
+    def __init__(self):
+        super(Flusher, self).__init__(name='shop.sessions.Flusher',
+                                      daemon=True)
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(
+                max(settings.SHOP_SESSION_WRITE_DELAY / 2.0, 0.1)):
+            # This thread's connection is not looked after by requests.
+            close_old_connections()
+            try:
+                flush_due()
+            except Exception:
+                logger.exception('Could not flush the queued sessions.')
+
+    def stop(self):
+        self._stopped.set()
+
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def start_flusher():
+    """
+    Starts the ``Flusher`` of this process unless it runs already, in every
+    serving process, see PBEshop.bootstrap.
+    """
+    global _flusher
+    with _flusher_lock:
+        # Not alive in a forked worker, threads do not survive a fork.
+        if _flusher is not None and _flusher.is_alive():
+            return _flusher
+        _flusher = Flusher()
+        _flusher.start()
+        return _flusher
+
+
+class SessionStore(CachedDBStore):
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            data = None
+        if data is None:
+            queued = writer.get(self.session_key)
+            if queued is not None:
+                data = self.decode(queued.session_data)
+                self._cache.set(self.cache_key, data,
+                                self.get_expiry_age(expiry=queued.expire_date))
+            else:
+                data = super(SessionStore, self).load()
+        self._stored = copy.deepcopy(data)
+        return data
+
+    def exists(self, session_key):
+        if session_key and writer.get(session_key) is not None:
+            return True
+        return super(SessionStore, self).exists(session_key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        if not must_create and data == getattr(self, '_stored', None):
+            return
+        if must_create:
+            if not self._cache.add(self.cache_key, data,
+                                   self.get_expiry_age()):
+                raise CreateError
+        else:
+            self._cache.set(self.cache_key, data, self.get_expiry_age())
+        writer.enqueue(self.create_model_instance(data))
+        self._stored = copy.deepcopy(data)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        if session_key is not None:
+            writer.discard(session_key)
+            # Outlives any save queued before the delete.
+            self._cache.set(TOMBSTONE_PREFIX + session_key, True,
+                            3 * settings.SHOP_SESSION_WRITE_DELAY + 60)
+        super(SessionStore, self).delete(session_key)
@@ -0,0 +1,175 @@
+from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver, Signal
+
+from . import bake, changelog, counters, listings
+from .bulk import chunked
+from .cache import bump_on_commit, category_namespace, product_namespace
+from .models import Category, Product, ProductListing
+from .search import get_search_backend
+from .thumbnails import schedule_thumbnails
+
+# Sent after Product rows were written without model signals (bulk_create,
+# bulk_update, queryset update). ``category_ids`` must include the
+# categories products were moved out of.
+products_bulk_changed = Signal(providing_args=['product_ids', 'category_ids'])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+def log_saved_row(sender, instance, created, **kwargs):
+    changelog.row_saved(instance, created)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+def log_deleted_row(sender, instance, **kwargs):
+    changelog.row_deleted(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    slugs = {instance.slug, instance.get_loaded_value('slug', instance.slug)}
+    bump_on_commit('categories',
+                   *[category_namespace(slug) for slug in slugs])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    category_ids = {instance.category_id,
+                    instance.get_loaded_value('category_id',
+                                              instance.category_id)}
+    slugs = Category.objects.filter(pk__in=category_ids) \
+                            .values_list('slug', flat=True)
+    bump_on_commit('products', product_namespace(instance.pk),
+                   *[category_namespace(slug) for slug in slugs])
+
+
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        counters.product_saved(instance, created)
+
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, instance, **kwargs):
+    counters.product_deleted(instance)
+
+
+@receiver(post_save, sender=Product)
+def list_saved_product(sender, instance, raw=False, **kwargs):
+    if not raw:
+        listings.refresh([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unlist_deleted_product(sender, instance, **kwargs):
+    ProductListing.objects.filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Category)
+def relist_category(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw and \
+            instance.get_loaded_value('slug', instance.slug) != instance.slug:
+        listings.rename_category(instance)
+
+
+@receiver(post_save, sender=Category)
+def index_category_products(sender, instance, created, **kwargs):
+    if not created and instance.get_loaded_value('name') != instance.name:
+        get_search_backend().index(Product.objects.filter(category=instance))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    get_search_backend().index(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Product)
+def render_thumbnails(sender, instance, raw=False, **kwargs):
+    name = instance.image.name
+    if name and not raw and name != instance.get_loaded_value('image'):
+        transaction.on_commit(lambda: schedule_thumbnails(
+            name, lambda: listings.show_thumbnails([name])))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def discard_baked_category(sender, instance, **kwargs):
+    if not bake.enabled():
+        return
+    old_slug = instance.get_loaded_value('slug', instance.slug)
+    bake.discard_on_commit(
+        [reverse('shop:product_list_by_category', args=[old_slug])],
+        listings=True)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def discard_baked_product(sender, instance, created=False, **kwargs):
+    if not bake.enabled():
+        return
+    slugs = {instance.slug, instance.get_loaded_value('slug', instance.slug)}
+    paths = [reverse('shop:product_detail', args=[instance.pk, slug])
+             for slug in slugs]
+    counted = ('available', 'category_id')
+    if (created or kwargs.get('signal') is post_delete or
+            any(instance.get_loaded_value(name) != getattr(instance, name)
+                for name in counted)):
+        # The counters every listing shows changed.
+        bake.discard_on_commit(paths, listings=True)
+    else:
+        bake.discard_on_commit(paths + [reverse('shop:product_list')] + [
+            reverse('shop:product_list_by_category', args=[slug])
+            for slug in Category.objects.filter(pk=instance.category_id)
+                                        .values_list('slug', flat=True)])
+
+
+@receiver(products_bulk_changed)
+def invalidate_bulk_products(sender, product_ids, category_ids, **kwargs):
+    slugs = []
+    for chunk in chunked(category_ids, 500):
+        slugs += Category.objects.filter(pk__in=chunk) \
+                                 .values_list('slug', flat=True)
+    bump_on_commit(
+        'products',
+        *([product_namespace(pk) for pk in product_ids] +
+          [category_namespace(slug) for slug in slugs]))
+
+
+@receiver(products_bulk_changed)
+def count_bulk_products(sender, category_ids, **kwargs):
+    counters.rebuild_category_counters(category_ids)
+    bump_on_commit('categories')
+
+
+@receiver(products_bulk_changed)
+def list_bulk_products(sender, product_ids, **kwargs):
+    listings.refresh(product_ids)
+
+
+@receiver(products_bulk_changed)
+def index_bulk_products(sender, product_ids, **kwargs):
+    backend = get_search_backend()
+    for chunk in chunked(product_ids, 500):
+        backend.index(Product.objects.filter(pk__in=chunk))
+
+
+@receiver(products_bulk_changed)
+def discard_bulk_baked_products(sender, product_ids, **kwargs):
+    if not bake.enabled():
+        return
+    paths = []
+    for chunk in chunked(product_ids, 500):
+        paths += [reverse('shop:product_detail', args=[pk, slug])
+                  for pk, slug in Product.objects.filter(pk__in=chunk)
+                                                 .values_list('pk', 'slug')]
+    bake.discard_on_commit(paths, listings=True)
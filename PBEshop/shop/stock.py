@@ -0,0 +1,207 @@
+"""
+Stock reservations.
+
+Reserving takes units out of ``Product.stock`` straight away with a
+conditional ``UPDATE ... SET stock = stock - n WHERE stock >= n``, so two
+checkouts can never both take the last unit, whatever the database's
+isolation level. Every reservation is recorded as a ``StockReservation``
+hold that either gets confirmed (the units are sold) or released, by the
+caller or by ``release_expired()`` once it expires, which puts the units
+back.
+
+A product that runs out is marked unavailable and ``sold_out`` in the same
+statement, and only such a product comes back when released units return
+to its stock, never one an admin hid.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from . import jobs, listings
+from .cache import bump_on_commit, category_namespace, product_namespace
+from .models import Category, Product, StockReservation
+from .signals import products_bulk_changed
+
+
+class InsufficientStock(Exception):
+    """
+    ``name`` is that of the product, None when it was deleted, and ``left``
+    the units still for sale, None when it is no longer sold at all.
+    """
+
+    def __init__(self, product_id, quantity, name=None, left=None):
+        super(InsufficientStock, self).__init__(
+            'Product %s has fewer than %d units available.' % (product_id,
+                                                               quantity))
+        self.product_id = product_id
+        self.quantity = quantity
+        self.name = name
+        self.left = left
+
+
+def _insufficient(product_id, quantity):
+    row = Product.objects.filter(pk=product_id) \
+                         .values_list('name', 'stock', 'available',
+                                      'sold_out').first()
+    if row is None:
+        return InsufficientStock(product_id, quantity)
+    name, stock, available, sold_out = row
+    if available:
+        left = stock
+    elif sold_out:
+        left = 0
+    else:
+        left = None
+    return InsufficientStock(product_id, quantity, name, left)
+
+
+def _quantities(items):
+    quantities = {}
+    for product, quantity in items:
+        product_id = getattr(product, 'pk', product)
+        if quantity < 1:
+            raise ValueError('Cannot reserve %r units.' % quantity)
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def _stock_changed(product_ids, availability_changed, defer=False):
+    bump_on_commit(*[product_namespace(pk) for pk in product_ids])
+    if availability_changed:
+        category_ids = set(Product.objects.filter(pk__in=availability_changed)
+                                          .values_list('category', flat=True))
+        if defer:
+            # Listings must not offer what just sold out until the job runs,
+            # in another process that may not even share this one's cache.
+            listings.refresh(availability_changed)
+            bump_on_commit('products', *[
+                category_namespace(slug) for slug in
+                Category.objects.filter(pk__in=category_ids)
+                                .values_list('slug', flat=True)])
+            jobs.enqueue('shop.products_changed',
+                         {'product_ids': availability_changed,
+                          'category_ids': sorted(category_ids)})
+        else:
+            products_bulk_changed.send(sender=Product,
+                                       product_ids=availability_changed,
+                                       category_ids=category_ids)
+
+
+def reserve_many(items, reference, ttl=None, defer=False):
+    """
+    Reserves every ``(product or id, quantity)`` pair of ``items`` for
+    ``reference``, for ``ttl`` seconds, and returns the new holds. Either
+    every line is reserved or ``InsufficientStock`` is raised for the first
+    line that cannot be and nothing is.
+
+    With ``defer``, the counters, search index and baked pages of products
+    that sell out are updated by a background job instead, see shop.jobs.
+    """
+    quantities = _quantities(items)
+    if ttl is None:
+        ttl = settings.SHOP_RESERVATION_TTL
+    now = timezone.now()
+    expires = now + datetime.timedelta(seconds=ttl)
+    with transaction.atomic():
+        # A fixed locking order keeps concurrent multi-line reservations
+        # from deadlocking on databases with row locks.
+        for product_id in sorted(quantities):
+            quantity = quantities[product_id]
+            reserved = Product.objects.filter(
+                pk=product_id, available=True, stock__gte=quantity,
+            ).update(
+                stock=F('stock') - quantity,
+                available=Case(When(stock=quantity, then=Value(False)),
+                               default=Value(True)),
+                sold_out=Case(When(stock=quantity, then=Value(True)),
+                              default=Value(False)),
+                updated=now)
+            if not reserved:
+                raise _insufficient(product_id, quantity)
+        holds = [StockReservation(product_id=product_id, quantity=quantity,
+                                  reference=reference, expires=expires)
+                 for product_id, quantity in sorted(quantities.items())]
+        StockReservation.objects.bulk_create(holds)
+        sold_out = list(Product.objects.filter(pk__in=quantities, stock=0)
+                                       .values_list('pk', flat=True))
+        _stock_changed(list(quantities), sold_out, defer)
+    return holds
+
+
+def reserve(product, quantity, reference, ttl=None, defer=False):
+    return reserve_many([(product, quantity)], reference, ttl, defer)[0]
+
+
+def _claim(holds):
+    """
+    Deletes ``holds`` one by one and returns the units of those this call
+    deleted per product, so that a hold released concurrently by someone
+    else is never counted twice.
+    """
+    claimed = {}
+    for hold in holds:
+        deleted, _ = StockReservation.objects.filter(pk=hold.pk).delete()
+        if deleted:
+            claimed[hold.product_id] = (claimed.get(hold.product_id, 0) +
+                                        hold.quantity)
+    return claimed
+
+
+def _return_stock(quantities):
+    now = timezone.now()
+    for product_id in sorted(quantities):
+        Product.objects.filter(pk=product_id).update(
+            stock=F('stock') + quantities[product_id],
+            available=Case(When(sold_out=True, then=Value(True)),
+                           default=F('available')),
+            sold_out=False,
+            updated=now)
+    back = list(Product.objects.filter(pk__in=quantities, available=True,
+                                       stock__in=list(quantities.values()))
+                               .values_list('pk', 'stock'))
+    _stock_changed(list(quantities),
+                   [pk for pk, stock in back if stock == quantities[pk]])
+
+
+def release(reference):
+    """
+    Puts the units held for ``reference`` back into stock and returns them
+    as a dict of quantities per product id.
+    """
+    with transaction.atomic():
+        returned = _claim(StockReservation.objects.filter(reference=reference))
+        if returned:
+            _return_stock(returned)
+    return returned
+
+
+def confirm(reference):
+    """
+    Turns the holds of ``reference`` into sales and returns the quantities
+    confirmed per product id. Holds that expired and were already released
+    are missing from the result, the caller decides what to do about them.
+    """
+    with transaction.atomic():
+        return _claim(StockReservation.objects.filter(reference=reference))
+
+
+def release_expired(now=None, batch_size=500):
+    """
+    Puts the units of every expired hold back into stock and returns the
+    number of holds released.
+    """
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            holds = list(StockReservation.objects.filter(expires__lte=now)
+                                                 .order_by('pk')[:batch_size])
+            returned = _claim(holds)
+            if returned:
+                _return_stock(returned)
+        released += len(holds)
+        if len(holds) < batch_size:
+            return released
@@ -0,0 +1,104 @@
+"""
+Static files storage for collectstatic.
+
+``CompressedManifestStaticFilesStorage`` stores every file a second time
+under a name with a hash of its content, ``admin/css/base.5af66c1b1797.css``,
+which ``{% static %}`` links to and which can be cached forever. Next to
+each hashed file it writes ``.gz`` and, when the ``brotli`` package is
+installed, ``.br`` variants, for the web server (or ``PBEshop.static_wsgi``)
+to send to clients that accept them.
+
+Compressing is the slow part of collectstatic, so the digest each file was
+compressed from is kept in ``COMPRESSED_MANIFEST`` and files whose content
+did not change since the last run are skipped.
+"""
+import gzip
+import hashlib
+import json
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_MANIFEST = 'compressed.json'
+
+# Images and fonts other than these are compressed already.
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.html', '.txt',
+                '.xml', '.ico', '.eot', '.otf', '.ttf')
+
+# Smaller files do not fill a packet anyway.
+MIN_SIZE = 256
+
+
+def compressors():
+    yield '.gz', lambda content: gzip.compress(content, 9)
+    if brotli is not None:
+        yield '.br', brotli.compress
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def stored_name(self, name):
+        # No manifest means collectstatic never ran, as in development and
+        # tests, where the files are found under their own names.
+        if not self.hashed_files:
+            return name
+        return super(CompressedManifestStaticFilesStorage,
+                     self).stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        processed_files = super(CompressedManifestStaticFilesStorage,
+                                self).post_process(paths, dry_run, **options)
+        if dry_run:
+            for processed_file in processed_files:
+                yield processed_file
+            return
+        previous = self.load_compressed()
+        compressed = {}
+        for name, hashed_name, processed in processed_files:
+            if (hashed_name and not isinstance(processed, Exception) and
+                    hashed_name.endswith(COMPRESSIBLE)):
+                digest = self.compress(hashed_name, previous.get(hashed_name))
+                compressed[hashed_name] = digest
+            yield name, hashed_name, processed
+        self.save_compressed(compressed)
+
+    def compress(self, name, previous_digest=None):
+        """
+        Writes the compressed variants of ``name`` that are smaller than it
+        and returns the digest of its content.
+        """
+        with self.open(name) as f:
+            content = f.read()
+        digest = hashlib.sha1(content).hexdigest()
+        variants = [(name + suffix, compressor)
+                    for suffix, compressor in compressors()]
+        if digest == previous_digest and all(
+                self.exists(variant) for variant, _ in variants):
+            return digest
+        for variant, compressor in variants:
+            if self.exists(variant):
+                self.delete(variant)
+            if len(content) < MIN_SIZE:
+                continue
+            data = compressor(content)
+            if len(data) < len(content):
+                self._save(variant, ContentFile(data))
+        return digest
+
+    def load_compressed(self):
+        try:
+            with self.open(COMPRESSED_MANIFEST) as f:
+                return json.loads(f.read().decode('utf-8'))
+        except (IOError, ValueError):
+            return {}
+
+    def save_compressed(self, compressed):
+        if self.exists(COMPRESSED_MANIFEST):
+            self.delete(COMPRESSED_MANIFEST)
+        contents = json.dumps(compressed, sort_keys=True).encode('utf-8')
+        self._save(COMPRESSED_MANIFEST, ContentFile(contents))
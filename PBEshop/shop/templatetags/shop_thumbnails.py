@@ -0,0 +1,16 @@
+from django import template
+
+from ..thumbnails import resolve_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def thumbnail_url(context, image, size):
+    """
+    ``{% thumbnail_url product.image 'small' %}`` gives the URL of the
+    rendered thumbnail, as WebP when the browser accepts it.
+    """
+    request = context.get('request')
+    accept = request.META.get('HTTP_ACCEPT', '') if request else ''
+    return resolve_thumbnail(image, size, accept_webp='image/webp' in accept)
@@ -0,0 +1,138 @@
+from decimal import Decimal
+
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings, TestCase
+from django.test.utils import CaptureQueriesContext
+
+from ..cache import get_catalogue_cache, product_namespace
+from ..models import Category, Product
+from ..pagination import EstimatedCountPaginator
+from .test_sessions import QueuedSessionsMixin
+
+URL = '/admin/shop/product/'
+
+
+class ProductAdminTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        self.category = Category.objects.create(name='shoes', slug='shoes')
+        self.products = [
+            Product.objects.create(category=self.category, name=name,
+                                   slug=name, price=Decimal(price),
+                                   stock=stock)
+            for name, price, stock in (('a', '10.00', 10),
+                                       ('b', '19.99', 1),
+                                       ('c', '5.00', 0))]
+
+    def reload(self):
+        return [Product.objects.get(pk=p.pk) for p in self.products]
+
+    def test_changelist_joins_categories(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(URL)
+        self.assertContains(response, 'shoes')
+        sql = [q['sql'] for q in queries.captured_queries
+               if 'shop_product' in q['sql']]
+        # The estimate, the exact count of a small table and the page with
+        # its categories, no second count and no query per row.
+        self.assertEqual(len(sql), 3, sql)
+        self.assertTrue(sql[0].startswith('SELECT MAX('))
+        self.assertIn('JOIN "shop_category"', sql[2])
+
+    @override_settings(SHOP_ADMIN_ESTIMATED_COUNT_ABOVE=2)
+    def test_estimated_count(self):
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        paginator = EstimatedCountPaginator(Product.objects.all(), 100)
+        # The largest id, deleted rows are not noticed.
+        self.assertEqual(paginator.count, self.products[-1].pk)
+        paginator = EstimatedCountPaginator(
+            Product.objects.filter(stock__lt=100), 100)
+        self.assertEqual(paginator.count, 2)
+
+    @override_settings(SHOP_ADMIN_ESTIMATED_COUNT_ABOVE=1000)
+    def test_small_tables_are_counted(self):
+        Product.objects.filter(pk=self.products[0].pk).delete()
+        paginator = EstimatedCountPaginator(Product.objects.all(), 100)
+        self.assertEqual(paginator.count, 2)
+
+    def test_list_editable_saves_in_one_update(self):
+        a, b, c = self.products
+        namespace = product_namespace(b.pk)
+        versions = get_catalogue_cache().versions([namespace])
+        data = {
+            'form-TOTAL_FORMS': '3',
+            'form-INITIAL_FORMS': '3',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+            '_save': 'Save',
+        }
+        for i, (product, price, available) in enumerate(
+                ((a, '10.00', True), (b, '25.00', False), (c, '6.00', True))):
+            data.update({
+                'form-%d-id' % i: str(product.pk),
+                'form-%d-price' % i: price,
+                'form-%d-stock' % i: str(product.stock),
+            })
+            if available:
+                data['form-%d-available' % i] = 'on'
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(URL, data)
+        self.assertEqual(response.status_code, 302)
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+
+        a, b, c = self.reload()
+        self.assertEqual((a.price, b.price, c.price),
+                         (Decimal('10.00'), Decimal('25.00'), Decimal('6.00')))
+        self.assertFalse(b.available)
+        self.assertGreater(b.updated, self.products[1].updated)
+        self.assertEqual(a.updated, self.products[0].updated)
+        self.assertEqual(LogEntry.objects.count(), 2)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 2)
+        self.assertNotEqual(get_catalogue_cache().versions([namespace]),
+                            versions)
+
+    def action(self, action, percentage, products=None):
+        return self.client.post(URL, {
+            'action': action,
+            'percentage': percentage,
+            '_selected_action': [p.pk for p in products or self.products],
+            'index': '0',
+        }, follow=True)
+
+    def test_adjust_price(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.action('adjust_price', '10')
+        updates = [q['sql'] for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE "shop_product"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual([p.price for p in self.reload()],
+                         [Decimal('11.00'), Decimal('21.99'), Decimal('5.50')])
+
+    def test_adjust_stock_marks_sold_out_products(self):
+        self.action('adjust_stock', '-60')
+        a, b, c = self.reload()
+        self.assertEqual((a.stock, b.stock, c.stock), (4, 0, 0))
+        self.assertEqual((a.available, b.available, c.available),
+                         (True, False, True))
+        self.assertEqual((a.sold_out, b.sold_out, c.sold_out),
+                         (False, True, False))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 2)
+
+        self.action('adjust_stock', '-100', [a])
+        self.assertFalse(Product.objects.get(pk=a.pk).available)
+
+    def test_adjust_needs_percentage(self):
+        response = self.action('adjust_price', '')
+        self.assertContains(response, 'Enter the percentage to adjust by.')
+        self.assertEqual([p.price for p in self.reload()],
+                         [p.price for p in self.products])
+        self.action('adjust_stock', '-150')
+        self.assertEqual([p.stock for p in self.reload()], [10, 1, 0])
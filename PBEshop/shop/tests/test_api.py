@@ -0,0 +1,132 @@
+import json
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from decimal import Decimal
+
+from ..models import Category, Product
+from ..pagination import encode_cursor
+
+class ApiTestMixin(object):
+
+    def setUp(self):
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.hats = Category.objects.create(name='Hats', slug='hats')
+        self.boots = self.create_product(self.shoes, 'Boots')
+        self.clogs = self.create_product(self.shoes, 'Clogs')
+        self.cap = self.create_product(self.hats, 'Cap')
+        self.hidden = self.create_product(self.hats, 'Hidden', False)
+
+    def create_product(self, category, name, available=True):
+        return Product.objects.create(category=category,
+                                      name=name,
+                                      slug=name.lower(),
+                                      description='long text',
+                                      price=Decimal('9.99'),
+                                      stock=1,
+                                      available=available)
+
+    def get_json(self, url, data=None, status=200):
+        response = self.client.get(url, data or {})
+        self.assertEqual(response.status_code, status)
+        return json.loads(response.content.decode('utf-8'))
+
+class ProductListApiTest(ApiTestMixin, TestCase):
+
+    def test_lists_available_products(self):
+        data = self.get_json('/api/products/')
+        self.assertEqual([p['name'] for p in data['results']],
+                         ['Boots', 'Cap', 'Clogs'])
+        self.assertEqual(data['results'][0]['category'], 'shoes')
+        self.assertEqual(data['results'][0]['price'], '9.99')
+        self.assertEqual(data['results'][0]['url'],
+                         self.boots.get_absolute_url())
+
+    def test_cursor_pagination(self):
+        data = self.get_json('/api/products/', {'limit': 2})
+        self.assertIsNone(data['previous'])
+        data = self.get_json(data['next'])
+        self.assertEqual([p['name'] for p in data['results']], ['Clogs'])
+        self.assertIsNone(data['next'])
+        data = self.get_json(data['previous'])
+        self.assertEqual([p['name'] for p in data['results']],
+                         ['Boots', 'Cap'])
+
+    def test_category_filter(self):
+        data = self.get_json('/api/products/', {'category': 'hats'})
+        self.assertEqual([p['name'] for p in data['results']], ['Cap'])
+        data = self.get_json('/api/products/', {'category': 'missing'},
+                             status=404)
+        self.assertEqual(data['error'], 'Unknown category: missing')
+
+    def test_image_is_a_url(self):
+        Product.objects.filter(pk=self.boots.pk).update(
+            image='products/boots.jpg')
+        data = self.get_json('/api/products/', {'fields': 'id,image'})
+        self.assertEqual(data['results'][0]['image'],
+                         settings.MEDIA_URL + 'products/boots.jpg')
+        self.assertEqual(data['results'][1]['image'], '')
+
+    def test_sparse_fields_skip_columns(self):
+        with self.assertNumQueries(1):
+            data = self.get_json('/api/products/', {'fields': 'id,price'})
+        self.assertEqual(data['results'][0],
+                         {'id': self.boots.id, 'price': '9.99'})
+
+    def test_sparse_fields_select_only_needed_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json('/api/products/', {'fields': 'name'})
+        self.assertNotIn('description', queries[0]['sql'])
+
+    def test_unknown_field(self):
+        data = self.get_json('/api/products/', {'fields': 'name,secret'},
+                             status=400)
+        self.assertIn('secret', data['error'])
+
+    def test_invalid_cursor(self):
+        self.get_json('/api/products/', {'after': 'bad'}, status=400)
+        self.get_json('/api/products/',
+                      {'after': encode_cursor(['boot', 'x'])}, status=400)
+
+    def test_invalid_limit(self):
+        for limit in ('-5', '0', 'many'):
+            self.get_json('/api/products/', {'limit': limit}, status=400)
+
+    def test_post_not_allowed(self):
+        self.assertEqual(self.client.post('/api/products/').status_code, 405)
+
+class ProductDetailApiTest(ApiTestMixin, TestCase):
+
+    def test_detail(self):
+        data = self.get_json('/api/products/%d/' % self.cap.id,
+                             {'fields': 'name,url'})
+        self.assertEqual(data, {'name': 'Cap',
+                                'url': self.cap.get_absolute_url()})
+
+    def test_unavailable_is_404(self):
+        self.get_json('/api/products/%d/' % self.hidden.id, status=404)
+
+class ProductBatchApiTest(ApiTestMixin, TestCase):
+
+    def test_batch_in_one_query(self):
+        ids = [self.clogs.id, self.hidden.id, self.boots.id, 999]
+        with self.assertNumQueries(1):
+            data = self.get_json('/api/products/batch/', {
+                'ids': ','.join(str(pk) for pk in ids),
+                'fields': 'id,name',
+            })
+        self.assertEqual(data['results'], [
+            {'id': self.clogs.id, 'name': 'Clogs'},
+            {'id': self.boots.id, 'name': 'Boots'},
+        ])
+        self.assertEqual(data['missing'], [self.hidden.id, 999])
+
+    def test_bad_ids(self):
+        self.get_json('/api/products/batch/', {'ids': '1,x'}, status=400)
+
+    def test_too_many_ids(self):
+        ids = ','.join(str(pk) for pk in range(1, 102))
+        self.get_json('/api/products/batch/', {'ids': ids}, status=400)
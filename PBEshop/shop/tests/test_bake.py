@@ -0,0 +1,108 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings, TestCase, TransactionTestCase
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from ..bake import page_file
+from ..models import Category, Product
+
+class BakeCatalogueTest(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(SHOP_BAKE_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.category = Category.objects.create(name='shoes', slug='shoes')
+        self.products = [Product.objects.create(category=self.category,
+                                                name=name,
+                                                slug=name,
+                                                price=Decimal(1),
+                                                stock=1)
+                         for name in ('first', 'second')]
+
+    def bake(self, **options):
+        out = StringIO()
+        call_command('bake_catalogue', workers=1, stdout=out, **options)
+        return out.getvalue()
+
+    def exists(self, path):
+        return os.path.exists(page_file(path, self.root))
+
+    def test_bakes_every_page_with_variants(self):
+        self.assertIn('Baked 4 of 4 pages', self.bake())
+        for path in ('/', '/shoes/', self.products[0].get_absolute_url()):
+            name = page_file(path, self.root)
+            with open(name, 'rb') as f:
+                content = f.read()
+            self.assertEqual(content, self.client.get(path).content)
+            with gzip.open(name + '.gz') as f:
+                self.assertEqual(f.read(), content)
+
+    def test_rebakes_only_changed_pages(self):
+        self.bake()
+        self.assertIn('Baked 0 of 4 pages', self.bake())
+        product = self.products[0]
+        product.price = Decimal(2)
+        product.save()
+        # Served by Django until the next run.
+        self.assertFalse(self.exists(product.get_absolute_url()))
+        self.assertFalse(self.exists('/shoes/'))
+        self.assertTrue(self.exists(self.products[1].get_absolute_url()))
+        self.assertIn('Baked 3 of 4 pages', self.bake())
+        self.assertIn('Baked 4 of 4 pages', self.bake(force=True))
+
+    def test_removes_pages_of_withdrawn_products(self):
+        self.bake()
+        path = self.products[0].get_absolute_url()
+        Product.objects.filter(pk=self.products[0].pk).update(available=False)
+        self.assertIn('removed 1', self.bake())
+        self.assertFalse(self.exists(path))
+        self.assertFalse(os.path.exists(os.path.dirname(
+            os.path.dirname(page_file(path, self.root)))))
+
+    def test_category_rename_discards_listings(self):
+        self.bake()
+        self.category.name = 'boots'
+        self.category.save()
+        self.assertFalse(self.exists('/'))
+        self.assertFalse(self.exists('/shoes/'))
+        self.assertTrue(self.exists(self.products[0].get_absolute_url()))
+
+class DiscardOnCommitTest(TransactionTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(SHOP_BAKE_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        category = Category.objects.create(name='shoes', slug='shoes')
+        self.product = Product.objects.create(category=category,
+                                              name='first', slug='first',
+                                              price=Decimal(1), stock=1)
+
+    def bake_page(self, path):
+        name = page_file(path, self.root)
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+        with open(name, 'w') as f:
+            f.write('stale')
+        return name
+
+    def test_pages_baked_during_a_change_are_discarded_on_commit(self):
+        path = self.product.get_absolute_url()
+        with transaction.atomic():
+            self.product.price = Decimal(2)
+            self.product.save()
+            # A run baking meanwhile still reads the old price.
+            names = [self.bake_page(path), self.bake_page('/shoes/')]
+        for name in names:
+            self.assertFalse(os.path.exists(name))
@@ -0,0 +1,100 @@
+from django.core.management import call_command, CommandError
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from ..benchmark import (compare_results, generate_catalogue, percentile,
+                         run_benchmark)
+from ..models import Category, ChangeLogEntry, Product, ProductListing
+from ..search import search_products
+
+class GenerateCatalogueTest(TestCase):
+
+    def test_generates_a_consistent_catalogue(self):
+        generate_catalogue(3, 30, unavailable_ratio=0)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(Product.objects.count(), 30)
+        self.assertEqual(
+            list(Category.objects.values_list('product_count', flat=True)),
+            [10, 10, 10])
+        product = Product.objects.order_by('pk')[0]
+        self.assertEqual(product.get_absolute_url(),
+                         '/%d/%s/' % (product.pk, product.slug))
+        self.assertIn(product, [p for p, _ in search_products(product.name)])
+
+    def test_logs_what_it_creates(self):
+        generate_catalogue(2, 5, batch_size=2)
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.filter(action=ChangeLogEntry.CREATE)
+                                         .values_list('model', 'object_id')),
+            sorted([('shop.category', pk) for pk in
+                    Category.objects.values_list('pk', flat=True)] +
+                   [('shop.product', pk) for pk in
+                    Product.objects.values_list('pk', flat=True)]))
+
+    def test_lists_the_available_products(self):
+        generate_catalogue(2, 20, unavailable_ratio=0.5)
+        available = Product.objects.filter(available=True)
+        self.assertTrue(available.exists())
+        self.assertEqual(
+            list(ProductListing.objects.order_by('pk')
+                                       .values_list('pk', 'name')),
+            list(available.order_by('pk').values_list('pk', 'name')))
+
+    def test_same_seed_same_catalogue(self):
+        generate_catalogue(2, 5, seed=7)
+        first = list(Product.objects.order_by('pk')
+                                    .values_list('name', 'price', 'stock'))
+        Product.objects.all().delete()
+        generate_catalogue(2, 5, seed=7)
+        self.assertEqual(list(Product.objects.order_by('pk')
+                                     .values_list('name', 'price', 'stock')),
+                         first)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('generate_catalogue', categories=2, products=4,
+                     stdout=out)
+        self.assertEqual(Product.objects.count(), 4)
+        self.assertIn('Generated 2 categories and 4 products', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('generate_catalogue', categories=0)
+
+class PercentileTest(TestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+class RunBenchmarkTest(TestCase):
+
+    def test_times_every_scenario(self):
+        generate_catalogue(2, 20, unavailable_ratio=0)
+        results = run_benchmark(iterations=3, warmup=1)
+        self.assertEqual(sorted(results), [
+            'admin_product_changelist', 'product_detail', 'product_list',
+            'product_list_by_category'])
+        for result in results.values():
+            self.assertEqual(result['requests'], 3)
+            self.assertGreater(result['queries_min'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+
+class CompareResultsTest(TestCase):
+
+    def results(self, p95, queries):
+        return {'runs': [{'products': 1000, 'scenarios': {
+            'product_list': {'p95_ms': p95, 'queries_max': queries}}}]}
+
+    def test_reports_regressions(self):
+        baseline = self.results(10.0, 2)
+        self.assertEqual(compare_results(baseline, self.results(11.0, 2)), [])
+        self.assertEqual(len(compare_results(baseline,
+                                             self.results(13.0, 3))), 2)
+
+    def test_ignores_sizes_missing_from_baseline(self):
+        current = self.results(100.0, 9)
+        current['runs'][0]['products'] = 5
+        self.assertEqual(compare_results(self.results(1.0, 1), current), [])
@@ -0,0 +1,28 @@
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.test import TestCase
+
+from PBEshop import bootstrap
+
+
+class BootstrapTest(TestCase):
+
+    def test_warm_up_prepares_the_handler(self):
+        handler = WSGIHandler()
+        with self.assertLogs('PBEshop.bootstrap', 'INFO') as logs:
+            timings = bootstrap.warm_up(handler)
+        self.assertIn('Warmed up process', logs.output[0])
+        self.assertEqual([name for name, _ in timings],
+                         ['middleware', 'urls', 'templates', 'backends'])
+        self.assertIsNotNone(handler._request_middleware)
+        # Warming up twice loads nothing again.
+        middleware = handler._request_middleware
+        with self.assertLogs('PBEshop.bootstrap', 'INFO'):
+            bootstrap.warm_up(handler)
+        self.assertIs(handler._request_middleware, middleware)
+
+    def test_connect(self):
+        with self.assertLogs('PBEshop.bootstrap', 'INFO'):
+            bootstrap.connect()
+        for alias in connections:
+            self.assertIsNotNone(connections[alias].connection)
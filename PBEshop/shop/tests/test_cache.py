@@ -0,0 +1,158 @@
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from decimal import Decimal
+
+from ..cache import (CatalogueCache, LRUCacheBackend, DjangoCacheBackend,
+                     check_shared_backend, get_catalogue_cache,
+                     product_namespace)
+from ..models import Category, Product
+
+class LRUCacheBackendTest(TestCase):
+
+    def test_evicts_least_recently_used(self):
+        backend = LRUCacheBackend(max_entries=2)
+        backend.set_many({'a': 1, 'b': 2})
+        backend.get_many(['a'])
+        backend.set_many({'c': 3})
+        self.assertEqual(backend.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    def test_add_keeps_existing_value(self):
+        backend = LRUCacheBackend()
+        self.assertTrue(backend.add('a', 1))
+        self.assertFalse(backend.add('a', 2))
+        self.assertEqual(backend.get_many(['a']), {'a': 1})
+
+class CatalogueCacheTest(TestCase):
+
+    def test_bump_changes_key(self):
+        cache = CatalogueCache(LRUCacheBackend())
+        key = cache.make_key('page', ['products'], '/')
+        self.assertEqual(cache.make_key('page', ['products'], '/'), key)
+        cache.bump('products')
+        self.assertNotEqual(cache.make_key('page', ['products'], '/'), key)
+
+    def test_counts_hits_and_misses(self):
+        cache = CatalogueCache(LRUCacheBackend())
+        cache.get('key')
+        cache.set('key', 'value')
+        cache.get('key')
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_shared_backend_versions(self):
+        cache = CatalogueCache(DjangoCacheBackend())
+        other_worker = CatalogueCache(DjangoCacheBackend())
+        key = cache.make_key('page', ['products'], '/')
+        self.assertEqual(other_worker.make_key('page', ['products'], '/'), key)
+        other_worker.bump('products')
+        self.assertNotEqual(cache.make_key('page', ['products'], '/'), key)
+
+    def test_process_local_backends_are_refused(self):
+        shared = {'BACKEND': 'shop.cache.DjangoCacheBackend',
+                  'OPTIONS': {'alias': 'shared'}}
+        caches = {
+            'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': tempfile.gettempdir()},
+        }
+        for config, refused in (
+                ({'BACKEND': 'shop.cache.LRUCacheBackend'}, True),
+                ({'BACKEND': 'shop.cache.DjangoCacheBackend'}, True),
+                (shared, False)):
+            with self.settings(CACHES=caches, SHOP_CACHE=config):
+                if refused:
+                    self.assertRaises(ImproperlyConfigured,
+                                      check_shared_backend)
+                else:
+                    check_shared_backend()
+
+@override_settings(SHOP_CACHE={'BACKEND': 'shop.cache.LRUCacheBackend'})
+class CachedViewsTest(TestCase):
+
+    def setUp(self):
+        self.category1 = Category.objects.create(name='first category',
+                                                 slug='first-category')
+        self.category2 = Category.objects.create(name='second category',
+                                                 slug='second-category')
+        self.product = Product.objects.create(category=self.category1,
+                                              name='first',
+                                              slug='first',
+                                              price=Decimal(1),
+                                              stock=1)
+
+    def test_second_request_is_served_from_cache(self):
+        before = get_catalogue_cache().stats()
+        first = self.client.get('/first-category/')
+        second = self.client.get('/first-category/')
+        self.assertIsNotNone(first.context)
+        self.assertIsNone(second.context)
+        self.assertEqual(first.content, second.content)
+        after = get_catalogue_cache().stats()
+        self.assertEqual(after['hits'] - before['hits'], 1)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+
+    def test_product_save_invalidates_listing_and_detail(self):
+        url = self.product.get_absolute_url()
+        self.client.get('/')
+        self.client.get(url)
+        self.product.price = Decimal(2)
+        self.product.save()
+        self.assertIsNotNone(self.client.get('/').context)
+        self.assertIsNotNone(self.client.get(url).context)
+
+    def test_product_save_keeps_other_category_cached(self):
+        self.client.get('/second-category/')
+        self.product.save()
+        self.assertIsNone(self.client.get('/second-category/').context)
+
+    def test_recategorised_product_invalidates_old_category(self):
+        self.client.get('/first-category/')
+        self.client.get('/second-category/')
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = self.category2
+        product.save()
+        response = self.client.get('/first-category/')
+        self.assertEqual(len(response.context['products']), 0)
+        response = self.client.get('/second-category/')
+        self.assertEqual(len(response.context['products']), 1)
+
+    def test_product_delete_invalidates_listing(self):
+        self.client.get('/first-category/')
+        self.product.delete()
+        response = self.client.get('/first-category/')
+        self.assertEqual(len(response.context['products']), 0)
+
+    def test_category_save_invalidates_every_listing(self):
+        self.client.get('/second-category/')
+        self.category1.name = 'renamed'
+        self.category1.save()
+        self.assertIsNotNone(self.client.get('/second-category/').context)
+
+    def test_not_found_is_not_cached(self):
+        self.client.get('/missing/')
+        hits = get_catalogue_cache().stats()['hits']
+        self.assertEqual(self.client.get('/missing/').status_code, 404)
+        self.assertEqual(get_catalogue_cache().stats()['hits'], hits)
+
+@override_settings(SHOP_CACHE={'BACKEND': 'shop.cache.LRUCacheBackend'})
+class CommitBumpTest(TransactionTestCase):
+
+    def test_page_cached_before_commit_is_dropped(self):
+        category = Category.objects.create(name='category', slug='category')
+        product = Product.objects.create(category=category, name='first',
+                                         slug='first', price=Decimal(1),
+                                         stock=1)
+        cache = get_catalogue_cache()
+        namespaces = ['products', product_namespace(product.pk)]
+        with transaction.atomic():
+            product.price = Decimal(2)
+            product.save()
+            # Another request renders the old price under the new versions.
+            key = cache.make_key('page', namespaces, '/')
+            cache.set(key, 'old price')
+        self.assertNotEqual(cache.make_key('page', namespaces, '/'), key)
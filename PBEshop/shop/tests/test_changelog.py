@@ -0,0 +1,118 @@
+import datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.test import override_settings, TestCase
+from django.utils import timezone
+
+from .. import changelog
+from ..bulk import bulk_update
+from ..changelog import Consumer
+from ..models import Category, ChangeLogEntry, Product
+
+
+class ChangeLogTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='shoes', slug='shoes')
+        self.product = Product.objects.create(category=self.category,
+                                              name='a', slug='a',
+                                              price=Decimal('1.00'), stock=3)
+
+    def entries(self, after=0):
+        return list(ChangeLogEntry.objects.filter(pk__gt=after).values_list(
+            'model', 'object_id', 'action', 'fields'))
+
+    def test_saves_and_deletes(self):
+        self.assertEqual(self.entries(), [
+            ('shop.category', self.category.pk, 'create', ''),
+            ('shop.product', self.product.pk, 'create', ''),
+        ])
+        last = changelog.latest()
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal('2.00')
+        product.save()
+        pk = product.pk
+        product.delete()
+        self.assertEqual(self.entries(last), [
+            ('shop.product', pk, 'update', 'price,updated'),
+            ('shop.product', pk, 'delete', ''),
+        ])
+
+    def test_queryset_update_logs_matched_rows(self):
+        Product.objects.create(category=self.category, name='b', slug='b',
+                               price=Decimal('1.00'), stock=0)
+        last = changelog.latest()
+        Product.objects.filter(stock__gt=0).update(stock=5)
+        Product.objects.filter(stock__gt=100).update(stock=5)
+        # Maintained counters are not changes of their own.
+        Category.objects.update(product_count=0)
+        self.assertEqual(self.entries(last), [
+            ('shop.product', self.product.pk, 'update', 'stock')])
+
+    def test_bulk_update(self):
+        last = changelog.latest()
+        self.product.stock = 1
+        bulk_update([self.product], ['stock', 'updated'])
+        self.assertEqual(self.entries(last), [
+            ('shop.product', self.product.pk, 'update', 'stock,updated')])
+
+    def test_rolled_back_writes_leave_no_entries(self):
+        last = changelog.latest()
+        try:
+            with transaction.atomic():
+                Product.objects.update(stock=0)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(self.entries(last), [])
+
+
+class ConsumerTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='shoes', slug='shoes')
+        for i in range(4):
+            Product.objects.create(category=category, name=str(i),
+                                   slug=str(i), price=Decimal(1), stock=1)
+        self.ids = list(ChangeLogEntry.objects.values_list('pk', flat=True))
+
+    def test_reads_batches_from_the_committed_position(self):
+        consumer = Consumer('search', batch_size=2)
+        batches = [[entry.pk for entry in entries]
+                   for entries in consumer.batches()]
+        self.assertEqual(batches, [self.ids[:2], self.ids[2:4],
+                                   self.ids[4:]])
+        self.assertEqual(Consumer('search').position, 0)
+
+        consumer.seek(self.ids[2])
+        consumer.commit()
+        consumer = Consumer('search', batch_size=2)
+        self.assertEqual([e.pk for e in consumer.read()], self.ids[3:5])
+        # Commits never go back.
+        consumer.seek(self.ids[0])
+        consumer.commit()
+        self.assertEqual(consumer.committed(), self.ids[2])
+
+    @override_settings(SHOP_CHANGELOG_SETTLE=60)
+    def test_waits_for_recent_gaps(self):
+        ChangeLogEntry.objects.filter(pk=self.ids[2]).delete()
+        consumer = Consumer('search')
+        self.assertEqual([e.pk for e in consumer.read()], self.ids[:2])
+        self.assertEqual(consumer.read(), [])
+
+        ChangeLogEntry.objects.update(
+            created=timezone.now() - datetime.timedelta(minutes=2))
+        self.assertEqual([e.pk for e in consumer.read()], self.ids[3:])
+
+    def test_prune(self):
+        self.assertEqual(changelog.prune(), 0)
+        first, second = Consumer('search'), Consumer('export')
+        first.seek(self.ids[3])
+        first.commit()
+        second.seek(self.ids[1])
+        second.commit()
+        self.assertEqual(changelog.prune(), 2)
+        self.assertEqual(list(ChangeLogEntry.objects.values_list('pk',
+                                                                 flat=True)),
+                         self.ids[2:])
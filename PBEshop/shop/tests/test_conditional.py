@@ -0,0 +1,102 @@
+from django.test import TestCase
+from django.utils.http import http_date
+
+from decimal import Decimal
+
+from ..models import Category, Product
+
+class ConditionalListTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='first category',
+                                                slug='first-category')
+        self.first = Product.objects.create(category=self.category,
+                                            name='first',
+                                            slug='first',
+                                            price=Decimal(1),
+                                            stock=1)
+        Product.objects.create(category=self.category,
+                               name='second',
+                               slug='second',
+                               price=Decimal(1),
+                               stock=1)
+
+    def test_headers_are_set(self):
+        response = self.client.get('/first-category/')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertNotIn('Last-Modified', response)
+
+    def test_matching_etag_returns_304_with_one_query(self):
+        etag = self.client.get('/first-category/')['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get('/first-category/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since_is_not_trusted_after_a_delete(self):
+        self.client.get('/')
+        self.first.delete()
+        response = self.client.get('/', HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product.name
+                          for product in response.context['products']],
+                         ['second'])
+
+    def test_product_change_changes_etag(self):
+        etag = self.client.get('/first-category/')['ETag']
+        self.first.stock = 2
+        self.first.save()
+        response = self.client.get('/first-category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_delete_changes_etag(self):
+        etag = self.client.get('/first-category/')['ETag']
+        self.first.delete()
+        response = self.client.get('/first-category/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pages_have_distinct_etags(self):
+        first = self.client.get('/')['ETag']
+        other = self.client.get('/', {'after': 'WyJmaXJzdCIsMV0='})['ETag']
+        self.assertNotEqual(first, other)
+
+    def test_missing_category_still_404(self):
+        response = self.client.get('/missing/')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+class ConditionalDetailTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='first category',
+                                           slug='first-category')
+        self.product = Product.objects.create(category=category,
+                                              name='first',
+                                              slug='first',
+                                              price=Decimal(1),
+                                              stock=1)
+
+    def test_matching_etag_returns_304(self):
+        url = self.product.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_category_rename_changes_etag(self):
+        url = self.product.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.assertNotIn('Last-Modified', self.client.get(url))
+        category = self.product.category
+        category.name = 'renamed'
+        category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unavailable_product_404(self):
+        url = self.product.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.product.available = False
+        self.product.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 404)
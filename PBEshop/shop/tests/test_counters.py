@@ -0,0 +1,96 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from ..counters import rebuild_category_counters
+from ..models import Category, Product
+from .test_sessions import QueuedSessionsMixin
+
+class CategoryCounterTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        self.first = Category.objects.create(name='first', slug='first')
+        self.second = Category.objects.create(name='second', slug='second')
+        self.product = self.create_product(self.first, 'product')
+
+    def create_product(self, category, name, available=True):
+        return Product.objects.create(category=category,
+                                      name=name,
+                                      slug=name,
+                                      price=Decimal(1),
+                                      stock=1,
+                                      available=available)
+
+    def assertCounts(self, first, second):
+        self.assertEqual(Category.objects.get(pk=self.first.pk).product_count,
+                         first)
+        self.assertEqual(Category.objects.get(pk=self.second.pk).product_count,
+                         second)
+
+    def test_create(self):
+        self.create_product(self.first, 'other')
+        self.create_product(self.second, 'hidden', available=False)
+        self.assertCounts(2, 0)
+
+    def test_delete(self):
+        self.product.delete()
+        self.assertCounts(0, 0)
+
+    def test_toggle_available(self):
+        self.product.available = False
+        self.product.save()
+        self.assertCounts(0, 0)
+        self.product.available = True
+        self.product.save()
+        self.assertCounts(1, 0)
+
+    def test_recategorise(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.category = self.second
+        product.save()
+        self.assertCounts(0, 1)
+
+    def test_unchanged_save(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.price = Decimal(2)
+        product.save()
+        self.assertCounts(1, 0)
+
+    def test_category_save_keeps_counter(self):
+        category = Category.objects.get(pk=self.first.pk)
+        self.create_product(self.first, 'other')
+        category.name = 'renamed'
+        category.save()
+        self.assertCounts(2, 0)
+
+    def test_admin_list_editable(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        response = self.client.post('/admin/shop/product/', {
+            'form-TOTAL_FORMS': '1',
+            'form-INITIAL_FORMS': '1',
+            'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '1000',
+            'form-0-id': str(self.product.pk),
+            'form-0-price': '1.00',
+            'form-0-stock': '1',
+            '_save': 'Save',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertCounts(0, 0)
+
+    def test_rebuild(self):
+        self.create_product(self.second, 'other')
+        Category.objects.update(product_count=42)
+        rebuild_category_counters(batch_size=1)
+        self.assertCounts(1, 1)
+
+    def test_rebuild_command(self):
+        Category.objects.update(product_count=0)
+        out = StringIO()
+        call_command('rebuild_category_counters', stdout=out)
+        self.assertIn('2 categories', out.getvalue())
+        self.assertCounts(1, 0)
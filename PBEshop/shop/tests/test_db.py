@@ -0,0 +1,34 @@
+import os
+import shutil
+import tempfile
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import TestCase, override_settings
+
+from ..db import sqlite_pragma
+
+class SqlitePragmasTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def connect(self):
+        settings_dict = dict(connection.settings_dict,
+                             NAME=os.path.join(self.directory, 'db.sqlite3'))
+        wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    def test_new_connections_are_tuned(self):
+        wrapper = self.connect()
+        self.assertEqual(sqlite_pragma(wrapper, 'journal_mode'), 'wal')
+        self.assertEqual(sqlite_pragma(wrapper, 'synchronous'), 1)
+        self.assertEqual(sqlite_pragma(wrapper, 'busy_timeout'), 5000)
+
+    @override_settings(SHOP_SQLITE_PRAGMAS=(('busy_timeout', 250),))
+    def test_pragmas_come_from_settings(self):
+        wrapper = self.connect()
+        self.assertEqual(sqlite_pragma(wrapper, 'journal_mode'), 'delete')
+        self.assertEqual(sqlite_pragma(wrapper, 'busy_timeout'), 250)
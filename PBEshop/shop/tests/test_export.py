@@ -0,0 +1,127 @@
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from .. import export
+from ..export import csv_lines, iter_products
+from ..models import Category, Product
+from .test_sessions import QueuedSessionsMixin
+
+class ExportTestMixin(object):
+
+    def setUp(self):
+        category = Category.objects.create(name='Shoes', slug='shoes')
+        for name in ['boots', 'clogs', 'sandals']:
+            Product.objects.create(category=category,
+                                   name=name.title(),
+                                   slug=name,
+                                   price=Decimal('9.99'),
+                                   stock=1)
+        Product.objects.create(category=category,
+                               name='Hidden',
+                               slug='hidden',
+                               price=Decimal(1),
+                               stock=1,
+                               available=False)
+
+class IterProductsTest(ExportTestMixin, TestCase):
+
+    def test_reads_in_chunks(self):
+        with self.assertNumQueries(2):
+            rows = list(iter_products(chunk_size=2))
+        self.assertEqual([row['slug'] for row in rows],
+                         ['boots', 'clogs', 'sandals'])
+        self.assertEqual(rows[0]['category_slug'], 'shoes')
+
+    def test_csv_round_trips_through_import(self):
+        content = ''.join(csv_lines(iter_products()))
+        rows = list(csv.DictReader(StringIO(content)))
+        self.assertEqual(rows[0]['price'], '9.99')
+        self.assertEqual(rows[0]['category_name'], 'Shoes')
+
+class ExportViewsTest(QueuedSessionsMixin, ExportTestMixin, TestCase):
+
+    def test_export_requires_staff(self):
+        response = self.client.get('/export/products.csv')
+        self.assertEqual(response.status_code, 302)
+
+    def test_jsonl_export_streams(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        self.client.login(username='admin', password='pass')
+        response = self.client.get('/export/products.jsonl')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode('utf-8')
+        rows = [json.loads(line) for line in lines.splitlines()]
+        self.assertEqual([row['slug'] for row in rows],
+                         ['boots', 'clogs', 'sandals'])
+
+    def test_sitemap(self):
+        content = self.client.get('/sitemap.xml').content.decode('utf-8')
+        self.assertIn('<sitemap><loc>http://testserver/sitemap-1.xml</loc>',
+                      content)
+        self.assertTrue(content.endswith('</sitemapindex>\n'))
+        content = self.client.get('/sitemap-1.xml').content.decode('utf-8')
+        boots = Product.objects.get(slug='boots')
+        self.assertIn('<loc>http://testserver%s</loc>'
+                      % boots.get_absolute_url(), content)
+        self.assertNotIn('hidden', content)
+        self.assertTrue(content.endswith('</urlset>\n'))
+        self.assertEqual(self.client.get('/sitemap-2.xml').status_code, 404)
+
+    def test_sitemap_parts_are_bounded_and_cached(self):
+        self.addCleanup(setattr, export, 'SITEMAP_URLS', export.SITEMAP_URLS)
+        export.SITEMAP_URLS = 2
+        last_pk = Product.objects.order_by('-pk')[0].pk
+        parts = (last_pk + 1) // 2
+        content = self.client.get('/sitemap.xml').content.decode('utf-8')
+        self.assertEqual(content.count('<sitemap>'), parts)
+        urls = []
+        for part in range(1, parts + 1):
+            content = self.client.get('/sitemap-%d.xml' % part) \
+                             .content.decode('utf-8')
+            self.assertLessEqual(content.count('<url>'), 2)
+            urls += [line for line in content.splitlines()
+                     if line.startswith('<url>')]
+        self.assertEqual(len(urls), 3)
+        with self.assertNumQueries(0):
+            self.client.get('/sitemap-1.xml')
+
+class ExportCommandTest(ExportTestMixin, TestCase):
+
+    def setUp(self):
+        super(ExportCommandTest, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_writes_gzip(self):
+        path = os.path.join(self.directory, 'products.jsonl.gz')
+        call_command('export_catalogue', path, format='jsonl',
+                     chunk_size=1, stdout=StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), 3)
+        self.assertEqual(os.listdir(self.directory), ['products.jsonl.gz'])
+
+    def test_writes_sitemap(self):
+        path = os.path.join(self.directory, 'sitemap.xml')
+        call_command('export_catalogue', path, format='sitemap',
+                     base_url='https://shop.example.com/', stdout=StringIO())
+        with open(path, encoding='utf-8') as f:
+            self.assertIn('<loc>https://shop.example.com/sitemap-1.xml</loc>',
+                          f.read())
+        with open(os.path.join(self.directory, 'sitemap-1.xml'),
+                  encoding='utf-8') as f:
+            self.assertIn('<loc>https://shop.example.com/', f.read())
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['sitemap-1.xml', 'sitemap.xml'])
@@ -0,0 +1,91 @@
+from django.http import QueryDict
+from django.test import TestCase
+
+from decimal import Decimal
+
+from ..facets import facet_counts, filter_products, parse_filters
+from ..models import Category, Product, ProductListing
+
+class FacetsTest(TestCase):
+
+    def setUp(self):
+        self.shoes = Category.objects.create(name='shoes', slug='shoes')
+        self.hats = Category.objects.create(name='hats', slug='hats')
+        for category, name, price, stock in (
+                (self.shoes, 'cheap shoe', '10', 0),
+                (self.shoes, 'shoe', '30', 5),
+                (self.shoes, 'fancy shoe', '300', 1),
+                (self.hats, 'cheap hat', '20', 3),
+                (self.hats, 'hat', '60', 0)):
+            Product.objects.create(category=category, name=name, slug=name,
+                                   price=Decimal(price), stock=stock)
+        Product.objects.create(category=self.hats, name='hidden',
+                               slug='hidden', price=Decimal(1), stock=1,
+                               available=False)
+        self.products = Product.objects.filter(available=True)
+
+    def counts(self, query, category=None):
+        filters = parse_filters(QueryDict(query))
+        with self.assertNumQueries(2):
+            counts = facet_counts(self.products, filters, category)
+        return filters, dict(
+            categories=counts['categories'],
+            price=dict((r.key, (n, s)) for r, n, s in counts['price']),
+            in_stock=counts['in_stock'])
+
+    def test_unfiltered(self):
+        _, counts = self.counts('')
+        self.assertEqual(counts['categories'],
+                         {self.shoes.pk: 3, self.hats.pk: 2})
+        self.assertEqual(counts['price'], {
+            '0-25': (2, False), '25-50': (1, False), '50-100': (1, False),
+            '100-250': (0, False), '250-': (1, False)})
+        self.assertEqual(counts['in_stock'], 3)
+
+    def test_each_facet_ignores_its_own_filter(self):
+        filters, counts = self.counts('price=0-25&price=250-&in_stock=1')
+        self.assertEqual(counts['categories'],
+                         {self.shoes.pk: 1, self.hats.pk: 1})
+        self.assertEqual(counts['price']['0-25'], (1, True))
+        self.assertEqual(counts['price']['25-50'], (1, False))
+        self.assertEqual(counts['in_stock'], 2)
+        self.assertEqual(
+            sorted(filter_products(self.products, filters)
+                   .values_list('name', flat=True)),
+            ['cheap hat', 'fancy shoe'])
+
+    def test_value_counts_within_category(self):
+        _, counts = self.counts('in_stock=1', self.shoes)
+        self.assertEqual(counts['categories'][self.hats.pk], 1)
+        self.assertEqual(counts['price']['0-25'], (0, False))
+        self.assertEqual(counts['in_stock'], 2)
+
+    def test_listings_count_like_products(self):
+        query = 'price=0-25&price=250-&in_stock=1'
+        _, counts = self.counts(query)
+        self.products = ProductListing.objects.all()
+        filters, listing_counts = self.counts(query)
+        self.assertEqual(listing_counts, counts)
+        self.assertEqual(
+            sorted(filter_products(self.products, filters)
+                   .values_list('name', flat=True)),
+            ['cheap hat', 'fancy shoe'])
+
+    def test_unfiltered_categories_use_the_counters(self):
+        Category.objects.filter(pk=self.hats.pk).update(product_count=7)
+        _, counts = self.counts('')
+        self.assertEqual(counts['categories'][self.hats.pk], 7)
+        _, counts = self.counts('in_stock=1')
+        self.assertEqual(counts['categories'][self.hats.pk], 1)
+
+    def test_unknown_values_are_ignored(self):
+        filters = parse_filters(QueryDict('price=1-2&in_stock=maybe'))
+        self.assertEqual(filters, {'price': [], 'in_stock': False})
+
+    def test_listing_view(self):
+        response = self.client.get('/shoes/', {'price': '25-50'})
+        self.assertEqual([p.name for p in response.context['products']],
+                         ['shoe'])
+        categories = dict((c.slug, c.facet_count)
+                          for c in response.context['categories'])
+        self.assertEqual(categories, {'shoes': 1, 'hats': 0})
@@ -0,0 +1,149 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from ..bulk import bulk_update
+from ..models import Category, ChangeLogEntry, Product
+
+class BulkUpdateTest(TestCase):
+
+    def test_updates_every_object_in_batches(self):
+        category = Category.objects.create(name='name', slug='slug')
+        products = [Product.objects.create(category=category,
+                                           name=str(i),
+                                           slug=str(i),
+                                           price=Decimal(1),
+                                           stock=1) for i in range(5)]
+        for i, product in enumerate(products):
+            product.price = Decimal('%d.25' % i)
+            product.stock = i
+        # Three batches, one insert of their change log entries and the
+        # savepoint around them.
+        with self.assertNumQueries(6):
+            self.assertEqual(bulk_update(products, ['price', 'stock'],
+                                         batch_size=2), 5)
+        self.assertEqual(
+            list(Product.objects.order_by('name')
+                                .values_list('price', 'stock')),
+            [(Decimal('%d.25' % i), i) for i in range(5)])
+
+    def test_nothing_to_update(self):
+        self.assertEqual(bulk_update([], ['price']), 0)
+
+class ImportCatalogueTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.shoes = Category.objects.create(name='Shoes', slug='shoes')
+        self.boots = Product.objects.create(category=self.shoes,
+                                            name='Boots',
+                                            slug='boots',
+                                            price=Decimal(10),
+                                            stock=1)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def run_import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_catalogue', path, stdout=out, stderr=err,
+                     **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upsert(self):
+        path = self.write('feed.csv',
+            'category_slug,category_name,name,slug,price,stock,available\n'
+            'shoes,,Boots,boots,12.50,3,false\n'
+            'hats,Hats,Cap,cap,5,10,\n'
+            'hats,Hats,Beanie,beanie,7.99,0,1\n')
+        out, err = self.run_import(path, batch_size=2)
+        self.assertIn('2 created, 1 updated, 0 skipped', out)
+        self.assertEqual(err, '')
+        boots = Product.objects.get(pk=self.boots.pk)
+        self.assertEqual((boots.price, boots.stock, boots.available),
+                         (Decimal('12.50'), 3, False))
+        hats = Category.objects.get(slug='hats')
+        self.assertEqual(hats.name, 'Hats')
+        self.assertEqual(sorted(hats.products.values_list('slug', flat=True)),
+                         ['beanie', 'cap'])
+
+    def test_changes_are_logged(self):
+        last = ChangeLogEntry.objects.latest('pk').pk
+        path = self.write('feed.csv',
+            'category_slug,name,slug,price,stock\n'
+            'shoes,Boots,boots,12.50,3\n'
+            'hats,Cap,cap,5,10\n')
+        self.run_import(path)
+        cap = Product.objects.get(slug='cap')
+        self.assertEqual(
+            sorted(ChangeLogEntry.objects.filter(pk__gt=last)
+                                 .values_list('model', 'object_id', 'action')),
+            [('shop.category', cap.category_id, 'create'),
+             ('shop.product', self.boots.pk, 'update'),
+             ('shop.product', cap.pk, 'create')])
+
+    def test_bulk_changes_reach_counters(self):
+        path = self.write('feed.csv',
+            'category_slug,name,slug,price,stock,available\n'
+            'shoes,Boots,boots,12.50,3,0\n'
+            'hats,Cap,cap,5,10,1\n')
+        self.run_import(path)
+        self.assertEqual(Category.objects.get(slug='shoes').product_count, 0)
+        self.assertEqual(Category.objects.get(slug='hats').product_count, 1)
+
+    def test_jsonl_with_bad_rows(self):
+        rows = [
+            {'category_slug': 'shoes', 'name': 'Sandals', 'slug': 'sandals',
+             'price': '-1', 'stock': 1},
+            {'category_slug': 'shoes', 'name': 'Clogs', 'slug': 'clogs',
+             'price': '3', 'stock': 'many'},
+            {'category_slug': 'not a slug', 'name': 'x', 'slug': 'x',
+             'price': '3', 'stock': 1},
+            {'category_slug': 'shoes', 'name': 'Loafers', 'slug': 'loafers',
+             'price': '30', 'stock': 2, 'available': True},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows)
+        path = self.write('feed.jsonl', content + '\n{broken\n')
+        out, err = self.run_import(path)
+        self.assertIn('1 created, 0 updated, 4 skipped', out)
+        self.assertIn('line 1 skipped: price:', err)
+        self.assertIn('line 2 skipped: stock:', err)
+        self.assertIn('line 3 skipped: category_slug:', err)
+        self.assertIn('line 5 skipped:', err)
+        self.assertTrue(Product.objects.filter(slug='loafers').exists())
+
+    def test_query_count_does_not_grow_with_rows(self):
+        lines = ['category_slug,name,slug,price,stock']
+        lines += ['shoes,Shoe %d,shoe-%d,%d,1' % (i, i, i) for i in range(100)]
+        path = self.write('feed.csv', '\n'.join(lines))
+        with CaptureQueriesContext(connection) as queries:
+            out, _ = self.run_import(path)
+        self.assertIn('100 created', out)
+        # Includes the savepoint, delete, read and insert of the listings.
+        self.assertLess(len(queries), 25)
+
+    def test_category_rename(self):
+        path = self.write('feed.csv',
+            'category_slug,category_name,name,slug,price,stock\n'
+            'shoes,Footwear,Boots,boots,10,1\n')
+        self.run_import(path)
+        self.assertEqual(Category.objects.get(slug='shoes').name, 'Footwear')
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            self.run_import(self.write('feed.txt', ''))
@@ -0,0 +1,150 @@
+import datetime
+import json
+import tempfile
+from decimal import Decimal
+
+from django.core.management import call_command, CommandError
+from django.test import override_settings, TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from .. import jobs, stock
+from ..cache import category_namespace, get_catalogue_cache
+from ..models import Category, Job, Product
+
+calls = []
+
+
+@jobs.job('test.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.job('test.fail')
+def fail():
+    raise ValueError('broken')
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        del calls[:]
+
+    def test_runs_and_deletes_jobs(self):
+        jobs.enqueue('test.record', {'value': 'a'})
+        jobs.enqueue('test.record', {'value': 'b'}, delay=60)
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(list(Job.objects.values_list('payload', flat=True)),
+                         [json.dumps({'value': 'b'})])
+
+    def test_failed_jobs_back_off_then_fail(self):
+        job = jobs.enqueue('test.fail', max_attempts=2)
+        with self.assertLogs('shop.jobs', 'WARNING'):
+            self.assertEqual(jobs.work(burst=True), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ValueError: broken', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('shop.jobs', 'ERROR'):
+            jobs.work(burst=True)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(jobs.claim('worker'), [])
+
+    @override_settings(SHOP_JOBS=dict(jobs.settings.SHOP_JOBS, BACKOFF=10,
+                                      MAX_BACKOFF=60))
+    def test_backoff_doubles_up_to_a_limit(self):
+        self.assertTrue(9 <= jobs.backoff(1) <= 11)
+        self.assertTrue(36 <= jobs.backoff(3) <= 44)
+        self.assertTrue(54 <= jobs.backoff(10) <= 66)
+
+    def test_claimed_jobs_are_invisible_until_they_time_out(self):
+        job = jobs.enqueue('test.record', {'value': 'a'})
+        first, = jobs.claim('first')
+        self.assertEqual(jobs.claim('second'), [])
+
+        # The first worker stalled past its visibility timeout.
+        Job.objects.update(run_at=timezone.now() - datetime.timedelta(1))
+        second, = jobs.claim('second')
+        self.assertEqual(second.attempts, 2)
+        self.assertTrue(jobs.run(first, 'first'))
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists())
+        self.assertTrue(jobs.run(second, 'second'))
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(calls, ['a', 'a'])
+
+    def test_jobs_timing_out_on_their_last_attempt_fail(self):
+        job = jobs.enqueue('test.record', {'value': 'a'}, max_attempts=1)
+        jobs.claim('first')
+        Job.objects.update(run_at=timezone.now() - datetime.timedelta(1))
+        self.assertEqual(jobs.claim('second'), [])
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+    def test_unknown_jobs_fail(self):
+        jobs.enqueue('test.missing', max_attempts=1)
+        with self.assertLogs('shop.jobs', 'ERROR'):
+            jobs.work(burst=True)
+        self.assertIn('No job is registered',
+                      Job.objects.get(status=Job.FAILED).last_error)
+
+    def test_stopping_gives_claimed_jobs_back(self):
+        for value in 'abc':
+            jobs.enqueue('test.record', {'value': value})
+        self.assertEqual(jobs.work(stopping=lambda: len(calls) == 1), 1)
+        self.assertEqual(
+            list(Job.objects.values_list('status', 'attempts', 'locked_by')),
+            [(Job.QUEUED, 0, '')] * 2)
+
+    @override_settings(
+        CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': tempfile.gettempdir()}},
+        SHOP_CACHE={'BACKEND': 'shop.cache.DjangoCacheBackend'})
+    def test_run_workers(self):
+        jobs.enqueue('test.record', {'value': 'a'})
+        out = StringIO()
+        call_command('run_workers', workers=1, burst=True, stdout=out)
+        self.assertEqual(out.getvalue().strip(), 'Ran 1 jobs.')
+        self.assertEqual(calls, ['a'])
+
+    @override_settings(SHOP_CACHE={'BACKEND': 'shop.cache.LRUCacheBackend'})
+    def test_run_workers_needs_a_shared_cache(self):
+        jobs.enqueue('test.record', {'value': 'a'})
+        with self.assertRaises(CommandError):
+            call_command('run_workers', workers=1, burst=True)
+        self.assertEqual(calls, [])
+
+
+class DeferredStockChangeTest(TestCase):
+
+    def test_sold_out_products_are_updated_by_a_job(self):
+        category = Category.objects.create(name='shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='a',
+                                         slug='a', price=Decimal('1.00'),
+                                         stock=2)
+        stock.reserve(product, 2, 'order:1', defer=True)
+        category.refresh_from_db()
+        self.assertEqual(category.product_count, 1)
+        job = Job.objects.get()
+        self.assertEqual(json.loads(job.payload),
+                         {'product_ids': [product.pk],
+                          'category_ids': [category.pk]})
+
+        jobs.work(burst=True)
+        category.refresh_from_db()
+        self.assertEqual(category.product_count, 0)
+
+    def test_sold_out_products_leave_cached_listings_at_once(self):
+        category = Category.objects.create(name='shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='a',
+                                         slug='a', price=Decimal('1.00'),
+                                         stock=2)
+        namespaces = ['products', category_namespace('shoes')]
+        before = get_catalogue_cache().versions(namespaces)
+        stock.reserve(product, 2, 'order:1', defer=True)
+        after = get_catalogue_cache().versions(namespaces)
+        self.assertTrue(all(old != new for old, new in zip(before, after)))
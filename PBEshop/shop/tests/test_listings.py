@@ -0,0 +1,131 @@
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from ..listings import rebuild, show_thumbnails
+from ..models import Category, Product, ProductListing
+from ..signals import products_bulk_changed
+from ..stock import reserve
+from ..thumbnails import generate_thumbnails, thumbnail_name
+from .test_thumbnails import MediaRootMixin, image_file
+
+class ProductListingTest(TestCase):
+
+    def setUp(self):
+        self.shoes = Category.objects.create(name='shoes', slug='shoes')
+        self.hats = Category.objects.create(name='hats', slug='hats')
+        self.product = Product.objects.create(category=self.shoes,
+                                              name='boot',
+                                              slug='boot',
+                                              image='products/boot.jpg',
+                                              price=Decimal('12.50'),
+                                              stock=2)
+
+    def listing(self, product=None):
+        return ProductListing.objects.get(pk=(product or self.product).pk)
+
+    def test_create(self):
+        listing = self.listing()
+        self.assertEqual(listing.name, 'boot')
+        self.assertEqual(listing.price, Decimal('12.50'))
+        self.assertEqual(listing.category_id, self.shoes.pk)
+        self.assertEqual(listing.category_slug, 'shoes')
+        self.assertEqual(listing.get_absolute_url(),
+                         self.product.get_absolute_url())
+        self.assertEqual(listing.thumbnail, 'products/boot.jpg')
+        self.assertTrue(listing.in_stock)
+        self.assertEqual(listing.updated, self.product.updated)
+
+    def test_save(self):
+        self.product.category = self.hats
+        self.product.price = Decimal(20)
+        self.product.stock = 0
+        self.product.image = ''
+        self.product.save()
+        listing = self.listing()
+        self.assertEqual((listing.category_slug, listing.price),
+                         ('hats', Decimal(20)))
+        self.assertFalse(listing.in_stock)
+        self.assertEqual(listing.thumbnail, '')
+
+    def test_unavailable_products_are_not_listed(self):
+        self.product.available = False
+        self.product.save()
+        self.assertFalse(ProductListing.objects.exists())
+        self.product.available = True
+        self.product.save()
+        self.assertTrue(ProductListing.objects.exists())
+
+    def test_delete(self):
+        self.product.delete()
+        self.assertFalse(ProductListing.objects.exists())
+
+    def test_category_slug_change(self):
+        category = Category.objects.get(pk=self.shoes.pk)
+        category.slug = 'footwear'
+        category.save()
+        self.assertEqual(self.listing().category_slug, 'footwear')
+
+    def test_bulk_change(self):
+        Product.objects.filter(pk=self.product.pk).update(
+            price=Decimal(5), updated=timezone.now())
+        self.assertEqual(self.listing().price, Decimal('12.50'))
+        products_bulk_changed.send(sender=Product,
+                                   product_ids=[self.product.pk],
+                                   category_ids=[self.shoes.pk])
+        self.assertEqual(self.listing().price, Decimal(5))
+
+    def test_deferred_sell_out_is_unlisted_at_once(self):
+        reserve(self.product, 2, 'order-1', defer=True)
+        self.assertFalse(ProductListing.objects.exists())
+
+    def test_rebuild(self):
+        other = Product.objects.create(category=self.hats, name='cap',
+                                       slug='cap', price=Decimal(3), stock=1)
+        ProductListing.objects.filter(pk=self.product.pk).update(name='stale')
+        ProductListing.objects.filter(pk=other.pk).delete()
+        self.assertEqual(rebuild(batch_size=1), 2)
+        self.assertEqual(
+            list(ProductListing.objects.values_list('name', flat=True)),
+            ['boot', 'cap'])
+
+    def test_rebuild_command(self):
+        ProductListing.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_product_listings', stdout=out)
+        self.assertIn('Rebuilt the listings of 1 products.', out.getvalue())
+        self.assertEqual(self.listing().name, 'boot')
+
+    def test_listing_view_reads_the_listings(self):
+        ProductListing.objects.filter(pk=self.product.pk).update(name='listed')
+        response = self.client.get(self.shoes.get_absolute_url())
+        self.assertEqual([listing.name
+                          for listing in response.context['products']],
+                         ['listed'])
+
+class ListingThumbnailTest(MediaRootMixin, TestCase):
+
+    def test_original_is_shown_until_the_thumbnail_is_rendered(self):
+        product = self.create_product(image_file())
+        listing = ProductListing.objects.get(pk=product.pk)
+        self.assertEqual(listing.thumbnail, product.image.name)
+        self.assertEqual(show_thumbnails([product.image.name]), 0)
+        etag = self.client.get('/')['ETag']
+        generate_thumbnails(product.image.name)
+        self.assertEqual(show_thumbnails([product.image.name]), 1)
+        listing = ProductListing.objects.get(pk=product.pk)
+        self.assertEqual(listing.thumbnail,
+                         thumbnail_name(product.image.name, 'small'))
+        self.assertGreater(listing.updated, product.updated)
+        response = self.client.get('/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_listing_of_a_rendered_image_shows_the_thumbnail(self):
+        product = self.create_product(image_file())
+        generate_thumbnails(product.image.name)
+        rebuild()
+        self.assertEqual(ProductListing.objects.get(pk=product.pk).thumbnail,
+                         thumbnail_name(product.image.name, 'small'))
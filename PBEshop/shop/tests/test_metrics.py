@@ -0,0 +1,117 @@
+from collections import deque
+
+from django.contrib.auth.models import User
+from django.core.signals import request_started
+from django.db import connection, reset_queries
+from django.test import TestCase, override_settings
+
+from decimal import Decimal
+
+from ..metrics import (Histogram, normalize_sql, QueryMetricsMiddleware,
+                       registry)
+from ..models import Category, Product
+from .test_sessions import QueuedSessionsMixin
+
+class HistogramTest(TestCase):
+
+    def test_cumulative_buckets(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0, 3, 4, 7, 50):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.cumulative()), [(1, 1), (5, 3), (10, 4)])
+        self.assertEqual((histogram.count, histogram.sum), (5, 64))
+
+class NormalizeSqlTest(TestCase):
+
+    def test_replaces_parameters(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE a = 12 AND b = 'it''s' "
+                          "AND c IN (1, 2, 3)"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...)')
+
+class QueryMetricsMiddlewareTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.category = Category.objects.create(name='name', slug='slug')
+        self.product = Product.objects.create(category=self.category,
+                                              name='name',
+                                              slug='slug',
+                                              price=Decimal(1),
+                                              stock=1)
+
+    def test_server_timing_header(self):
+        response = self.client.get(self.product.get_absolute_url())
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", '
+                         r'tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+    def test_counts_queries_once_the_log_is_full(self):
+        self.addCleanup(setattr, connection, 'queries_log',
+                        connection.queries_log)
+        # As in a CaptureQueriesContext, the log is not cleared.
+        request_started.disconnect(reset_queries)
+        self.addCleanup(request_started.connect, reset_queries)
+        # Left by someone else, with no room for what the request runs.
+        connection.queries_log = deque(
+            [{'sql': 'SELECT %d' % i, 'time': '0.001'} for i in range(3)],
+            maxlen=3)
+        response = self.client.get('/api/products/')
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+    def test_records_per_view_histograms(self):
+        self.client.get('/slug/')
+        self.client.get('/')
+        queries = registry.get('shop_request_queries',
+                               'shop:product_list_by_category')
+        self.assertEqual(queries.count, 1)
+        queries = registry.get('shop_request_queries', 'shop:product_list')
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        template = registry.get('shop_request_template_seconds',
+                                'shop:product_list')
+        self.assertGreater(template.sum, 0)
+
+    def test_server_timing_without_query_metrics(self):
+        with override_settings(SHOP_QUERY_METRICS=False):
+            response = self.client.get(self.product.get_absolute_url())
+            self.assertFalse(response.wsgi_request.metrics_debug_cursors)
+        self.assertRegex(response['Server-Timing'],
+                         r'^tpl;dur=[\d.]+, total;dur=[\d.]+$')
+        self.assertIsNone(registry.get('shop_request_queries',
+                                       'shop:product_detail'))
+        self.assertEqual(registry.get('shop_request_duration_seconds',
+                                      'shop:product_detail').count, 1)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_prometheus_endpoint_is_restricted(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(SHOP_METRICS_ALLOWED_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+        User.objects.create_user('staff', password='secret', is_staff=True)
+        self.client.login(username='staff', password='secret')
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    @override_settings(SHOP_METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_prometheus_endpoint(self):
+        self.client.get('/')
+        response = self.client.get('/metrics')
+        content = response.content.decode('utf-8')
+        self.assertIn('# TYPE shop_request_duration_seconds histogram',
+                      content)
+        self.assertIn('shop_request_queries_count{view="shop:product_list"} 1',
+                      content)
+        self.assertIn('shop_catalogue_cache_misses_total', content)
+        self.assertNotIn('view="shop:metrics"', content)
+
+    @override_settings(SHOP_METRICS_N_PLUS_ONE_THRESHOLD=3)
+    def test_logs_repeated_queries(self):
+        queries = [{'sql': 'SELECT * FROM shop_category WHERE id = %d' % pk}
+                   for pk in range(3)]
+        queries.append({'sql': 'SELECT * FROM shop_product'})
+        with self.assertLogs('shop.metrics', 'WARNING') as logs:
+            QueryMetricsMiddleware().log_repeated_queries('view', queries)
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('view ran 3 similar queries: '
+                      'SELECT * FROM shop_category WHERE id = ?',
+                      logs.output[0])
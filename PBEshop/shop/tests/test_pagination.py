@@ -0,0 +1,67 @@
+from django.test import TestCase
+
+from decimal import Decimal
+
+from ..models import Category, Product
+from ..pagination import InvalidCursor, KeysetPaginator, encode_cursor
+
+class KeysetPaginatorTest(TestCase):
+
+    def setUp(self):
+        category = Category.objects.create(name='name', slug='slug')
+        for name in ['e', 'a', 'c', 'b', 'd', 'c']:
+            Product.objects.create(category=category,
+                                   name=name,
+                                   slug=name,
+                                   price=Decimal(1),
+                                   stock=1)
+        self.paginator = KeysetPaginator(Product.objects.all(), 2)
+
+    def names(self, page):
+        return [product.name for product in page]
+
+    def test_first_page(self):
+        page = self.paginator.page()
+        self.assertEqual(self.names(page), ['a', 'b'])
+        self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_walk_forward_over_duplicate_names(self):
+        names = []
+        page = self.paginator.page()
+        names += self.names(page)
+        while page.has_next():
+            page = self.paginator.page(after=page.next_cursor)
+            names += self.names(page)
+        self.assertEqual(names, ['a', 'b', 'c', 'c', 'd', 'e'])
+        self.assertTrue(page.has_previous())
+
+    def test_walk_backward(self):
+        page = self.paginator.page()
+        page = self.paginator.page(after=page.next_cursor)
+        page = self.paginator.page(after=page.next_cursor)
+        self.assertEqual(self.names(page), ['d', 'e'])
+        page = self.paginator.page(before=page.previous_cursor)
+        self.assertEqual(self.names(page), ['c', 'c'])
+        page = self.paginator.page(before=page.previous_cursor)
+        self.assertEqual(self.names(page), ['a', 'b'])
+        self.assertFalse(page.has_previous())
+
+    def test_values_rows(self):
+        paginator = KeysetPaginator(Product.objects.values('id', 'name'), 4)
+        page = paginator.page()
+        page = paginator.page(after=page.next_cursor)
+        self.assertEqual([row['name'] for row in page], ['d', 'e'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            self.paginator.page(after='not-a-cursor')
+        with self.assertRaises(InvalidCursor):
+            self.paginator.page(after=encode_cursor(['a']))
+
+    def test_cursor_values_of_the_wrong_type(self):
+        for values in (['a', 'x'], ['a', None], ['a', [1]], [{}, 1]):
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(after=encode_cursor(values))
+            with self.assertRaises(InvalidCursor):
+                self.paginator.page(before=encode_cursor(values))
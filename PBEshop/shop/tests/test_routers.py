@@ -0,0 +1,158 @@
+import datetime
+import os
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.test import override_settings, RequestFactory, TransactionTestCase
+from django.utils import timezone
+
+from decimal import Decimal
+
+from .. import routers
+from ..cache import get_catalogue_cache
+from ..models import Category, ChangeLogEntry, Product
+
+class ReplicaRoutingTest(TransactionTestCase):
+    """
+    Runs against a second SQLite file standing in for a replica.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(ReplicaRoutingTest, cls).setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        for alias, name in (('replica', 'replica.sqlite3'),
+                            ('broken', 'missing/replica.sqlite3')):
+            connections.databases[alias] = dict(
+                connections.databases['default'],
+                NAME=os.path.join(cls.directory, name))
+        call_command('migrate', database='replica', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias in ('replica', 'broken'):
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        shutil.rmtree(cls.directory)
+        super(ReplicaRoutingTest, cls).tearDownClass()
+
+    def setUp(self):
+        self.category = Category.objects.create(name='primary',
+                                                slug='primary')
+        self.addCleanup(Category.objects.using('replica').all().delete)
+        routers.health.reset()
+        self.addCleanup(routers.health.reset)
+        self.factory = RequestFactory()
+        self.middleware = routers.PrimaryPinMiddleware()
+        self.start_request(self.factory.get('/'))
+
+    def start_request(self, request):
+        self.middleware.process_request(request)
+        return request
+
+    def replicate(self, updated=None):
+        category = Category.objects.using('replica').create(
+            pk=self.category.pk, name='replica', slug='primary')
+        product = Product.objects.using('replica').create(
+            category=category, name='replica', slug='replica',
+            price=Decimal(1), stock=1)
+        if updated is not None:
+            Product.objects.using('replica').filter(pk=product.pk) \
+                                            .update(updated=updated)
+        # The signal receivers of the writes above wrote to the primary.
+        self.start_request(self.factory.get('/'))
+        return product
+
+    def read(self):
+        return Category.objects.get(slug='primary').name
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'])
+    def test_reads_go_to_the_replica(self):
+        self.replicate()
+        self.assertEqual(self.read(), 'replica')
+        self.assertTrue(routers.replica_used())
+        category = Category.objects.get(slug='primary')
+        # Related rows follow the instance they are reached from.
+        self.assertEqual(category.products.get().name, 'replica')
+
+    def test_without_replicas_reads_go_to_the_primary(self):
+        self.replicate()
+        self.assertEqual(self.read(), 'primary')
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'])
+    def test_writes_go_to_the_primary_and_pin_reads(self):
+        self.replicate()
+        Category.objects.create(name='second', slug='second')
+        self.assertTrue(Category.objects.filter(slug='second').exists())
+        self.assertEqual(self.read(), 'primary')
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'])
+    def test_updates_are_logged_on_the_primary(self):
+        product = self.replicate()
+        Product.objects.create(pk=product.pk, category=self.category,
+                               name='primary', slug='primary',
+                               price=Decimal(1), stock=1)
+        self.start_request(self.factory.get('/'))
+        logged = [ChangeLogEntry.objects.using(alias).count()
+                  for alias in ('default', 'replica')]
+        Product.objects.filter(pk=product.pk).update(price=Decimal(2))
+        self.assertEqual([ChangeLogEntry.objects.using(alias).count()
+                          for alias in ('default', 'replica')],
+                         [logged[0] + 1, logged[1]])
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'])
+    def test_transactions_read_from_the_primary(self):
+        self.replicate()
+        with transaction.atomic():
+            self.assertEqual(self.read(), 'primary')
+        with routers.use_primary():
+            self.assertEqual(self.read(), 'primary')
+        self.assertEqual(self.read(), 'replica')
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'],
+                       SHOP_REPLICA_PIN_SECONDS=7)
+    def test_visitor_stays_on_the_primary_after_writing(self):
+        self.replicate()
+        self.start_request(self.factory.post('/'))
+        Product.objects.filter(pk=0).update(stock=1)
+        response = self.middleware.process_response(None, HttpResponse())
+        cookie = response.cookies[routers.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], 7)
+
+        request = self.factory.get('/')
+        request.COOKIES[routers.PIN_COOKIE] = cookie.value
+        self.start_request(request)
+        self.assertEqual(self.read(), 'primary')
+        self.start_request(self.factory.get('/'))
+        self.assertEqual(self.read(), 'replica')
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'],
+                       SHOP_REPLICA_MAX_LAG=10)
+    def test_lagging_replica_falls_back_to_the_primary(self):
+        self.replicate(updated=timezone.now() - datetime.timedelta(hours=1))
+        Product.objects.create(category=self.category, name='new',
+                               slug='new', price=Decimal(1), stock=1)
+        self.start_request(self.factory.get('/'))
+        self.assertEqual(self.read(), 'primary')
+        self.assertFalse(routers.replica_used())
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['broken', 'replica'])
+    def test_unreachable_replica_is_skipped(self):
+        self.replicate()
+        for _ in range(5):
+            self.assertEqual(self.read(), 'replica')
+
+    @override_settings(SHOP_DATABASE_REPLICAS=['replica'],
+                       SHOP_REPLICA_MAX_LAG=60)
+    def test_pages_read_from_a_replica_after_a_change_are_not_cached(self):
+        self.replicate()
+        cache = get_catalogue_cache()
+        cache.bump('categories', 'products')
+        self.client.get('/')
+        misses = cache.stats()['misses']
+        self.client.get('/')
+        self.assertEqual(cache.stats()['misses'], misses + 1)
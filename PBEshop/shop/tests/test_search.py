@@ -0,0 +1,126 @@
+import json
+
+from django.test import TestCase, override_settings
+
+from decimal import Decimal
+
+from .. import search
+from ..models import Category, Product
+from ..search import get_search_backend, search_products, tokenize
+
+class TokenizeTest(TestCase):
+
+    def test_lowercase_words(self):
+        self.assertEqual(tokenize('Red, WOOL-socks!'), ['red', 'wool', 'socks'])
+
+class SearchBackendTestMixin(object):
+
+    def setUp(self):
+        self.clothes = Category.objects.create(name='clothes', slug='clothes')
+        self.shoes = Category.objects.create(name='shoes', slug='shoes')
+        self.socks = self.create_product(self.clothes, 'Wool socks',
+                                         'Warm socks for winter')
+        self.scarf = self.create_product(self.clothes, 'Red scarf',
+                                         'Goes well with wool socks')
+        self.boots = self.create_product(self.shoes, 'Winter boots',
+                                         'Leather boots')
+        self.hidden = self.create_product(self.shoes, 'Wool slippers', '',
+                                          available=False)
+        get_search_backend().rebuild()
+
+    def create_product(self, category, name, description, available=True):
+        return Product.objects.create(category=category,
+                                      name=name,
+                                      slug=name.lower().replace(' ', '-'),
+                                      description=description,
+                                      price=Decimal(1),
+                                      stock=1,
+                                      available=available)
+
+    def search(self, query, category=None):
+        return [product for product, _ in search_products(query, category)]
+
+    def test_name_ranks_above_description(self):
+        self.assertEqual(self.search('wool socks'), [self.socks, self.scarf])
+
+    def test_terms_are_combined_with_and(self):
+        self.assertEqual(self.search('red wool'), [self.scarf])
+
+    def test_last_term_matches_prefix(self):
+        self.assertEqual(self.search('win'), [self.boots, self.socks])
+        self.assertEqual(self.search('wi boots'), [])
+
+    def test_category_name_is_indexed(self):
+        self.assertEqual(self.search('shoes'), [self.boots])
+
+    def test_category_filter(self):
+        self.assertEqual(self.search('winter', self.shoes), [self.boots])
+
+    def test_unavailable_products_are_not_found(self):
+        self.assertEqual(self.search('slippers'), [])
+
+    def test_indexes_in_batches(self):
+        self.addCleanup(setattr, search, 'INDEX_BATCH_SIZE',
+                        search.INDEX_BATCH_SIZE)
+        search.INDEX_BATCH_SIZE = 1
+        get_search_backend().rebuild()
+        self.assertEqual(self.search('wool socks'), [self.socks, self.scarf])
+        Product.objects.filter(pk=self.scarf.pk).update(name='Blue scarf')
+        get_search_backend().index(Product.objects.all())
+        self.assertEqual(self.search('blue'), [self.scarf])
+        self.assertEqual(self.search('red'), [])
+
+    def test_empty_query(self):
+        self.assertEqual(self.search('  !! '), [])
+
+    def test_saved_product_is_reindexed(self):
+        self.boots.name = 'Rain boots'
+        self.boots.save()
+        self.assertEqual(self.search('rain'), [self.boots])
+        self.boots.available = False
+        self.boots.save()
+        self.assertEqual(self.search('rain'), [])
+
+    def test_deleted_product_is_removed(self):
+        self.scarf.delete()
+        self.assertEqual(self.search('red'), [])
+
+    def test_renamed_category_is_reindexed(self):
+        category = Category.objects.get(pk=self.shoes.pk)
+        category.name = 'footwear'
+        category.save()
+        self.assertEqual(self.search('footwear'), [self.boots])
+
+    def test_search_view(self):
+        response = self.client.get('/search/', {'q': 'socks'})
+        self.assertTemplateUsed(response, 'shop/product/search.html')
+        self.assertEqual(response.context['products'],
+                         [self.socks, self.scarf])
+
+    def test_search_api(self):
+        response = self.client.get('/api/search/',
+                                   {'q': 'win', 'category': 'shoes'})
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual([r['id'] for r in data['results']], [self.boots.id])
+        self.assertEqual(data['results'][0]['url'],
+                         self.boots.get_absolute_url())
+
+    def test_search_api_limit(self):
+        for limit, count in (('1', 1), ('-1', 1), ('0', 1), ('x', 2)):
+            response = self.client.get('/api/search/',
+                                       {'q': 'socks', 'limit': limit})
+            data = json.loads(response.content.decode('utf-8'))
+            self.assertEqual(len(data['results']), count)
+
+    def test_search_api_unknown_category_404(self):
+        response = self.client.get('/api/search/',
+                                   {'q': 'win', 'category': 'missing'})
+        self.assertEqual(response.status_code, 404)
+
+@override_settings(SHOP_SEARCH_BACKEND='shop.search.Fts5SearchBackend')
+class Fts5SearchTest(SearchBackendTestMixin, TestCase):
+    pass
+
+@override_settings(SHOP_SEARCH_BACKEND='shop.search.InMemorySearchBackend')
+class InMemorySearchTest(SearchBackendTestMixin, TestCase):
+    pass
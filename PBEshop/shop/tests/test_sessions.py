@@ -0,0 +1,173 @@
+import tempfile
+import time
+
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import override_settings, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from .. import sessions
+from ..models import Category, Product
+from ..sessions import SessionStore
+
+
+class QueuedSessionsMixin(object):
+    """
+    Forgets the sessions a test queued. Its rollback leaves them in
+    ``shop.sessions.writer``, where a later test's request would write them
+    inside its own queries.
+    """
+
+    def tearDown(self):
+        sessions.writer.clear()
+        super(QueuedSessionsMixin, self).tearDown()
+
+
+class SessionStoreTest(QueuedSessionsMixin, TestCase):
+
+    def setUp(self):
+        # Left over by other tests.
+        sessions.writer.flush()
+        Session.objects.all().delete()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def test_saves_are_written_behind(self):
+        session = SessionStore()
+        session['cart'] = {'1': [1, '10.00']}
+        session.save()
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(SessionStore(session.session_key)['cart'],
+                         {'1': [1, '10.00']})
+
+        self.assertEqual(sessions.writer.flush(), 1)
+        caches['default'].clear()
+        self.assertEqual(SessionStore(session.session_key)['cart'],
+                         {'1': [1, '10.00']})
+
+    def test_clear_forgets_queued_sessions(self):
+        session = SessionStore()
+        session['a'] = 1
+        session.save()
+        sessions.writer.clear()
+        self.assertEqual(len(sessions.writer), 0)
+        self.assertEqual(sessions.writer.flush(), 0)
+        self.assertFalse(Session.objects.exists())
+
+    def test_queued_session_is_found_without_cache(self):
+        session = SessionStore()
+        session['a'] = 1
+        session.save()
+        caches['default'].clear()
+        self.assertTrue(SessionStore().exists(session.session_key))
+        self.assertEqual(SessionStore(session.session_key)['a'], 1)
+
+    def test_unchanged_session_is_not_saved(self):
+        session = SessionStore()
+        session['a'] = 1
+        session.save()
+        sessions.writer.flush()
+        session = SessionStore(session.session_key)
+        session['a'] = 1
+        session.save()
+        self.assertEqual(len(sessions.writer), 0)
+        session['a'] = 2
+        session.save()
+        self.assertEqual(len(sessions.writer), 1)
+
+    def test_saves_are_coalesced(self):
+        session = SessionStore()
+        for i in range(5):
+            session['a'] = i
+            session.save()
+        other = SessionStore()
+        other['b'] = 1
+        other.save()
+        self.assertEqual(len(sessions.writer), 2)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(sessions.writer.flush(), 2)
+        inserts = [q for q in queries.captured_queries
+                   if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        stored = Session.objects.get(pk=session.session_key)
+        self.assertEqual(stored.get_decoded(), {'a': 4})
+
+        session['a'] = 5
+        session.save()
+        sessions.writer.flush()
+        stored = Session.objects.get(pk=session.session_key)
+        self.assertEqual(stored.get_decoded(), {'a': 5})
+
+    def test_deleted_session_is_not_written_back(self):
+        session = SessionStore()
+        session['a'] = 1
+        session.save()
+        sessions.writer.flush()
+        session['a'] = 2
+        session.save()
+        # A save queued by another process is not discarded by delete().
+        queued = sessions.writer.get(session.session_key)
+        SessionStore(session.session_key).delete()
+        sessions.writer.enqueue(queued)
+        self.assertEqual(sessions.writer.flush(), 0)
+        self.assertFalse(Session.objects.exists())
+        self.assertFalse(SessionStore().exists(session.session_key))
+
+    @override_settings(SHOP_SESSION_WRITE_DELAY=0)
+    def test_requests_flush_due_sessions(self):
+        category = Category.objects.create(name='shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='shoe',
+                                         slug='shoe', price=1, stock=5)
+        self.client.post('/cart/add/%d/' % product.pk, {'quantity': 1})
+        self.assertEqual(Session.objects.count(), 1)
+
+    def test_catalogue_does_not_touch_session(self):
+        category = Category.objects.create(name='shoes', slug='shoes')
+        product = Product.objects.create(category=category, name='shoe',
+                                         slug='shoe', price=1, stock=5)
+        self.client.post('/cart/add/%d/' % product.pk, {'quantity': 1})
+        for path in ('/', '/shoes/', product.get_absolute_url()):
+            response = self.client.get(path)
+            self.assertNotIn('Vary', response)
+            self.assertNotIn('sessionid', response.cookies)
+
+
+class SessionFlusherTest(QueuedSessionsMixin, TransactionTestCase):
+
+    def setUp(self):
+        sessions.writer.flush()
+        Session.objects.all().delete()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    @override_settings(SHOP_SESSION_WRITE_DELAY=0.1)
+    def test_idle_process_writes_queued_sessions(self):
+        session = SessionStore()
+        session['a'] = 1
+        session.save()
+        flusher = sessions.Flusher()
+        flusher.start()
+        self.addCleanup(flusher.join)
+        self.addCleanup(flusher.stop)
+        deadline = time.time() + 5
+        while not Session.objects.exists() and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(
+            Session.objects.get(pk=session.session_key).get_decoded(),
+            {'a': 1})
+
+    def test_start_flusher_once_per_process(self):
+        flusher = sessions.start_flusher()
+        self.addCleanup(flusher.join)
+        self.addCleanup(flusher.stop)
+        self.assertIs(sessions.start_flusher(), flusher)
+
+    def test_local_cache_is_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            sessions.check_shared_cache()
+        with self.settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': tempfile.gettempdir()}}):
+            sessions.check_shared_cache()
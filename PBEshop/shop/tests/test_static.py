@@ -0,0 +1,120 @@
+import gzip
+import os
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import override_settings, SimpleTestCase
+from django.utils.six import StringIO
+
+from PBEshop.static_wsgi import (accepted_encodings, BRIEFLY, FOREVER,
+                                 StaticFilesApplication)
+
+from ..storage import COMPRESSED_MANIFEST
+
+CSS = 'admin/css/base.css'
+
+
+class StaticPipelineTest(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        settings = override_settings(STATIC_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def collectstatic(self):
+        call_command('collectstatic', interactive=False, verbosity=0,
+                     stdout=StringIO())
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def test_without_manifest_names_are_not_hashed(self):
+        self.assertEqual(staticfiles_storage.url(CSS), '/static/' + CSS)
+
+    def test_writes_hashed_and_compressed_files(self):
+        self.collectstatic()
+        hashed = staticfiles_storage.stored_name(CSS)
+        self.assertRegex(hashed, r'^admin/css/base\.[0-9a-f]{12}\.css$')
+        with open(self.path(hashed), 'rb') as f:
+            content = f.read()
+        with gzip.open(self.path(hashed + '.gz')) as f:
+            self.assertEqual(f.read(), content)
+        # Images gain nothing.
+        for name in os.listdir(self.path('admin/img')):
+            self.assertFalse(name.endswith('.png.gz'))
+        self.assertTrue(os.path.exists(self.path(COMPRESSED_MANIFEST)))
+
+    def test_unchanged_files_are_not_compressed_again(self):
+        self.collectstatic()
+        variant = self.path(staticfiles_storage.stored_name(CSS) + '.gz')
+        modified = os.stat(variant).st_mtime_ns
+        self.collectstatic()
+        self.assertEqual(os.stat(variant).st_mtime_ns, modified)
+        os.remove(variant)
+        self.collectstatic()
+        self.assertTrue(os.path.exists(variant))
+
+    def request(self, path, **environ):
+        def start_response(status, headers):
+            response['status'] = status
+            response['headers'] = dict(headers)
+
+        def application(environ, start_response):
+            start_response('200 OK', [])
+            return [b'django']
+
+        response = {}
+        environ.setdefault('REQUEST_METHOD', 'GET')
+        environ['PATH_INFO'] = path
+        app = StaticFilesApplication(application)
+        body = app(environ, start_response)
+        response['body'] = b''.join(body)
+        if hasattr(body, 'close'):
+            body.close()
+        return response
+
+    def test_serves_precompressed_variant(self):
+        self.collectstatic()
+        path = staticfiles_storage.url(CSS)
+        response = self.request(path, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['status'], '200 OK')
+        headers = response['headers']
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['Cache-Control'], FOREVER)
+        self.assertEqual(headers['Content-Type'], 'text/css; charset=utf-8')
+        with open(self.path(staticfiles_storage.stored_name(CSS)), 'rb') as f:
+            self.assertEqual(gzip.GzipFile(fileobj=BytesIO(response['body']))
+                             .read(), f.read())
+
+        plain = self.request(path, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', plain['headers'])
+        self.assertEqual(int(plain['headers']['Content-Length']),
+                         len(plain['body']))
+
+        cached = self.request(path, HTTP_ACCEPT_ENCODING='gzip',
+                              HTTP_IF_NONE_MATCH=headers['ETag'])
+        self.assertEqual(cached['status'], '304 Not Modified')
+        self.assertEqual(cached['body'], b'')
+
+        self.assertEqual(self.request('/static/' + CSS)['headers']
+                         ['Cache-Control'], BRIEFLY)
+
+    def test_leaves_other_requests_to_django(self):
+        self.collectstatic()
+        for path in ('/', '/static/missing.css', '/static/../settings.py',
+                     '/static/'):
+            self.assertEqual(self.request(path)['body'], b'django')
+        self.assertEqual(self.request('/static/' + CSS,
+                                      REQUEST_METHOD='POST')['body'],
+                         b'django')
+
+    def test_accepted_encodings(self):
+        self.assertEqual(accepted_encodings('gzip, br;q=0.5, deflate;q=0'),
+                         set(['gzip', 'br']))
+        self.assertEqual(accepted_encodings(''), set())
@@ -0,0 +1,185 @@
+import threading
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from django.utils.six import StringIO
+
+from decimal import Decimal
+
+from ..models import Category, Product, StockReservation
+from ..stock import (confirm, InsufficientStock, release, release_expired,
+                     reserve, reserve_many)
+
+class StockReservationTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name='name', slug='slug')
+        self.first = self.product('first', 5)
+        self.second = self.product('second', 2)
+
+    def product(self, name, stock):
+        return Product.objects.create(category=self.category, name=name,
+                                      slug=name, price=Decimal(1),
+                                      stock=stock)
+
+    def stock(self, product):
+        product.refresh_from_db()
+        return product.stock, product.available
+
+    def test_reserve_takes_units_out_of_stock(self):
+        hold = reserve(self.first, 3, 'cart-1')
+        self.assertEqual(self.stock(self.first), (2, True))
+        self.assertEqual((hold.product_id, hold.quantity, hold.reference),
+                         (self.first.pk, 3, 'cart-1'))
+        self.assertGreater(hold.expires, timezone.now())
+
+    def test_reserve_many_is_all_or_nothing(self):
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve_many([(self.first, 1), (self.second.pk, 3)], 'cart-1')
+        self.assertEqual(raised.exception.product_id, self.second.pk)
+        self.assertEqual((raised.exception.name, raised.exception.left),
+                         ('second', 2))
+        self.assertEqual(self.stock(self.first), (5, True))
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reserve_many_merges_lines(self):
+        holds = reserve_many([(self.first, 1), (self.first, 2)], 'cart-1')
+        self.assertEqual([h.quantity for h in holds], [3])
+        self.assertEqual(self.stock(self.first), (2, True))
+
+    def test_sold_out_product_becomes_unavailable(self):
+        reserve(self.second, 2, 'cart-1')
+        self.assertEqual(self.stock(self.second), (0, False))
+        self.assertTrue(self.second.sold_out)
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 1)
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(self.second, 1, 'cart-2')
+        self.assertEqual(raised.exception.left, 0)
+
+    def test_unavailable_product_cannot_be_reserved(self):
+        self.first.available = False
+        self.first.save()
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(self.first, 1, 'cart-1')
+        self.assertEqual(raised.exception.name, self.first.name)
+        self.assertIsNone(raised.exception.left)
+        product_id = self.first.pk
+        self.first.delete()
+        with self.assertRaises(InsufficientStock) as raised:
+            reserve(product_id, 1, 'cart-1')
+        self.assertIsNone(raised.exception.name)
+
+    def test_release_returns_units(self):
+        reserve_many([(self.first, 1), (self.second, 2)], 'cart-1')
+        self.assertEqual(release('cart-1'),
+                         {self.first.pk: 1, self.second.pk: 2})
+        self.assertEqual(self.stock(self.first), (5, True))
+        self.assertEqual(self.stock(self.second), (2, True))
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.product_count, 2)
+        self.assertEqual(release('cart-1'), {})
+
+    def test_release_keeps_products_hidden_by_an_admin_hidden(self):
+        reserve(self.first, 1, 'cart-1')
+        Product.objects.filter(pk=self.first.pk).update(available=False)
+        release('cart-1')
+        self.assertEqual(self.stock(self.first), (5, False))
+
+    def test_release_keeps_products_hidden_at_zero_stock(self):
+        reserve(self.first, 1, 'cart-1')
+        product = Product.objects.get(pk=self.first.pk)
+        product.stock = 0
+        product.available = False
+        product.save()
+        release('cart-1')
+        self.assertEqual(self.stock(self.first), (1, False))
+
+    def test_release_keeps_sold_out_products_hidden_by_an_admin(self):
+        reserve(self.second, 2, 'cart-1')
+        product = Product.objects.get(pk=self.second.pk)
+        product.available = True
+        product.save()
+        product.available = False
+        product.save()
+        self.assertFalse(product.sold_out)
+        release('cart-1')
+        self.assertEqual(self.stock(self.second), (2, False))
+
+    def test_confirm_keeps_units_sold(self):
+        reserve(self.first, 2, 'order-1')
+        self.assertEqual(confirm('order-1'), {self.first.pk: 2})
+        self.assertEqual(self.stock(self.first), (3, True))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(release('order-1'), {})
+
+    def test_release_expired(self):
+        reserve(self.first, 1, 'cart-1', ttl=60)
+        reserve(self.first, 1, 'cart-2', ttl=600)
+        self.assertEqual(
+            release_expired(timezone.now() + timedelta(seconds=120)), 1)
+        self.assertEqual(self.stock(self.first), (4, True))
+        self.assertEqual(confirm('cart-1'), {})
+        self.assertEqual(confirm('cart-2'), {self.first.pk: 1})
+
+    def test_release_expired_command(self):
+        reserve(self.first, 1, 'cart-1', ttl=-1)
+        out = StringIO()
+        call_command('release_expired_reservations', stdout=out)
+        self.assertIn('Released 1 expired', out.getvalue())
+        self.assertEqual(self.stock(self.first), (5, True))
+
+class StockStressTest(TransactionTestCase):
+
+    threads = 12
+    attempts = 20
+
+    def test_never_oversells_under_parallel_load(self):
+        category = Category.objects.create(name='name', slug='slug')
+        products = [Product.objects.create(category=category, name=str(i),
+                                           slug=str(i), price=Decimal(1),
+                                           stock=25)
+                    for i in range(2)]
+        results = []
+        lock = threading.Lock()
+
+        def worker(number):
+            try:
+                for attempt in range(self.attempts):
+                    reference = 'cart-%d-%d' % (number, attempt)
+                    # Lines in both orders, the engine locks in one order.
+                    lines = [(products[0], 1), (products[1], 1)]
+                    if number % 2:
+                        lines.reverse()
+                    while True:
+                        try:
+                            reserve_many(lines, reference)
+                            outcome = True
+                        except InsufficientStock:
+                            outcome = False
+                        except OperationalError:
+                            # SQLite's shared test database reports lock
+                            # contention instead of waiting.
+                            continue
+                        break
+                    with lock:
+                        results.append(outcome)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(n,))
+                   for n in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        self.assertEqual(len(results), self.threads * self.attempts)
+        self.assertEqual(results.count(True), 25)
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual((product.stock, product.available), (0, False))
+        self.assertEqual(StockReservation.objects.count(), 50)
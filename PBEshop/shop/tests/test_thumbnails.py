@@ -0,0 +1,150 @@
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.cache import caches
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test import override_settings
+from django.utils.six import StringIO
+from PIL import Image
+
+from decimal import Decimal
+
+from ..models import Category, Product, ProductListing
+from ..thumbnails import (generate_thumbnails, rendered_thumbnails,
+                          resolve_thumbnail, thumbnail_name, webp_supported)
+
+THUMBNAILS = {
+    'SIZES': {'small': (10, 10), 'large': (40, 40)},
+    'WEBP': True,
+    'QUALITY': 85,
+    'ASYNC': False,
+    'WORKERS': 1,
+}
+
+def image_file(name='photo.png', size=(80, 60)):
+    buffer = BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 255)).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+class MediaRootMixin(object):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root,
+                                                   SHOP_THUMBNAILS=THUMBNAILS)
+        self.settings_override.enable()
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.category = Category.objects.create(name='name', slug='slug')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def create_product(self, image=None):
+        return Product.objects.create(category=self.category,
+                                      name='name',
+                                      slug='slug',
+                                      image=image or '',
+                                      price=Decimal(1),
+                                      stock=1)
+
+class GenerateThumbnailsTest(MediaRootMixin, TestCase):
+
+    def test_thumbnail_name(self):
+        self.assertEqual(thumbnail_name('products/a.jpeg', 'small'),
+                         'thumbnails/products/a_small.jpeg')
+        self.assertEqual(thumbnail_name('products/a.jpeg', 'small', 'WEBP'),
+                         'thumbnails/products/a_small.webp')
+        self.assertEqual(thumbnail_name('products/a.bmp', 'small', 'JPEG'),
+                         'thumbnails/products/a_small.jpg')
+
+    def test_renders_every_size(self):
+        name = default_storage.save('products/photo.png', image_file())
+        written = generate_thumbnails(name)
+        self.assertEqual(len(written), 4 if webp_supported() else 2)
+        with default_storage.open(thumbnail_name(name, 'small')) as f:
+            self.assertEqual(Image.open(f).size, (10, 8))
+        with default_storage.open(thumbnail_name(name, 'large')) as f:
+            self.assertEqual(Image.open(f).size, (40, 30))
+
+    def test_keeps_existing_unless_forced(self):
+        name = default_storage.save('products/photo.png', image_file())
+        generate_thumbnails(name)
+        self.assertEqual(generate_thumbnails(name), [])
+        self.assertEqual(len(generate_thumbnails(name, force=True)),
+                         4 if webp_supported() else 2)
+
+    def test_resolve_falls_back_to_original(self):
+        product = self.create_product(image_file())
+        self.assertEqual(resolve_thumbnail(product.image, 'small'),
+                         product.image.url)
+        generate_thumbnails(product.image.name)
+        self.assertEqual(resolve_thumbnail(product.image, 'small'),
+                         default_storage.url(
+                             thumbnail_name(product.image.name, 'small')))
+
+    def test_template_tag(self):
+        product = self.create_product(image_file())
+        request = RequestFactory().get('/', HTTP_ACCEPT='image/webp,*/*')
+        template = Template('{% load shop_thumbnails %}'
+                            '{% thumbnail_url product.image "small" %}')
+        output = template.render(Context({'product': product,
+                                          'request': request}))
+        self.assertEqual(output, product.image.url)
+
+    def test_template_tag_after_rendering(self):
+        product = self.create_product(image_file())
+        generate_thumbnails(product.image.name)
+        template = Template('{% load shop_thumbnails %}'
+                            '{% thumbnail_url product.image "small" %}')
+        for accept, image_format in (('image/webp,*/*', 'WEBP'),
+                                     ('*/*', None)):
+            if image_format == 'WEBP' and not webp_supported():
+                continue
+            request = RequestFactory().get('/', HTTP_ACCEPT=accept)
+            output = template.render(Context({'product': product,
+                                              'request': request}))
+            self.assertEqual(output, default_storage.url(thumbnail_name(
+                product.image.name, 'small', image_format)))
+
+    def test_rendered_thumbnails_are_recorded(self):
+        name = default_storage.save('products/photo.png', image_file())
+        generate_thumbnails(name)
+        small = thumbnail_name(name, 'small')
+        self.assertIn(small, rendered_thumbnails(name))
+        # The record is trusted without asking the storage again.
+        default_storage.delete(small)
+        self.assertIn(small, rendered_thumbnails(name))
+        caches['default'].clear()
+        self.assertNotIn(small, rendered_thumbnails(name))
+
+    def test_command(self):
+        self.create_product(image_file())
+        out = StringIO()
+        call_command('generate_thumbnails', workers=1, stdout=out)
+        self.assertIn('for 1 images', out.getvalue())
+        self.assertIn('0 failed', out.getvalue())
+        self.assertEqual(ProductListing.objects.get().thumbnail,
+                         thumbnail_name(Product.objects.get().image.name,
+                                        'small'))
+
+class ThumbnailSignalTest(MediaRootMixin, TransactionTestCase):
+
+    def test_saving_image_renders_thumbnails_after_commit(self):
+        product = self.create_product(image_file())
+        small = thumbnail_name(product.image.name, 'small')
+        self.assertTrue(default_storage.exists(small))
+        self.assertEqual(ProductListing.objects.get(pk=product.pk).thumbnail,
+                         small)
+
+    def test_saving_without_image_change_does_nothing(self):
+        product = self.create_product()
+        product = Product.objects.get(pk=product.pk)
+        product.save()
+        self.assertFalse(default_storage.exists('thumbnails'))
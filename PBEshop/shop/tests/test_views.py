@@ -1,9 +1,10 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from decimal import Decimal
 
-from ..views import product_list
 from ..models import Category, Product
+from ..pagination import encode_cursor
+from ..views import product_list
 
 class ProductListTest(TestCase):
 
@@ -75,6 +76,31 @@ class ProductListTest(TestCase):
         products = response.context['products']
         self.assertEqual(len(products), 2)
 
+    @override_settings(SHOP_PRODUCTS_PER_PAGE=2)
+    def test_context_products_paginated_by_cursor(self):
+        response = self.client.get('/')
+        page = response.context['page']
+        self.assertEqual([p.name for p in page], ['first', 'second'])
+        response = self.client.get('/', {'after': page.next_cursor})
+        self.assertEqual([p.name for p in response.context['products']],
+                         ['third'])
+        self.assertFalse(response.context['page'].has_next())
+
+    @override_settings(SHOP_PRODUCTS_PER_PAGE=1)
+    def test_context_products_paginated_in_category(self):
+        response = self.client.get('/first-category/')
+        page = response.context['page']
+        response = self.client.get('/first-category/',
+                                   {'after': page.next_cursor})
+        self.assertEqual([p.name for p in response.context['products']],
+                         ['second'])
+
+    def test_invalid_cursor_404(self):
+        response = self.client.get('/', {'after': 'bad'})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get('/', {'after': encode_cursor(['a', 'x'])})
+        self.assertEqual(response.status_code, 404)
+
 class ProductDetailTest(TestCase):
 
     def setUp(self):
@@ -0,0 +1,224 @@
+"""
+Pre-rendered thumbnails of ``Product.image``.
+
+Every uploaded image gets one resized copy per entry of
+``SHOP_THUMBNAILS['SIZES']``, in its own format and, when Pillow was built
+with WebP support, as WebP too. They are written next to each other under
+``thumbnails/`` in the default storage, for example::
+
+    products/2016/05/31/shoe.jpg
+    thumbnails/products/2016/05/31/shoe_small.jpg
+    thumbnails/products/2016/05/31/shoe_small.webp
+
+Rendering runs on a thread pool after the saving transaction commits, so
+the admin request that uploads an image never waits for it. It leaves the
+names it rendered in the default cache, which is how ``resolve_thumbnail``
+knows which variant to link without asking the storage on every render.
+"""
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Formats thumbnails are kept in, anything else is converted to JPEG.
+KEPT_FORMATS = ('JPEG', 'PNG', 'GIF')
+
+# Seconds a record read from the storage is trusted, in case the thumbnails
+# are rendered by a process that does not share the cache.
+CHECKED_TIMEOUT = 300
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def webp_supported():
+    Image.init()
+    return 'WEBP' in Image.SAVE
+
+
+def _output_formats(original_format):
+    formats = [original_format if original_format in KEPT_FORMATS else 'JPEG']
+    if settings.SHOP_THUMBNAILS['WEBP'] and webp_supported():
+        formats.append('WEBP')
+    return formats
+
+
+def _extension(image_format, image_name):
+    Image.init()
+    if image_format == 'WEBP':
+        return '.webp'
+    original = os.path.splitext(image_name)[1].lower()
+    if Image.EXTENSION.get(original) == image_format:
+        return original
+    return '.jpg' if image_format == 'JPEG' else '.' + image_format.lower()
+
+
+def thumbnail_name(image_name, size, image_format=None):
+    root, extension = os.path.splitext(image_name)
+    if image_format is not None:
+        extension = _extension(image_format, image_name)
+    return 'thumbnails/%s_%s%s' % (root, size, extension)
+
+
+def generate_thumbnails(image_name, force=False):
+    """
+    Renders every size and format of one image and returns the names of the
+    files written. Existing thumbnails are kept unless ``force`` is set.
+    """
+    written, rendered = [], []
+    with default_storage.open(image_name) as f:
+        original = Image.open(f)
+        original.load()
+    formats = _output_formats(original.format)
+    for size, dimensions in settings.SHOP_THUMBNAILS['SIZES'].items():
+        thumbnail = None
+        for image_format in formats:
+            name = thumbnail_name(image_name, size, image_format)
+            rendered.append(name)
+            if default_storage.exists(name):
+                if not force:
+                    continue
+                default_storage.delete(name)
+            if thumbnail is None:
+                thumbnail = original.copy()
+                thumbnail.thumbnail(dimensions, Image.LANCZOS)
+            image = thumbnail
+            if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            elif image_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA')
+            buffer = BytesIO()
+            image.save(buffer, image_format,
+                       quality=settings.SHOP_THUMBNAILS['QUALITY'])
+            written.append(default_storage.save(name,
+                                                ContentFile(buffer.getvalue())))
+    caches['default'].set(_record_key(image_name), rendered, None)
+    return written
+
+
+def _record_key(image_name):
+    return 'shop.thumbnails:%s' % hashlib.md5(
+        image_name.encode('utf-8')).hexdigest()
+
+
+def rendered_thumbnails(*image_names):
+    """
+    Returns the names of the rendered thumbnails of ``image_names``, as
+    ``generate_thumbnails`` recorded them. Images without a record are
+    looked up in the storage once and the answer kept for
+    ``CHECKED_TIMEOUT`` seconds.
+    """
+    cache = caches['default']
+    keys = {_record_key(image_name): image_name for image_name in image_names}
+    records = cache.get_many(list(keys))
+    rendered = set()
+    for key, image_name in keys.items():
+        if key not in records:
+            records[key] = [name
+                            for size in settings.SHOP_THUMBNAILS['SIZES']
+                            for name in _candidates(image_name, size, True)
+                            if default_storage.exists(name)]
+            cache.set(key, records[key], CHECKED_TIMEOUT)
+        rendered.update(records[key])
+    return rendered
+
+
+def forget_thumbnails(image_names):
+    """
+    Drops the records of ``image_names``, which are looked up in the storage
+    again the next time.
+    """
+    caches['default'].delete_many([_record_key(image_name)
+                                   for image_name in image_names])
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SHOP_THUMBNAILS['WORKERS'])
+    return _executor
+
+
+def _render(image_name, callback):
+    written = generate_thumbnails(image_name)
+    if callback is not None:
+        try:
+            callback()
+        finally:
+            # Pool threads outlive requests, nothing else closes their
+            # connections.
+            connections.close_all()
+    return written
+
+
+def _log_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error('Thumbnail rendering failed', exc_info=(
+            type(error), error, error.__traceback__))
+
+
+def schedule_thumbnails(image_name, callback=None):
+    """
+    Renders the thumbnails of ``image_name``, on the thread pool unless
+    ``SHOP_THUMBNAILS['ASYNC']`` is off, and then calls ``callback``.
+    """
+    if not settings.SHOP_THUMBNAILS['ASYNC']:
+        written = generate_thumbnails(image_name)
+        if callback is not None:
+            callback()
+        return written
+    future = _get_executor().submit(_render, image_name, callback)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def rendered_name(image_name, size, rendered, webp=False):
+    """
+    Returns the best of the ``rendered`` thumbnail names of ``image_name``
+    at ``size``, or None.
+    """
+    for name in _candidates(image_name, size, webp):
+        if name in rendered:
+            return name
+    return None
+
+
+def _candidates(image_name, size, webp):
+    """
+    Returns the names a thumbnail of ``image_name`` may have, best first.
+    """
+    formats = [None, 'JPEG']
+    if webp and settings.SHOP_THUMBNAILS['WEBP']:
+        formats.insert(0, 'WEBP')
+    names = []
+    for image_format in formats:
+        name = thumbnail_name(image_name, size, image_format)
+        if name not in names:
+            names.append(name)
+    return names
+
+
+def resolve_thumbnail(image, size, accept_webp=False):
+    """
+    Returns the URL of the best rendered variant of ``image`` at ``size``,
+    falling back to the original while the thumbnails are not rendered yet.
+    """
+    if not image:
+        return ''
+    name = rendered_name(image.name, size, rendered_thumbnails(image.name),
+                         accept_webp)
+    return image.url if name is None else default_storage.url(name)
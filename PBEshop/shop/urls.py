@@ -1,8 +1,27 @@
 from django.conf.urls import url
-from . import views
+from . import api, views
 
 urlpatterns = [
     url(r'^$', views.product_list, name='product_list'),
+    url(r'^search/$', views.product_search, name='product_search'),
+    url(r'^sitemap\.xml$', views.sitemap, name='sitemap'),
+    url(r'^sitemap-(?P<part>\d+)\.xml$',
+        views.sitemap_part,
+        name='sitemap_part'),
+    url(r'^metrics$', views.metrics, name='metrics'),
+    url(r'^export/products\.(?P<format>csv|jsonl)$',
+        views.export_products,
+        name='export_products'),
+    url(r'^api/products/$', api.product_list, name='api_product_list'),
+    url(r'^api/products/batch/$',
+        api.product_batch,
+        name='api_product_batch'),
+    url(r'^api/products/(?P<id>\d+)/$',
+        api.product_detail,
+        name='api_product_detail'),
+    url(r'^api/search/$',
+        views.product_search_api,
+        name='product_search_api'),
     url(r'^(?P<category_slug>[-\w]+)/$',
         views.product_list,
         name='product_list_by_category'),
@@ -1,22 +1,64 @@
-from django.shortcuts import render, get_object_or_404
-from .models import Category, Product
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.core.urlresolvers import reverse
+from django.http import (Http404, HttpResponse, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404
+from django.views.decorators.http import condition
+from cart.forms import CartAddProductForm
+from . import conditional, export, facets
+from .cache import cache_catalogue_page, category_namespace, product_namespace
+from .metrics import registry, timed_render
+from .models import Category, Product, ProductListing
+from .pagination import InvalidCursor, KeysetPaginator
+from .search import search_products
 
+def _list_namespaces(category_slug=None):
+    if category_slug:
+        return ['categories', category_namespace(category_slug)]
+    return ['categories', 'products']
+
+def _detail_namespaces(id, slug):
+    return ['categories', product_namespace(id)]
+
+@condition(etag_func=conditional.listing_etag)
+@cache_catalogue_page(_list_namespaces)
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
-    products = Product.objects.filter(available=True)
+    categories = list(Category.objects.all())
+    products = ProductListing.objects.all()
     if category_slug:
         category = get_object_or_404(Category, slug=category_slug)
+    filters = facets.parse_filters(request.GET)
+    counts = facets.facet_counts(products, filters, category)
+    for c in categories:
+        c.facet_count = counts['categories'].get(c.pk, 0)
+    products = facets.filter_products(products, filters)
+    if category:
         products = products.filter(category=category)
+    paginator = KeysetPaginator(products,
+                                settings.SHOP_PRODUCTS_PER_PAGE,
+                                ordering=('name', 'id'))
+    try:
+        page = paginator.page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    except InvalidCursor:
+        raise Http404('Invalid page')
     context = {
         'category' : category,
         'categories' : categories,
-        'products' : products,
+        'products' : page.object_list,
+        'page' : page,
+        'filters' : filters,
+        'facets' : counts,
     }
-    return render(request,
-                  'shop/product/list.html',
-                  context)
+    return timed_render(request,
+                        'shop/product/list.html',
+                        context)
 
+@condition(etag_func=conditional.detail_etag)
+@cache_catalogue_page(_detail_namespaces)
 def product_detail(request, id, slug):
     product = get_object_or_404(Product,
                                 id=id,
@@ -24,7 +66,87 @@ def product_detail(request, id, slug):
                                 available=True)
     context = {
         'product' : product,
+        'cart_product_form' : CartAddProductForm(),
+    }
+    return timed_render(request,
+                        'shop/product/detail.html',
+                        context)
+
+
+def _search(request):
+    query = request.GET.get('q', '').strip()
+    category = None
+    category_slug = request.GET.get('category')
+    if category_slug:
+        category = get_object_or_404(Category, slug=category_slug)
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), 50))
+    except ValueError:
+        limit = 20
+    results = search_products(query, category, limit) if query else []
+    return query, category, results
+
+def product_search(request):
+    query, category, results = _search(request)
+    context = {
+        'query' : query,
+        'category' : category,
+        'products' : [product for product, _ in results],
     }
-    return render(request,
-                  'shop/product/detail.html',
-                  context)
\ No newline at end of file
+    return timed_render(request,
+                        'shop/product/search.html',
+                        context)
+
+def product_search_api(request):
+    query, category, results = _search(request)
+    return JsonResponse({
+        'query' : query,
+        'results' : [{
+            'id' : product.id,
+            'name' : product.name,
+            'price' : str(product.price),
+            'url' : product.get_absolute_url(),
+            'score' : score,
+        } for product, score in results],
+    })
+
+
+@staff_member_required
+def export_products(request, format):
+    content_type, lines = export.FORMATS[format]
+    response = StreamingHttpResponse(lines(export.iter_products()),
+                                     content_type=content_type)
+    response['Content-Disposition'] = \
+        'attachment; filename="products.%s"' % format
+    return response
+
+def _sitemap_namespaces(part=None):
+    return ['products']
+
+@cache_catalogue_page(_sitemap_namespaces)
+def sitemap(request):
+    urls = [request.build_absolute_uri(reverse('shop:sitemap_part',
+                                               args=[part]))
+            for part in range(1, export.sitemap_parts() + 1)]
+    return HttpResponse(''.join(export.sitemap_index_lines(urls)),
+                        content_type='application/xml')
+
+@cache_catalogue_page(_sitemap_namespaces)
+def sitemap_part(request, part):
+    part = int(part)
+    if not 1 <= part <= export.sitemap_parts():
+        raise Http404('No such sitemap')
+    base_url = request.build_absolute_uri('/').rstrip('/')
+    return HttpResponse(
+        ''.join(export.sitemap_lines(export.sitemap_part_products(part),
+                                     base_url)),
+        content_type='application/xml')
+
+
+def metrics(request):
+    if (request.META.get('REMOTE_ADDR') not in
+            settings.SHOP_METRICS_ALLOWED_IPS and
+            not (request.user.is_active and request.user.is_staff)):
+        raise PermissionDenied
+    return HttpResponse(registry.render_prometheus(),
+                        content_type='text/plain; version=0.0.4')